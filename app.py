@@ -17,17 +17,20 @@ Features:
 - Download management
 """
 
+import io
 import os
 import sys
 import json
 import shutil
+import hashlib
 import tempfile
 import traceback
 from pathlib import Path
 from datetime import datetime
 from typing import Dict, List, Any
 from werkzeug.utils import secure_filename
-from flask import Flask, request, jsonify, render_template, send_file, session
+from werkzeug.exceptions import RequestEntityTooLarge
+from flask import Flask, Request, request, jsonify, render_template, send_file, session
 import uuid
 import threading
 import time
@@ -225,7 +228,7 @@ def create_docx_from_memory_data(session_id, chapter_data=None, is_combined=Fals
         return None
 
 try:
-    from epub_processor import EpubChapterExtractor
+    from epub_processor import EpubChapterExtractor, ExtractionCache
     EPUB_EXTRACTOR_AVAILABLE = True
     print("✓ EPUB extractor loaded")
 except ImportError as e:
@@ -255,8 +258,24 @@ except ImportError as e:
             'total_models': 2
         }
 
+# Uploads are spooled to a temporary file; only this much of each upload stays in RAM
+upload_spool_memory_bytes = int(os.environ.get('UPLOAD_SPOOL_MEMORY_MB', 8)) * 1024 * 1024
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+# Largest EPUB accepted by /upload, separate from the overall request size limit
+max_upload_bytes = int(os.environ.get('MAX_UPLOAD_MB', 100)) * 1024 * 1024
+
+
+class SpooledUploadRequest(Request):
+    """Request that parses uploaded files straight into a SpooledTemporaryFile of the configured size."""
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=upload_spool_memory_bytes)
+
+
 # Create Flask application
 app = Flask(__name__)
+app.request_class = SpooledUploadRequest
 
 # Use environment variable for secret key in production
 app.secret_key = os.environ.get('SECRET_KEY', 'epub_mindmap_converter_secret_key_2025')
@@ -265,9 +284,48 @@ app.secret_key = os.environ.get('SECRET_KEY', 'epub_mindmap_converter_secret_key
 max_file_size = int(os.environ.get('MAX_FILE_SIZE_MB', 100)) * 1024 * 1024
 app.config['MAX_CONTENT_LENGTH'] = max_file_size
 
+# Processes used to convert chapter HTML of large books (1 keeps conversion serial)
+epub_conversion_workers = int(os.environ.get('EPUB_CONVERSION_WORKERS', 1))
+
+# Lazy mode lists chapters on upload and converts chapter bodies only when selected
+lazy_chapter_extraction = os.environ.get('LAZY_CHAPTER_EXTRACTION', 'false').lower() == 'true'
+
+# Cache of extracted chapters keyed by upload hash, so re-uploaded books skip extraction
+extraction_cache = ExtractionCache(
+    max_entries=int(os.environ.get('EXTRACTION_CACHE_ENTRIES', 16)),
+    cache_dir=os.environ.get('EXTRACTION_CACHE_DIR') or None,
+    max_disk_bytes=int(os.environ.get('EXTRACTION_CACHE_MAX_MB', 500)) * 1024 * 1024
+) if EPUB_EXTRACTOR_AVAILABLE else None
+
 # Memory-only processing - no persistent directories or file storage needed
 # All file processing happens in RAM without touching the filesystem
 
+def hash_upload(stream, max_bytes: int) -> str:
+    """
+    Hash an already spooled upload in fixed-size chunks and rewind it.
+    
+    Args:
+        stream: Seekable binary stream of the uploaded file
+        max_bytes: Upload size limit, enforced while reading
+        
+    Returns:
+        SHA-256 hex digest of the upload; the stream is left positioned at 0
+    """
+    digest = hashlib.sha256()
+    total = 0
+    while True:
+        chunk = stream.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            raise RequestEntityTooLarge(f"File exceeds the {max_bytes // (1024 * 1024)} MB upload limit")
+        digest.update(chunk)
+    
+    stream.seek(0)
+    return digest.hexdigest()
+
+
 # Global storage for processing status
 processing_status = {}
 chapter_data = {}
@@ -309,8 +367,14 @@ class ProcessingManager:
         thread.daemon = True
         thread.start()
     
-    def start_epub_processing_memory(self, session_id: str, epub_data: bytes, filename: str, min_length: int = 500):
-        """Start EPUB to markdown conversion in background (memory-based)."""
+    def start_epub_processing_memory(self, session_id: str, epub_source, filename: str, min_length: int = 500,
+                                     content_hash: str = None):
+        """
+        Start EPUB to markdown conversion in background (memory-based).
+        
+        epub_source is the EPUB as bytes or as a seekable file object (a spooled
+        upload), which is closed once processing finishes.
+        """
         self.status[session_id] = {
             'stage': 'epub_processing',
             'progress': 0,
@@ -319,10 +383,30 @@ class ProcessingManager:
             'error': None,
             'filename': filename
         }
+        self._release_lazy_extractor(session_id)
+        
+        # A book extracted before with the same settings completes immediately
+        cache_key = None
+        if extraction_cache is not None:
+            if content_hash is None and isinstance(epub_source, bytes):
+                content_hash = ExtractionCache.content_hash(epub_source)
+            if content_hash is not None:
+                cache_key = ExtractionCache.make_key(content_hash, min_length)
+                cached_chapters = extraction_cache.get(cache_key)
+                if cached_chapters is not None:
+                    if not isinstance(epub_source, bytes):
+                        epub_source.close()
+                    self._store_memory_chapters(session_id, cached_chapters, filename)
+                    self.status[session_id]['from_cache'] = True
+                    return
+        
+        if lazy_chapter_extraction:
+            self._list_chapters_lazy(session_id, epub_source, filename, min_length)
+            return
         
         thread = threading.Thread(
             target=self._process_epub_worker_memory,
-            args=(session_id, epub_data, filename, min_length)
+            args=(session_id, epub_source, filename, min_length, cache_key)
         )
         thread.daemon = True
         thread.start()
@@ -338,7 +422,8 @@ class ProcessingManager:
             os.makedirs(output_dir, exist_ok=True)
             
             # Initialize EPUB extractor
-            extractor = EpubChapterExtractor(epub_path=epub_path, min_content_length=min_length)
+            extractor = EpubChapterExtractor(epub_path=epub_path, min_content_length=min_length,
+                                             workers=epub_conversion_workers)
             
             self.status[session_id]['message'] = 'Processing chapters...'
             self.status[session_id]['progress'] = 40
@@ -373,14 +458,20 @@ class ProcessingManager:
                 'type': 'error'
             })
     
-    def _process_epub_worker_memory(self, session_id: str, epub_data: bytes, filename: str, min_length: int):
+    def _process_epub_worker_memory(self, session_id: str, epub_source, filename: str, min_length: int,
+                                    cache_key: str = None):
         """Worker function for EPUB processing (memory-based)."""
         try:
             self.status[session_id]['message'] = 'Extracting EPUB structure from memory...'
             self.status[session_id]['progress'] = 20
             
-            # Initialize EPUB extractor with memory data
-            extractor = EpubChapterExtractor(epub_data=epub_data, min_content_length=min_length)
+            # Initialize EPUB extractor with the upload bytes or spooled file
+            if isinstance(epub_source, bytes):
+                extractor = EpubChapterExtractor(epub_data=epub_source, min_content_length=min_length,
+                                                 workers=epub_conversion_workers)
+            else:
+                extractor = EpubChapterExtractor(epub_file=epub_source, min_content_length=min_length,
+                                                 workers=epub_conversion_workers)
             
             self.status[session_id]['message'] = 'Processing chapters...'
             self.status[session_id]['progress'] = 40
@@ -391,45 +482,136 @@ class ProcessingManager:
             self.status[session_id]['message'] = 'Organizing chapter data...'
             self.status[session_id]['progress'] = 80
             
-            # Convert to the format expected by the rest of the system
-            chapters = {}
-            if isinstance(chapters_data, list):
-                for chapter_data in chapters_data:
-                    if isinstance(chapter_data, dict):
-                        filename = f"{chapter_data['canonical_name']}.md"
-                        chapters[filename] = {
-                            'title': chapter_data['title'],
-                            'canonical_name': chapter_data['canonical_name'],
-                            'content': chapter_data['content'],  # Store actual markdown content
-                            'available': True,
-                            'memory_based': True
-                        }
-                                # Handle unexpected data types gracefully
-            else:
-                pass
+            if not isinstance(chapters_data, list):
                 raise Exception(f"Expected list from extract_chapters_to_memory, got {type(chapters_data)}")
             
-            self.results[session_id] = {
-                'chapters': chapters,
-                'filename': filename,
-                'memory_processed': True,
-                'chapter_contents': {name: data['content'] for name, data in chapters.items()}  # Easy access to content
-            }
+            if cache_key is not None:
+                extraction_cache.put(cache_key, chapters_data)
             
+            self._store_memory_chapters(session_id, chapters_data, filename)
+            
+        except Exception as e:
             self.status[session_id].update({
-                'progress': 100,
-                'message': f'In-memory EPUB processing completed! {len(chapters)} chapters ready.',
-                'completed': True,
-                'type': 'complete',
-                'completion_type': 'epub_processed'
+                'error': str(e),
+                'message': f'Error processing EPUB: {str(e)}',
+                'completed': True
+            })
+        finally:
+            if not isinstance(epub_source, bytes):
+                epub_source.close()
+    
+    def _list_chapters_lazy(self, session_id: str, epub_source, filename: str, min_length: int):
+        """List chapters without converting them; bodies are converted by get_chapter_content."""
+        try:
+            if isinstance(epub_source, bytes):
+                extractor = EpubChapterExtractor(epub_data=epub_source, min_content_length=min_length,
+                                                 workers=epub_conversion_workers)
+            else:
+                extractor = EpubChapterExtractor(epub_file=epub_source, min_content_length=min_length,
+                                                 workers=epub_conversion_workers)
+            
+            chapters_data = extractor.list_chapters()
+            self._store_memory_chapters(session_id, chapters_data, filename)
+            
+            # The extractor keeps the upload open for the life of the session
+            self.results[session_id].update({
+                'lazy_extractor': extractor,
+                'lazy_lock': threading.Lock()
             })
             
         except Exception as e:
+            if not isinstance(epub_source, bytes):
+                epub_source.close()
             self.status[session_id].update({
                 'error': str(e),
                 'message': f'Error processing EPUB: {str(e)}',
                 'completed': True
             })
+    
+    def _release_lazy_extractor(self, session_id: str):
+        """Close the upload a lazy session keeps open (on re-upload, or once nothing is left to convert)."""
+        result_data = self.results.get(session_id) or {}
+        extractor = result_data.get('lazy_extractor')
+        if extractor is None:
+            return
+        with result_data['lazy_lock']:
+            result_data.pop('lazy_extractor', None)
+            if extractor.epub_file is not None:
+                extractor.epub_file.close()
+    
+    def get_chapter_content(self, session_id: str, chapter_file: str):
+        """
+        Get a chapter's markdown, converting it on first use in lazy mode.
+        Converted chapters are memoized in the session's chapter_contents;
+        chapters that turn out shorter than the minimum length are marked
+        unavailable, as eager extraction would have left them out.
+        """
+        result_data = self.results.get(session_id, {})
+        chapter_contents = result_data.get('chapter_contents', {})
+        if chapter_file in chapter_contents:
+            return chapter_contents[chapter_file]
+        
+        extractor = result_data.get('lazy_extractor')
+        chapter_info = result_data.get('chapters', {}).get(chapter_file)
+        if extractor is None or chapter_info is None:
+            return None
+        
+        with result_data['lazy_lock']:
+            if chapter_file not in chapter_contents and chapter_info.get('available', True):
+                converted = extractor.convert_chapters([chapter_info['toc_index']])
+                # Keep every listed chapter that came out of the same files
+                for name, info in result_data['chapters'].items():
+                    if info.get('toc_index') not in converted or name in chapter_contents:
+                        continue
+                    content = converted[info['toc_index']]
+                    if content is None:
+                        info.update({'available': False,
+                                     'unavailable_reason': 'Chapter is shorter than the minimum length'})
+                        continue
+                    chapter_contents[name] = content
+                    info.update({'content': content, 'length': len(content.strip())})
+            pending = any(info['content'] is None and info.get('available', True)
+                          for info in result_data['chapters'].values())
+        
+        if not pending:
+            self._release_lazy_extractor(session_id)
+        return chapter_contents.get(chapter_file)
+    
+    def _store_memory_chapters(self, session_id: str, chapters_data: List[Dict[str, Any]], filename: str):
+        """Store extracted chapters for a session and mark EPUB processing complete."""
+        # Convert to the format expected by the rest of the system
+        chapters = {}
+        for chapter_data in chapters_data:
+            if isinstance(chapter_data, dict):
+                chapter_filename = f"{chapter_data['canonical_name']}.md"
+                chapters[chapter_filename] = {
+                    'title': chapter_data['title'],
+                    'canonical_name': chapter_data['canonical_name'],
+                    'content': chapter_data['content'],  # Store actual markdown content (None until converted in lazy mode)
+                    'type': chapter_data.get('type'),
+                    'length': chapter_data.get('length'),
+                    'toc_index': chapter_data.get('toc_index'),
+                    'available': True,
+                    'memory_based': True
+                }
+        
+        self.results[session_id] = {
+            'chapters': chapters,
+            'filename': filename,
+            'memory_processed': True,
+            'chapter_contents': {  # Easy access to content
+                name: data['content'] for name, data in chapters.items() if data['content'] is not None
+            }
+        }
+        
+        self.status[session_id].update({
+            'progress': 100,
+            'message': f'In-memory EPUB processing completed! {len(chapters)} chapters ready.',
+            'completed': True,
+            'type': 'complete',
+            'completion_type': 'epub_processed'
+        })
+    
     def start_mindmap_processing(self, session_id: str, selected_chapters: List[str], 
                                  ai_model: str = 'gpt-5-mini', mindmap_type: str = 'comprehensive',
                                  api_key: str = None):
@@ -467,7 +649,11 @@ class ProcessingManager:
             
             # Check if we have memory-based processing
             if result_data.get('memory_processed', False):
-                # Use in-memory chapter data
+                # Use in-memory chapter data, converting selected chapters first in lazy mode
+                if result_data.get('lazy_extractor') is not None:
+                    self.status[session_id]['message'] = 'Converting selected chapters...'
+                    for chapter_file in selected_chapters:
+                        self.get_chapter_content(session_id, chapter_file)
                 chapter_contents = result_data.get('chapter_contents', {})
                 chapters_data = result_data.get('chapters', {})
             else:
@@ -518,7 +704,8 @@ class ProcessingManager:
                     print(f"Chapter {chapter_file} not found in chapter_contents")
                     self.status[session_id]['chapter_status'][chapter_name] = {
                         'status': 'error',
-                        'message': 'Chapter content not found',
+                        'message': chapters_data.get(chapter_file, {}).get('unavailable_reason',
+                                                                           'Chapter content not found'),
                         'has_download': False
                     }
                     continue
@@ -1033,25 +1220,37 @@ def upload_file():
         if not file.filename.lower().endswith('.epub'):
             return jsonify({'error': 'Only EPUB files are supported'}), 400
         
-        # Read file into memory instead of saving to disk
         filename = secure_filename(file.filename)
         session_id = session['session_id']
         
-        # Read the entire file content into memory
-        file_data = file.read()
+        # werkzeug has already spooled the part to a temporary file; hash it in place
+        content_hash = hash_upload(file.stream, max_upload_bytes)
+        
+        # Detach the spooled part so request teardown does not close it under the processing thread
+        epub_file, file.stream = file.stream, io.BytesIO()
         
         # Get processing parameters
         min_length = request.form.get('min_length', 500, type=int)
         
-        # Start processing with in-memory data
-        process_manager.start_epub_processing_memory(session_id, file_data, filename, min_length)
+        # Start processing from the spooled file
+        process_manager.start_epub_processing_memory(session_id, epub_file, filename, min_length,
+                                                     content_hash=content_hash)
         
-        return jsonify({
+        response_data = {
             'success': True,
             'session_id': session_id,
             'filename': filename
-        })
+        }
         
+        # Cache hits and lazy listing finish before returning, so the chapter list can go out right away
+        status = process_manager.get_status(session_id)
+        if status.get('completed') and not status.get('error'):
+            response_data['chapters'] = _chapters_array(process_manager.get_results(session_id).get('chapters', {}))
+        
+        return jsonify(response_data)
+        
+    except RequestEntityTooLarge as e:
+        return jsonify({'error': e.description}), 413
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -1067,6 +1266,27 @@ def get_status():
     return jsonify(status)
 
 
+def _chapters_array(chapters_dict) -> List[Dict[str, Any]]:
+    """Convert a session's chapters dictionary to the array format used by the frontend."""
+    if not isinstance(chapters_dict, dict):
+        # If it's already an array, use it directly
+        return chapters_dict
+    
+    chapters_array = []
+    for filename, chapter_info in chapters_dict.items():
+        chapters_array.append({
+            'filename': filename,
+            'title': chapter_info.get('title', filename),
+            'canonical_name': chapter_info.get('canonical_name', filename.replace('.md', '')),
+            'type': chapter_info.get('type'),
+            'length': chapter_info.get('length'),
+            'available': chapter_info.get('available', True),
+            'full_path': chapter_info.get('full_path', ''),
+            'preview': chapter_info.get('title', filename)
+        })
+    return chapters_array
+
+
 @app.route('/chapters')
 def get_chapters():
     """Get list of chapters from memory-based processing only."""
@@ -1083,20 +1303,7 @@ def get_chapters():
             print(f"DEBUG: Chapters data: {list(chapters_dict.keys()) if isinstance(chapters_dict, dict) else chapters_dict}")
             
             # Convert dictionary to array format for frontend
-            chapters_array = []
-            if isinstance(chapters_dict, dict):
-                for filename, chapter_info in chapters_dict.items():
-                    chapters_array.append({
-                        'filename': filename,
-                        'title': chapter_info.get('title', filename),
-                        'canonical_name': chapter_info.get('canonical_name', filename.replace('.md', '')),
-                        'available': True,
-                        'full_path': chapter_info.get('full_path', ''),
-                        'preview': chapter_info.get('title', filename)
-                    })
-            else:
-                # If it's already an array, use it directly
-                chapters_array = chapters_dict
+            chapters_array = _chapters_array(chapters_dict)
             
             response_data = {
                 'chapters': chapters_array,
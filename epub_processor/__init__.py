@@ -1,5 +1,6 @@
 """EPUB Processing Module for Web Interface"""
 
-from .epub_extractor import EpubChapterExtractor
+from .epub_extractor import EpubArchive, EpubChapterExtractor
+from .extraction_cache import ExtractionCache
 
-__all__ = ['EpubChapterExtractor']
+__all__ = ['EpubArchive', 'EpubChapterExtractor', 'ExtractionCache']
@@ -0,0 +1,7 @@
+"""Command line entry point: python -m epub_processor library/ --output-dir markdown_library"""
+
+import sys
+
+from .batch_converter import main
+
+sys.exit(main())
@@ -0,0 +1,309 @@
+"""
+Bulk EPUB to Markdown conversion for whole libraries
+
+Converts every EPUB under one or more directories with
+EpubChapterExtractor.convert_epub_to_markdown_files, one book per process in a
+process pool. A JSON manifest in the output directory records each book's
+status, timings and content hash, and is rewritten after every finished book,
+so an interrupted run picks up where it stopped: books already converted with
+the same content and settings are skipped. Books are keyed by their resolved
+path, so EPUBs with the same file name in different directories get their own
+entries and output directories.
+
+Usage:
+    python -m epub_processor library/ --output-dir markdown_library
+    python -m epub_processor library/ more_books/ --workers 8 --min-length 1000
+    python -m epub_processor book.epub --include-back-matter --retry-failed
+"""
+
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Tuple
+
+from .epub_extractor import HTML_CONVERTERS, EpubChapterExtractor
+
+MANIFEST_NAME = "manifest.json"
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def file_sha256(path: str) -> str:
+    """SHA-256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def book_key(path: str) -> str:
+    """Manifest key of a book: its resolved absolute path."""
+    return os.path.realpath(path)
+
+
+def find_epubs(inputs: List[str], recursive: bool = False) -> List[Tuple[str, str, str]]:
+    """
+    Collect the EPUB files named by `inputs`.
+
+    Args:
+        inputs: EPUB files and/or directories containing EPUB files
+        recursive: Also search subdirectories of input directories
+
+    Returns:
+        Sorted list of (book key, name, path) triples; the key is the resolved
+        path that identifies the book in the manifest, the name is the path
+        relative to its input directory (or the file name for file inputs) and
+        names its output subdirectory
+    """
+    books = {}
+    for input_path in inputs:
+        if os.path.isfile(input_path):
+            books[book_key(input_path)] = (os.path.basename(input_path), input_path)
+            continue
+        for root, dirs, files in os.walk(input_path):
+            if not recursive:
+                dirs[:] = []
+            for name in files:
+                if name.lower().endswith(".epub"):
+                    path = os.path.join(root, name)
+                    books[book_key(path)] = (os.path.relpath(path, input_path).replace(os.sep, "/"), path)
+    return sorted((key, name, path) for key, (name, path) in books.items())
+
+
+def convert_book(job: Tuple[str, str, str, Dict[str, Any]]) -> Tuple[str, Dict[str, Any]]:
+    """
+    Process pool entry point: convert one EPUB into its output directory.
+
+    Args:
+        job: (book key, EPUB path, output directory, extractor settings)
+
+    Returns:
+        (book key, manifest entry)
+    """
+    key, epub_path, book_dir, settings = job
+    started = time.time()
+    entry = {"path": epub_path, "output_dir": book_dir, "settings": settings}
+
+    try:
+        stat = os.stat(epub_path)
+        entry.update({"size": stat.st_size, "mtime": stat.st_mtime, "sha256": file_sha256(epub_path)})
+        hashed = time.time()
+
+        # Start from an empty directory so chapters of an interrupted attempt don't linger
+        shutil.rmtree(book_dir, ignore_errors=True)
+        extractor = EpubChapterExtractor(epub_path=epub_path, **settings)
+        with contextlib.redirect_stdout(io.StringIO()):
+            extractor.convert_epub_to_markdown_files(book_dir)
+
+        chapter_files = [name for name in os.listdir(book_dir)
+                         if name.endswith(".md") and name != "00_processing_summary.md"]
+        entry.update({
+            "status": "done",
+            "chapters": len(chapter_files),
+            "conversions_avoided": extractor.conversions_avoided,
+            "timings": {"hash_seconds": round(hashed - started, 3),
+                        "convert_seconds": round(time.time() - hashed, 3)},
+        })
+    except Exception as e:
+        entry.update({"status": "failed", "error": str(e)})
+
+    entry["seconds"] = round(time.time() - started, 3)
+    entry["finished_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    return key, entry
+
+
+class BatchManifest:
+    """JSON record of every book's conversion, rewritten atomically after each update."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.books: Dict[str, Dict[str, Any]] = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.books = json.load(f).get("books", {})
+        except FileNotFoundError:
+            pass
+        except ValueError as e:
+            print(f"Warning: ignoring unreadable manifest {path}: {e}")
+
+    def record(self, key: str, entry: Dict[str, Any]) -> None:
+        """Store a book's entry and save the manifest."""
+        self.books[key] = entry
+        self.save()
+
+    def save(self) -> None:
+        # Write to a temp file and rename so an interrupted run never leaves a truncated manifest
+        directory = os.path.dirname(self.path) or "."
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"books": self.books}, f, indent=2, sort_keys=True)
+        os.replace(temp_path, self.path)
+
+    def is_done(self, key: str, epub_path: str, settings: Dict[str, Any]) -> bool:
+        """
+        Whether a book was already converted from the same content with the
+        same settings. Size and mtime are checked first; the file is only
+        hashed again when they changed.
+        """
+        entry = self.books.get(key)
+        if not entry or entry.get("status") != "done" or entry.get("settings") != settings:
+            return False
+        if not os.path.isdir(entry.get("output_dir", "")):
+            return False
+
+        stat = os.stat(epub_path)
+        if entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime:
+            return True
+        if file_sha256(epub_path) != entry.get("sha256"):
+            return False
+        entry.update({"size": stat.st_size, "mtime": stat.st_mtime})  # Touched but unchanged
+        return True
+
+    def claimed_dirs(self) -> Dict[str, str]:
+        """Output directories of the books in the manifest, mapped to their book keys."""
+        claimed = {}
+        for key, entry in self.books.items():
+            if entry.get("output_dir"):
+                claimed.setdefault(entry["output_dir"], key)
+        return claimed
+
+    def output_dir(self, key: str, name: str, output_dir: str, claimed: Dict[str, str]) -> str:
+        """
+        Output directory of a book, unique among the books of the manifest and this run.
+
+        A book keeps the directory it was converted into before (if it is still
+        under `output_dir`). Otherwise it
+        is named after the book's file; when another book already uses that
+        name, a short hash of the book's path is appended.
+
+        Args:
+            key: Book key
+            name: Book name (path relative to its input directory)
+            output_dir: Directory receiving the book directories
+            claimed: Directories taken so far, mapped to the key of their book
+                (starts from claimed_dirs() and is updated)
+
+        Returns:
+            The book's output directory
+        """
+        book_dir = self.books.get(key, {}).get("output_dir")
+        root = os.path.abspath(output_dir)
+        inside = book_dir and os.path.commonpath([root, os.path.abspath(book_dir)]) == root
+        if not inside or claimed.get(book_dir, key) != key:
+            book_dir = os.path.join(output_dir, os.path.splitext(name)[0])
+            if claimed.get(book_dir, key) != key:
+                book_dir = f"{book_dir}-{hashlib.sha256(key.encode('utf-8')).hexdigest()[:8]}"
+        claimed[book_dir] = key
+        return book_dir
+
+
+def convert_library(inputs: List[str], output_dir: str, workers: int = 1, min_content_length: int = 500,
+                    include_back_matter: bool = False, html_converter: str = "streaming",
+                    recursive: bool = False, retry_failed: bool = False) -> Dict[str, Dict[str, Any]]:
+    """
+    Convert a library of EPUBs to Markdown, resuming from the output directory's manifest.
+
+    Args:
+        inputs: EPUB files and/or directories containing EPUB files
+        output_dir: Directory receiving one subdirectory per book and the manifest
+        workers: Books converted in parallel (1 converts in this process)
+        min_content_length: Minimum character count for a chapter to be included
+        include_back_matter: Whether to include glossary, about author, etc.
+        html_converter: HTML to Markdown converter passed to the extractor
+        recursive: Also search subdirectories of input directories
+        retry_failed: Convert books that failed in an earlier run again
+
+    Returns:
+        Manifest entries of all books, keyed by book key (resolved path)
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = BatchManifest(os.path.join(output_dir, MANIFEST_NAME))
+    settings = {
+        "min_content_length": min_content_length,
+        "include_back_matter": include_back_matter,
+        "html_converter": html_converter,
+    }
+
+    jobs = []
+    names = {}
+    claimed = manifest.claimed_dirs()
+    skipped = 0
+    for key, name, epub_path in find_epubs(inputs, recursive):
+        names[key] = name
+        previous = manifest.books.get(key, {})
+        book_dir = manifest.output_dir(key, name, output_dir, claimed)
+        if manifest.is_done(key, epub_path, settings):
+            skipped += 1
+            continue
+        if previous.get("status") == "failed" and previous.get("settings") == settings and not retry_failed:
+            skipped += 1
+            continue
+        jobs.append((key, epub_path, book_dir, settings))
+
+    print(f"📚 {len(jobs)} books to convert, {skipped} already in the manifest")
+    if not jobs:
+        manifest.save()
+        return manifest.books
+
+    def record(key: str, entry: Dict[str, Any]) -> None:
+        manifest.record(key, entry)
+        if entry["status"] == "done":
+            print(f"  ✓ {names[key]}: {entry['chapters']} chapters ({entry['seconds']:.1f}s)")
+        else:
+            print(f"  ✗ {names[key]}: {entry['error']}")
+
+    if workers <= 1 or len(jobs) == 1:
+        for job in jobs:
+            record(*convert_book(job))
+    else:
+        executor = ProcessPoolExecutor(max_workers=min(workers, len(jobs)))
+        try:
+            futures = [executor.submit(convert_book, job) for job in jobs]
+            for future in as_completed(futures):
+                record(*future.result())
+        finally:
+            # On interruption drop queued books; the manifest already holds every finished one
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    return manifest.books
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Convert a library of EPUB files to Markdown chapters")
+    parser.add_argument("inputs", nargs="+", help="EPUB files or directories containing EPUB files")
+    parser.add_argument("--output-dir", default="markdown_library",
+                        help="Directory for per-book chapter folders and the manifest")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Books converted in parallel")
+    parser.add_argument("--min-length", type=int, default=500,
+                        help="Minimum character count for a chapter to be included")
+    parser.add_argument("--include-back-matter", action="store_true",
+                        help="Include glossary, about the author and similar sections")
+    parser.add_argument("--converter", choices=HTML_CONVERTERS, default="streaming",
+                        help="HTML to Markdown converter")
+    parser.add_argument("--recursive", action="store_true", help="Search input directories recursively")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="Convert books that failed in an earlier run again")
+    args = parser.parse_args(argv)
+
+    started = time.time()
+    books = convert_library(
+        args.inputs, args.output_dir, workers=args.workers, min_content_length=args.min_length,
+        include_back_matter=args.include_back_matter, html_converter=args.converter,
+        recursive=args.recursive, retry_failed=args.retry_failed,
+    )
+
+    # The manifest may also hold books of earlier runs that weren't among this run's inputs
+    books = {key: books[key] for key, _, _ in find_epubs(args.inputs, args.recursive) if key in books}
+    failed = [key for key, entry in books.items() if entry.get("status") == "failed"]
+    print(f"\n📊 {len(books) - len(failed)} books converted, {len(failed)} failed "
+          f"in {time.time() - started:.1f}s")
+    print(f"   📄 Manifest: {os.path.join(args.output_dir, MANIFEST_NAME)}")
+    return 1 if failed else 0
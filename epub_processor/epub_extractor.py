@@ -12,17 +12,20 @@ Features:
 - Works with any EPUB book, not specific to particular formatting
 
 Usage:
-    python epub_to_markdown.py book.epub
-    python epub_to_markdown.py book.epub --output-dir chapters --min-length 1000
-    python epub_to_markdown.py --interactive
+    python -m epub_processor book.epub
+    python -m epub_processor book.epub --output-dir chapters --min-length 1000
+    python -m epub_processor library/ --workers 8   # whole directories, resumable
 """
 
 import os
 import re
 import zipfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, List, Tuple, Any
-from xml.dom import minidom
+from typing import Dict, List, Tuple, Any, Optional
+import xml.etree.ElementTree as ET
 import io
 import warnings
 import html
@@ -30,6 +33,9 @@ import html
 # Suppress warnings
 warnings.filterwarnings("ignore", category=RuntimeWarning)
 
+from .markdown_converter import html_to_markdown
+from .toc_parser import find_opf_path, parse_ncx, parse_nav, parse_opf
+
 # Try to import beautifulsoup4 for HTML parsing, fallback to basic parsing if not available
 try:
     from bs4 import BeautifulSoup
@@ -38,33 +44,151 @@ except ImportError:
     HAS_BS4 = False
     # Note: Using basic HTML parsing when beautifulsoup4 is not available
 
+# HTML to Markdown converters selectable per extractor
+HTML_CONVERTERS = ("streaming", "basic", "bs4")
+
+# Private-use characters survive HTML-to-Markdown conversion untouched, so they
+# mark where each TOC fragment starts inside a converted file
+ANCHOR_MARKER = "\ue000{}\ue001"
+ANCHOR_MARKER_PATTERN = re.compile("\ue000(\\d+)\ue001")
+
+# Tags stripped by the pre-filter's text estimate; each tag is allowed for the
+# most Markdown a converter can turn one tag into ("###### " plus a newline)
+TAG_PATTERN = re.compile(rb"<[^>]*>")
+MARKUP_ALLOWANCE = 8
+
+
+def _convert_member_in_worker(job: Tuple[bytes, List[str], str]) -> Optional[List[str]]:
+    """Process pool entry point: convert one archive member's raw bytes."""
+    data, fragments, html_converter = job
+    converter = EpubChapterExtractor(epub_data=b"", html_converter=html_converter)
+    return converter._convert_member(data, fragments)
+
+
+class EpubArchive:
+    """
+    An open EPUB archive shared by every step of a single extraction run.
+
+    Opening a ZipFile re-parses the central directory, so the extractor opens
+    the archive once and keeps a set of member names for O(1) lookups.
+    """
+    
+    def __init__(self, source):
+        """
+        Args:
+            source: Path, seekable file object or an already open ZipFile
+        """
+        if isinstance(source, zipfile.ZipFile):
+            self._zip = source
+        else:
+            self._zip = zipfile.ZipFile(source, "r")
+        self.members = set(self._zip.namelist())
+    
+    def __contains__(self, name: str) -> bool:
+        return name in self.members
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def namelist(self) -> List[str]:
+        """Member names in archive order."""
+        return self._zip.namelist()
+    
+    def open(self, name: str):
+        """Open a member for reading."""
+        return self._zip.open(name)
+    
+    def read(self, name: str) -> bytes:
+        """Read a member's raw bytes."""
+        return self._zip.read(name)
+    
+    def getinfo(self, name: str) -> zipfile.ZipInfo:
+        """Get the ZipInfo entry for a member."""
+        return self._zip.getinfo(name)
+    
+    def close(self) -> None:
+        self._zip.close()
+
 
 class EpubChapterExtractor:
     """Extract individual chapters from an EPUB file."""
     
-    def __init__(self, epub_data: bytes = None, epub_path: str = None, min_content_length: int = 500, include_back_matter: bool = False):
+    # Books below either threshold are converted serially; a process pool
+    # only pays for its start-up cost on large books
+    PARALLEL_MIN_FILES = 16
+    PARALLEL_MIN_BYTES = 2 * 1024 * 1024
+    
+    # Chapter types never extracted for mindmap processing
+    MEMORY_SKIP_TYPES = ('cover', 'title_page', 'dedication', 'part_divider', 'about_author', 'glossary', 'copyright')
+    
+    def __init__(self, epub_data: bytes = None, epub_path: str = None, min_content_length: int = 500, include_back_matter: bool = False,
+                 html_converter: str = "streaming", workers: int = 1, epub_file=None):
         """
-        Initialize with EPUB file data or path.
+        Initialize with EPUB file data, path or file object.
         
         Args:
             epub_data: EPUB file content as bytes (for in-memory processing)
             epub_path: Path to the EPUB file (for file-based processing) 
             min_content_length: Minimum character count for a chapter to be included
             include_back_matter: Whether to include glossary, about author, etc.
+            html_converter: "streaming" (single pass), "basic" (regex) or "bs4"
+            workers: Processes used to convert chapter HTML (1 converts serially)
+            epub_file: Seekable binary file object holding the EPUB (e.g. a spooled upload)
         """
+        self.epub_data = None
+        self.epub_path = None
+        self.epub_file = None
         if epub_data is not None:
             self.epub_data = epub_data
-            self.epub_path = None
             self.is_memory_based = True
         elif epub_path is not None:
             self.epub_path = epub_path
-            self.epub_data = None
+            self.is_memory_based = False
+        elif epub_file is not None:
+            self.epub_file = epub_file
             self.is_memory_based = False
         else:
-            raise ValueError("Either epub_data or epub_path must be provided")
+            raise ValueError("Either epub_data, epub_path or epub_file must be provided")
+        
+        if html_converter not in HTML_CONVERTERS:
+            raise ValueError(f"Unknown html_converter '{html_converter}', expected one of {HTML_CONVERTERS}")
             
+        self.html_converter = html_converter
+        self.workers = max(1, workers or 1)
+        self._lazy_toc = None
+        self.prefilter_stats = {'converted_files': 0, 'skipped_by_type': 0, 'skipped_by_size': 0,
+                                'skipped_by_estimate': 0}
         self.min_content_length = min_content_length
         self.include_back_matter = include_back_matter
+        self._archive = None
+    
+    @contextmanager
+    def open_archive(self):
+        """
+        Open the EPUB once and reuse it for every extraction call made inside
+        the block. Nested calls share the archive that is already open.
+        """
+        if self._archive is not None:
+            yield self._archive
+            return
+        
+        if self.epub_file is not None:
+            self.epub_file.seek(0)
+            source = self.epub_file
+        elif self.is_memory_based:
+            source = io.BytesIO(self.epub_data)
+        else:
+            source = self.epub_path
+        archive = EpubArchive(source)
+        self._archive = archive
+        try:
+            yield archive
+        finally:
+            self._archive = None
+            archive.close()
         
     def extract_toc_structure(self) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
         """
@@ -75,44 +199,14 @@ class EpubChapterExtractor:
         metadata = {}
         
         try:
-            # Create ZipFile object from either memory or file
-            if self.is_memory_based:
-                import io
-                zip_data = io.BytesIO(self.epub_data)
-                z = zipfile.ZipFile(zip_data, "r")
-            else:
-                z = zipfile.ZipFile(self.epub_path, "r")
-            
-            with z:
+            with self.open_archive() as z:
                 # Locate content.opf
-                container_dom = minidom.parse(z.open("META-INF/container.xml"))
-                opf_path = container_dom.getElementsByTagName("rootfile")[0].getAttribute(
-                    "full-path"
-                )
-                
-                # Parse content.opf
-                opf_dom = minidom.parse(z.open(opf_path))
+                with z.open("META-INF/container.xml") as f:
+                    opf_path = find_opf_path(f)
                 
-                # Extract metadata
-                metadata = {
-                    "title": self._get_text_from_node(opf_dom, "dc:title"),
-                    "authors": self._get_all_texts_from_nodes(opf_dom, "dc:creator"),
-                    "language": self._get_text_from_node(opf_dom, "dc:language"),
-                    "publisher": self._get_text_from_node(opf_dom, "dc:publisher"),
-                    "date": self._get_text_from_node(opf_dom, "dc:date"),
-                    "description": self._get_text_from_node(opf_dom, "dc:description"),
-                    "identifier": self._get_text_from_node(opf_dom, "dc:identifier"),
-                }
-                
-                # Extract manifest items (ID → href mapping)
-                manifest = {
-                    item.getAttribute("id"): item.getAttribute("href")
-                    for item in opf_dom.getElementsByTagName("item")
-                }
-                
-                # Extract spine order (ID refs)
-                spine_items = opf_dom.getElementsByTagName("itemref")
-                spine_order = [item.getAttribute("idref") for item in spine_items]
+                # Parse content.opf: metadata, manifest (ID → href), spine order (ID refs)
+                with z.open(opf_path) as f:
+                    metadata, manifest, spine_order, nav_href = parse_opf(f)
                 
                 # Convert spine order to actual file paths
                 base_path = "/".join(
@@ -124,40 +218,51 @@ class EpubChapterExtractor:
                     if item_id in manifest
                 ]
                 
-                # Look for NCX file (table of contents)
+                # Look for NCX file (table of contents), then the EPUB 3 navigation document
+                nav_entries = []
                 ncx_files = [f for f in manifest.values() if f.endswith(".ncx")]
                 if ncx_files:
-                    ncx_path = f"{base_path}/{ncx_files[0]}" if base_path else ncx_files[0]
-                    if ncx_path in z.namelist():
-                        ncx_dom = minidom.parse(z.open(ncx_path))
-                        nav_points = ncx_dom.getElementsByTagName("navPoint")
-                        
-                        # Process navigation points to extract chapter structure
-                        for nav_point in nav_points:
-                            label = self._get_text_from_node(nav_point, "text")
-                            content_nodes = nav_point.getElementsByTagName("content")
-                            if content_nodes:
-                                content = content_nodes[0].getAttribute("src")
-                                
-                                # Determine chapter type
-                                chapter_type = self._determine_chapter_type(label)
-                                
-                                # Create full path to content
-                                if "/" in ncx_path:
-                                    content_dir = os.path.dirname(ncx_path)
-                                    content_path = f"{content_dir}/{content}"
-                                else:
-                                    content_path = content
-                                
-                                # Clean up path (remove relative path components)
-                                content_path = self._clean_path(content_path)
-                                
-                                chapters.append({
-                                    "title": label,
-                                    "path": content_path,
-                                    "type": chapter_type,
-                                    "id": nav_point.getAttribute("id")
-                                })
+                    toc_path = f"{base_path}/{ncx_files[0]}" if base_path else ncx_files[0]
+                    if toc_path in z:
+                        with z.open(toc_path) as f:
+                            nav_entries = parse_ncx(f)
+                if not nav_entries and nav_href:
+                    toc_path = f"{base_path}/{nav_href}" if base_path else nav_href
+                    if toc_path in z:
+                        try:
+                            with z.open(toc_path) as f:
+                                nav_entries = parse_nav(f)
+                        except ET.ParseError:
+                            pass  # Not well-formed XHTML, fall back to the spine
+                
+                # Process navigation entries to extract chapter structure
+                for entry in nav_entries:
+                    label = entry["label"]
+                    
+                    # Determine chapter type
+                    chapter_type = self._determine_chapter_type(label)
+                    
+                    # Create full path to content (hrefs are relative to the TOC file)
+                    if "/" in toc_path:
+                        content_dir = os.path.dirname(toc_path)
+                        content_path = f"{content_dir}/{entry['src']}"
+                    else:
+                        content_path = entry["src"]
+                    
+                    # Clean up path (remove relative path components)
+                    content_path = self._clean_path(content_path)
+                    
+                    # Keep the #anchor separate so entries sharing a file resolve to one member
+                    content_path, _, fragment = content_path.partition("#")
+                    
+                    chapters.append({
+                        "title": label,
+                        "path": content_path,
+                        "fragment": fragment,
+                        "type": chapter_type,
+                        "id": entry["id"],
+                        "depth": entry["depth"]
+                    })
                 
                 # If no NCX file or no chapters extracted, fallback to spine order
                 if not chapters:
@@ -168,8 +273,10 @@ class EpubChapterExtractor:
                         chapters.append({
                             "title": title,
                             "path": path,
+                            "fragment": "",
                             "type": chapter_type,
-                            "id": f"auto_chapter_{i}"
+                            "id": f"auto_chapter_{i}",
+                            "depth": 0
                         })
         except Exception as e:
             # Error extracting TOC structure, using fallback
@@ -292,26 +399,17 @@ class EpubChapterExtractor:
                 result.append(part)
         return '/'.join(result)
     
-    def _get_text_from_node(self, dom, tag_name):
-        """Extract text from the first matching node."""
-        elements = dom.getElementsByTagName(tag_name)
-        if elements and elements[0].firstChild:
-            return elements[0].firstChild.nodeValue.strip()
-        return ""
-    
-    def _get_all_texts_from_nodes(self, dom, tag_name):
-        """Extract text from all matching nodes as a list."""
-        return [
-            element.firstChild.nodeValue.strip()
-            for element in dom.getElementsByTagName(tag_name)
-            if element.firstChild
-        ]
-    
-    def convert_chapter(self, chapter_path: str, z: zipfile.ZipFile) -> str:
+    def convert_chapter(self, chapter_path: str, z) -> str:
         """
         Convert a single chapter to markdown using HTML parsing.
+        
+        Args:
+            chapter_path: Archive member path of the chapter
+            z: Open EpubArchive (a plain ZipFile is also accepted)
         """
-        if chapter_path in z.namelist():
+        if not isinstance(z, EpubArchive):
+            z = EpubArchive(z)
+        if chapter_path in z:
             try:
                 with z.open(chapter_path) as f:
                     content = f.read().decode('utf-8', errors='ignore')
@@ -327,30 +425,200 @@ class EpubChapterExtractor:
     def extract_content_from_href(self, href: str) -> str:
         """
         Extract content from a specific href/path in the EPUB.
+        An href with a #fragment returns the file from that anchor onwards.
         """
         try:
-            if self.is_memory_based:
-                import io
-                zip_data = io.BytesIO(self.epub_data)
-                z = zipfile.ZipFile(zip_data, "r")
-            else:
-                z = zipfile.ZipFile(self.epub_path, "r")
-            
-            with z:
-                return self.convert_chapter(href, z)
+            return self.convert_toc_entries([{"path": href}])[0]
                 
         except Exception as e:
             pass  # Handle errors silently
             return ""
+    
+    def convert_toc_entries(self, toc_structure: List[Dict[str, Any]], skip_types=None) -> List[Optional[str]]:
+        """
+        Convert every TOC entry to markdown, decoding and converting each
+        underlying file only once.
+        
+        Entries that point into the same file with #anchor fragments get the
+        slice of the converted file that starts at their anchor and ends at the
+        next entry's anchor, so no text is duplicated across entries.
+        
+        With `skip_types`, files that cannot yield an includable chapter are
+        not converted: files whose entries all have a skipped type, and files
+        whose uncompressed size or tag-stripped text estimate is below
+        min_content_length. Both measures overestimate the Markdown length,
+        so chapters that would pass the length filter are kept. The
+        skipped files are counted in self.prefilter_stats.
+        
+        Args:
+            toc_structure: Chapter entries as returned by extract_toc_structure
+            skip_types: Chapter types the caller drops anyway (None converts everything)
+            
+        Returns:
+            Markdown content for each entry, in TOC order ("" when unavailable,
+            None when skipped by the pre-filter)
+        """
+        contents = [""] * len(toc_structure)
+        
+        # Group entries by archive member, preserving first-seen order
+        files = {}
+        for index, item in enumerate(toc_structure):
+            path = item.get('href', item.get('path', ''))
+            path, _, fragment = path.partition("#")
+            files.setdefault(path, []).append((index, item.get('fragment') or fragment))
+        
+        with self.open_archive() as z:
+            members = []
+            for path, entries in files.items():
+                if path not in z:
+                    continue
+                data = None
+                if skip_types is not None:
+                    skip_reason = self._prefilter_reason(z, path, [toc_structure[i] for i, _ in entries], skip_types)
+                    if skip_reason is None:
+                        data = z.read(path)
+                        if self._estimate_text_length(data) < self.min_content_length:
+                            skip_reason = 'skipped_by_estimate'
+                    if skip_reason:
+                        self.prefilter_stats[skip_reason] += 1
+                        for index, _ in entries:
+                            contents[index] = None
+                        continue
+                    self.prefilter_stats['converted_files'] += 1
+                members.append((entries, data if data is not None else z.read(path)))
+        
+        results = self._convert_members([
+            (data, [fragment for _, fragment in entries]) for entries, data in members
+        ])
+        
+        for (entries, _), sections in zip(members, results):
+            if sections is None:
+                continue  # Leave entries of unreadable files empty
+            for (index, _), section in zip(entries, sections):
+                contents[index] = section
+        
+        return contents
+    
+    @property
+    def conversions_avoided(self) -> int:
+        """Files the pre-filter kept from being converted so far."""
+        stats = self.prefilter_stats
+        return stats['skipped_by_type'] + stats['skipped_by_size'] + stats['skipped_by_estimate']
+    
+    def _prefilter_reason(self, z, path: str, entries: List[Dict[str, Any]], skip_types) -> Optional[str]:
+        """
+        Return the prefilter_stats counter explaining why a file need not be
+        converted, judging only by entry types and the member's size, or None.
+        """
+        if all(item['type'] in skip_types for item in entries):
+            return 'skipped_by_type'
+        if z.getinfo(path).file_size < self.min_content_length:
+            return 'skipped_by_size'
+        return None
+    
+    def _estimate_text_length(self, data: bytes) -> int:
+        """Cheap upper estimate of a member's Markdown length: raw text between tags plus an allowance per tag."""
+        text, tag_count = TAG_PATTERN.subn(b"", data)
+        return len(text) + tag_count * MARKUP_ALLOWANCE
+    
+    def _convert_members(self, members: List[Tuple[bytes, List[str]]]) -> List[Optional[List[str]]]:
+        """
+        Convert raw archive members, in a process pool when the book is large
+        enough and workers > 1. Results keep the order of `members`.
+        """
+        total_bytes = sum(len(data) for data, _ in members)
+        if (self.workers > 1 and len(members) >= self.PARALLEL_MIN_FILES
+                and total_bytes >= self.PARALLEL_MIN_BYTES):
+            jobs = [(data, fragments, self.html_converter) for data, fragments in members]
+            try:
+                # spawn: forking the threaded web worker is not safe
+                context = multiprocessing.get_context("spawn")
+                with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as executor:
+                    chunksize = max(1, len(jobs) // (self.workers * 4))
+                    return list(executor.map(_convert_member_in_worker, jobs, chunksize=chunksize))
+            except Exception as e:
+                print(f"Warning: parallel conversion failed ({e}), converting serially")
+        
+        return [self._convert_member(data, fragments) for data, fragments in members]
+    
+    def _convert_member(self, data: bytes, fragments: List[str]) -> Optional[List[str]]:
+        """Decode and convert one member; None when it cannot be converted."""
+        try:
+            html_content = data.decode('utf-8', errors='ignore')
+            return self._convert_file_sections(html_content, fragments)
+        except Exception as e:
+            return None
+    
+    def _convert_file_sections(self, html_content: str, fragments: List[str]) -> List[str]:
+        """
+        Convert one XHTML file and slice it at the given anchor ids.
+        
+        Args:
+            html_content: Decoded file content
+            fragments: Anchor id for each entry ("" means the start of the file)
+            
+        Returns:
+            Markdown slice for each fragment, in the order given
+        """
+        positions = self._anchor_positions(html_content, fragments)
+        
+        if len(positions) == 1 and positions[0][0] == 0:
+            return [self._html_to_markdown(html_content).strip()]
+        
+        # Insert a marker at each anchor, convert once, then split on the markers
+        pieces = []
+        last = 0
+        for position, i in positions:
+            pieces.append(html_content[last:position])
+            pieces.append(ANCHOR_MARKER.format(i))
+            last = position
+        pieces.append(html_content[last:])
+        
+        parts = ANCHOR_MARKER_PATTERN.split(self._html_to_markdown(''.join(pieces)))
+        
+        # parts[0] is the text in front of the first anchor (usually just the <head> title)
+        sections = [""] * len(fragments)
+        for k in range(1, len(parts), 2):
+            sections[int(parts[k])] = parts[k + 1].strip()
+        
+        return sections
 
+    @staticmethod
+    def _anchor_positions(html_content: str, fragments: List[str]) -> List[Tuple[int, int]]:
+        """
+        Find where each entry's slice of a file starts.
+        
+        Args:
+            html_content: Decoded file content
+            fragments: Anchor id for each entry ("" means the start of the file)
+            
+        Returns:
+            (position, entry index) pairs in document order; an entry's slice
+            ends where the next pair's starts
+        """
+        positions = []
+        for i, fragment in enumerate(fragments):
+            position = 0
+            if fragment:
+                match = re.search(r'\sid\s*=\s*["\']%s["\']' % re.escape(fragment), html_content)
+                if match:
+                    # Cut in front of the tag carrying the id
+                    position = max(html_content.rfind('<', 0, match.start()), 0)
+            positions.append((position, i))
+        return sorted(positions)
+    
     def _html_to_markdown(self, html_content: str) -> str:
         """
-        Convert HTML content to Markdown.
-        Uses basic regex parsing which works reliably for EPUB content.
+        Convert HTML content to Markdown with the configured converter.
+        The single-pass streaming converter is the default; the regex
+        converter is kept for comparison.
         """
-        # For now, just use the basic parsing since it works well
-        # BeautifulSoup4 implementation had issues with content extraction
-        return self._html_to_markdown_basic(html_content)
+        if self.html_converter == "basic":
+            return self._html_to_markdown_basic(html_content)
+        # BeautifulSoup4 implementation had issues with content extraction, so it is opt-in only
+        if self.html_converter == "bs4" and HAS_BS4:
+            return self._html_to_markdown_bs4(html_content)
+        return html_to_markdown(html_content)
     
     def _html_to_markdown_bs4(self, html_content: str) -> str:
         """Convert HTML to Markdown using BeautifulSoup."""
@@ -474,48 +742,50 @@ class EpubChapterExtractor:
     
     def convert_epub_to_markdown_files(self, output_dir: str) -> None:
         """Convert EPUB to individual markdown files for each chapter."""
-        # Extract TOC structure
-        toc_structure = self.extract_toc_structure()
+        os.makedirs(output_dir, exist_ok=True)
         
-        chapters = []
-        metadata = {"title": "Unknown", "authors": []}
         processed_chapters = 0
         skipped_chapters = 0
         included_types = set()
         skipped_types = set()
         
-        # Process each item
-        for item in toc_structure:
-            title = item['title']
-            chapter_type = item['type']
-            href = item['href']
+        with self.open_archive():
+            # Extract TOC structure
+            toc_structure, metadata = self.extract_toc_structure()
+            skip_types = ['cover', 'title_page', 'dedication', 'part_divider']
+            if not self.include_back_matter:
+                skip_types += ['about_author', 'glossary', 'copyright']
+            contents = self.convert_toc_entries(toc_structure, skip_types=skip_types)
             
-            # Extract content and check length
-            try:
-                content = self.extract_content_from_href(href)
-                content_length = len(content.strip()) if content else 0
+            # Process each item
+            for i, item in enumerate(toc_structure):
+                title = item['title']
+                chapter_type = item['type']
+            
+                # Extract content and check length
+                try:
+                    content = contents[i]
+                    content_length = len(content.strip()) if content else 0
                 
-                # Apply content length filter and type filtering
-                if (content_length >= self.min_content_length and 
-                    chapter_type not in ['cover', 'title_page', 'dedication', 'part_divider'] and
-                    (self.include_back_matter or chapter_type not in ['about_author', 'glossary', 'copyright'])):
+                    # Apply content length filter and type filtering
+                    if content_length >= self.min_content_length and chapter_type not in skip_types:
                     
-                    # Create safe filename using processed chapter count for consistent numbering
-                    safe_filename = self._create_safe_filename(title, processed_chapters, chapter_type)
-                    output_file = os.path.join(output_dir, safe_filename)
+                        # Create safe filename using processed chapter count for consistent numbering
+                        safe_filename = self._create_safe_filename(title, processed_chapters, chapter_type)
+                        output_file = os.path.join(output_dir, safe_filename)
                     
-                    # Write chapter content to file
-                    with open(output_file, "w", encoding="utf-8") as f:
-                        f.write(f"# {title}\n\n{content}")
+                        # Write chapter content to file
+                        with open(output_file, "w", encoding="utf-8") as f:
+                            f.write(f"# {title}\n\n{content}")
                     
-                    processed_chapters += 1
-                    included_types.add(chapter_type)
-                else:
+                        processed_chapters += 1
+                        included_types.add(chapter_type)
+                    else:
+                        skipped_chapters += 1
+                        skipped_types.add(chapter_type)
+                except Exception as e:
                     skipped_chapters += 1
                     skipped_types.add(chapter_type)
-            except Exception as e:
-                skipped_chapters += 1
-                skipped_types.add(chapter_type)
         
         # Create a comprehensive summary file
         summary_content = self._create_processing_summary(
@@ -530,6 +800,7 @@ class EpubChapterExtractor:
         print(f"\n📊 Processing Complete:")
         print(f"   ✓ {processed_chapters} chapters processed")
         print(f"   ✗ {skipped_chapters} items skipped")
+        print(f"   ⏭️ {self.conversions_avoided} file conversions avoided by pre-filter")
         print(f"   📄 Summary saved to: {summary_file}")
         
         if processed_chapters > 0:
@@ -554,149 +825,185 @@ class EpubChapterExtractor:
             ]
         """
         try:
-            # Extract TOC structure
-            toc_result = self.extract_toc_structure()
-            # extract_toc_structure returns (chapters_list, metadata)
-            if isinstance(toc_result, tuple) and len(toc_result) == 2:
-                toc_structure, metadata = toc_result
-            else:
-                # Fallback for unexpected format
-                toc_structure = toc_result
-                metadata = {}
+            with self.open_archive():
+                # Extract TOC structure
+                toc_result = self.extract_toc_structure()
+                # extract_toc_structure returns (chapters_list, metadata)
+                if isinstance(toc_result, tuple) and len(toc_result) == 2:
+                    toc_structure, metadata = toc_result
+                else:
+                    # Fallback for unexpected format
+                    toc_structure = toc_result
+                    metadata = {}
             
-            chapters_data = []
+                chapters_data = []
+                
+                # Convert each underlying file once and slice it per TOC entry,
+                # skipping files that cannot yield an includable chapter
+                contents = self.convert_toc_entries(toc_structure, skip_types=self.MEMORY_SKIP_TYPES)
             
-            # Process each item
-            for i, item in enumerate(toc_structure):
+                # Process each item
+                for i, item in enumerate(toc_structure):
                 
-                title = item['title']
-                content_type = item['type']
-                href = item.get('href', item.get('path', ''))  # Use 'path' if 'href' doesn't exist
+                    title = item['title']
+                    content_type = item['type']
                 
-                # Extract content and check length
-                try:
-                    content = self.extract_content_from_href(href)
-                    content_length = len(content.strip()) if content else 0
+                    # Extract content and check length
+                    try:
+                        content = contents[i]
+                        if content is None:
+                            print(f"  ✗ {content_type}: {title} (skipped before conversion)")
+                            continue
+                        content_length = len(content.strip())
                     
-                    # Apply content length filter
-                    if content_length < self.min_content_length:
-                        if content_type not in ['cover', 'title_page', 'dedication', 'part_divider', 'about_author', 'glossary', 'copyright']:
-                            print(f"  ✗ {content_type}: {title} ({content_length} chars)")
-                        continue
+                        # Apply content length filter
+                        if content_length < self.min_content_length:
+                            if content_type not in self.MEMORY_SKIP_TYPES:
+                                print(f"  ✗ {content_type}: {title} ({content_length} chars)")
+                            continue
                     
-                    # Skip certain content types
-                    if content_type in ['cover', 'title_page', 'dedication', 'part_divider', 'about_author', 'glossary', 'copyright']:
-                        print(f"  ✗ {content_type}: {title} ({content_length} chars)")
-                        continue
+                        # Skip certain content types
+                        if content_type in self.MEMORY_SKIP_TYPES:
+                            print(f"  ✗ {content_type}: {title} ({content_length} chars)")
+                            continue
                     
-                    # Include this chapter
-                    print(f"  ✓ {content_type}: {title} ({content_length:,} chars)")
+                        # Include this chapter
+                        print(f"  ✓ {content_type}: {title} ({content_length:,} chars)")
                     
-                    # Generate canonical name
-                    canonical_name = self._generate_canonical_name(title, content_type, len(chapters_data))
+                        # Generate canonical name (numbered by TOC position, like list_chapters)
+                        canonical_name = self._generate_canonical_name(title, content_type, i)
                     
-                    chapters_data.append({
-                        'canonical_name': canonical_name,
-                        'title': title,
-                        'content': content,
-                        'type': content_type,
-                        'length': content_length
-                    })
+                        chapters_data.append({
+                            'canonical_name': canonical_name,
+                            'title': title,
+                            'content': content,
+                            'type': content_type,
+                            'length': content_length,
+                            'toc_index': i
+                        })
                     
-                except Exception as e:
-                    print(f"  ✗ Error processing {title}: {e}")
-                    continue
+                    except Exception as e:
+                        print(f"  ✗ Error processing {title}: {e}")
+                        continue
             
-            print(f"\n📊 Processing Complete:")
-            print(f"   ✓ {len(chapters_data)} chapters processed")
-            print(f"   ✗ {len(toc_structure) - len(chapters_data)} items skipped")
+                print(f"\n📊 Processing Complete:")
+                print(f"   ✓ {len(chapters_data)} chapters processed")
+                print(f"   ✗ {len(toc_structure) - len(chapters_data)} items skipped")
+                print(f"   ⏭️ {self.conversions_avoided} file conversions avoided by pre-filter")
             
-            if chapters_data:
-                included_types = set(chapter['type'] for chapter in chapters_data)
-                excluded_types = set(item['type'] for item in toc_structure if item['type'] not in included_types)
-                print(f"   📚 Included types: {', '.join(sorted(included_types))}")
-                if excluded_types:
-                    print(f"   🚫 Skipped types: {', '.join(sorted(excluded_types))}")
+                if chapters_data:
+                    included_types = set(chapter['type'] for chapter in chapters_data)
+                    excluded_types = set(item['type'] for item in toc_structure if item['type'] not in included_types)
+                    print(f"   📚 Included types: {', '.join(sorted(included_types))}")
+                    if excluded_types:
+                        print(f"   🚫 Skipped types: {', '.join(sorted(excluded_types))}")
             
-            return chapters_data
+                return chapters_data
             
         except Exception as e:
             print(f"ERROR in extract_chapters_to_memory: {e}")
             import traceback
             traceback.print_exc()
             raise
-            included_types = set(chapter['type'] for chapter in chapters_data)
-            excluded_types = set(item['type'] for item in toc_structure if item['type'] not in included_types)
-            print(f"   📚 Included types: {', '.join(sorted(included_types))}")
-            if excluded_types:
-                print(f"   🚫 Skipped types: {', '.join(sorted(excluded_types))}")
-        
-        return chapters_data
-        """
-        Convert the EPUB file to separate markdown files, filtering out empty/non-content chapters.
+    
+    def list_chapters(self) -> List[Dict[str, Any]]:
         """
-        # Create output directory if it doesn't exist
-        os.makedirs(output_dir, exist_ok=True)
+        List extractable chapters without converting any HTML.
         
-        # Extract chapters and metadata
-        chapters, metadata = self.extract_toc_structure()
+        Lengths are upper bounds of the text length that need no conversion:
+        the uncompressed size of the chapter's archive member, or, for
+        entries that point into a shared file with #anchors, the text
+        estimate of the span from the entry's anchor to the next one (the
+        slice conversion would give it). Entries whose bound is below
+        min_content_length, or whose type is skipped, are left out, so
+        every chapter eager extraction keeps is listed, under the same
+        canonical name. Convert the bodies later with convert_chapters().
         
-        # Counters for reporting
-        processed_chapters = 0
-        skipped_chapters = 0
-        included_types = set()
-        skipped_types = set()
-        
-        # Process items
-        
-        # Process each chapter with filtering
-        # Create ZipFile object from either memory or file
-        if self.is_memory_based:
-            import io
-            zip_data = io.BytesIO(self.epub_data)
-            z = zipfile.ZipFile(zip_data, "r")
-        else:
-            z = zipfile.ZipFile(self.epub_path, "r")
+        Returns:
+            Chapter dictionaries as returned by extract_chapters_to_memory,
+            with 'content' set to None, 'length' holding the upper bound and
+            'toc_index' identifying the TOC entry
+        """
+        with self.open_archive() as z:
+            toc_structure, metadata = self.extract_toc_structure()
+            
+            entries_per_file = {}
+            for i, item in enumerate(toc_structure):
+                entries_per_file.setdefault(item['path'], []).append(i)
             
-        with z:
-            for i, chapter in enumerate(chapters):
-                title = chapter["title"]
-                path = chapter["path"]
-                chapter_type = chapter["type"]
+            estimated_lengths = {}
+            for path, indices in entries_per_file.items():
+                if path not in z:
+                    estimated_lengths.update((i, 0) for i in indices)
+                elif len(indices) == 1:
+                    estimated_lengths[indices[0]] = z.getinfo(path).file_size
+                else:
+                    estimated_lengths.update(self._estimate_section_lengths(
+                        z.read(path), [(i, toc_structure[i].get('fragment', '')) for i in indices]))
+            
+            chapters = []
+            for i, item in enumerate(toc_structure):
+                estimated_length = estimated_lengths[i]
                 
-                # Convert chapter content first to determine if it should be included
-                markdown_content = self.convert_chapter(path, z)
-                content_length = len(markdown_content.strip())
+                if item['type'] in self.MEMORY_SKIP_TYPES or estimated_length < self.min_content_length:
+                    continue
                 
-                # Check if this chapter should be included
-                if self._should_include_chapter(chapter_type, title, markdown_content):
-                    # Create safe filename using processed chapter count for consistent numbering
-                    safe_filename = self._create_safe_filename(title, processed_chapters, chapter_type)
-                    output_file = os.path.join(output_dir, safe_filename)
-                    
-                    # Write chapter content to file
-                    with open(output_file, "w", encoding="utf-8") as f:
-                        f.write(f"# {title}\n\n{markdown_content}")
-                    
-                    print(f"  ✓ {chapter_type}: {title} ({content_length:,} chars)")
-                    processed_chapters += 1
-                    included_types.add(chapter_type)
-                else:
-                    print(f"  ✗ {chapter_type}: {title} ({content_length} chars)")
-                    skipped_chapters += 1
-                    skipped_types.add(chapter_type)
+                chapters.append({
+                    'canonical_name': self._generate_canonical_name(item['title'], item['type'], i),
+                    'title': item['title'],
+                    'content': None,
+                    'type': item['type'],
+                    'length': estimated_length,
+                    'toc_index': i
+                })
         
-        # Create a comprehensive summary file
-        summary_content = self._create_processing_summary(
-            metadata, processed_chapters, skipped_chapters, 
-            len(chapters), included_types, skipped_types
-        )
+        self._lazy_toc = toc_structure
+        return chapters
+    
+    def _estimate_section_lengths(self, data: bytes, entries: List[Tuple[int, str]]) -> Dict[int, int]:
+        """
+        Upper estimate of the text length of each entry sharing one file.
         
-        summary_file = os.path.join(output_dir, "00_processing_summary.md")
-        with open(summary_file, "w", encoding="utf-8") as f:
-            f.write(summary_content)
+        Args:
+            data: Raw archive member
+            entries: (TOC index, anchor fragment) of every entry in the file
+            
+        Returns:
+            Mapping of TOC index to the text estimate of the entry's span
+        """
+        html_content = data.decode('utf-8', errors='ignore')
+        positions = self._anchor_positions(html_content, [fragment for _, fragment in entries])
+        ends = [position for position, _ in positions[1:]] + [len(html_content)]
+        return {
+            entries[k][0]: self._estimate_text_length(html_content[start:end].encode('utf-8'))
+            for (start, k), end in zip(positions, ends)
+        }
+    
+    def convert_chapters(self, toc_indices: List[int]) -> Dict[int, str]:
+        """
+        Convert the bodies of chapters listed by list_chapters().
+        
+        Every TOC entry sharing a file with a requested chapter is converted
+        along with it, since its anchor bounds the requested slice; callers
+        can keep those extra results to avoid converting the file again.
+        
+        Args:
+            toc_indices: 'toc_index' values of the chapters to convert
+            
+        Returns:
+            Mapping of TOC index to markdown content, None for chapters that
+            turn out shorter than min_content_length (which eager extraction
+            leaves out)
+        """
+        if self._lazy_toc is None:
+            self._lazy_toc = self.extract_toc_structure()[0]
+        toc_structure = self._lazy_toc
         
-        # Processing complete (verbose output removed for cleaner terminal)
+        paths = {toc_structure[i]['path'] for i in toc_indices}
+        related = [i for i, item in enumerate(toc_structure) if item['path'] in paths]
+        contents = self.convert_toc_entries([toc_structure[i] for i in related])
+        return {i: content if content is not None and len(content.strip()) >= self.min_content_length else None
+                for i, content in zip(related, contents)}
     
     def _create_processing_summary(self, metadata: dict, processed: int, skipped: int, 
                                  total: int, included_types: set, skipped_types: set) -> str:
@@ -0,0 +1,142 @@
+"""
+Content-addressed cache of extracted EPUB chapters
+
+Chapters are keyed by the SHA-256 of the uploaded EPUB bytes plus the
+extraction settings, so re-uploads of the same book skip TOC parsing and
+HTML conversion entirely. A bounded in-memory LRU tier serves hits within
+one process; an optional on-disk tier is shared by every worker process
+and evicts least recently used entries once it grows past its size limit.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+
+class ExtractionCache:
+    """Two-tier (memory LRU + optional disk) cache of extracted chapter lists."""
+
+    def __init__(self, max_entries: int = 16, cache_dir: str = None, max_disk_bytes: int = 500 * 1024 * 1024):
+        """
+        Args:
+            max_entries: Books kept in the in-memory tier (0 disables it)
+            cache_dir: Directory for the on-disk tier (None disables it)
+            max_disk_bytes: Size limit of the on-disk tier
+        """
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._memory: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def content_hash(epub_data: bytes) -> str:
+        """SHA-256 hex digest of an upload held in memory."""
+        return hashlib.sha256(epub_data).hexdigest()
+
+    @staticmethod
+    def make_key(content_hash: str, min_content_length: int) -> str:
+        """Build the cache key from an upload's SHA-256 and its extraction settings."""
+        return f"{content_hash}-{min_content_length}"
+
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        """Return cached chapters for `key`, or None on a miss."""
+        with self._lock:
+            chapters = self._memory.get(key)
+            if chapters is not None:
+                self._memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return chapters
+
+        chapters = self._read_disk(key)
+        with self._lock:
+            if chapters is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['disk_hits'] += 1
+            self._remember(key, chapters)
+        return chapters
+
+    def put(self, key: str, chapters: List[Dict[str, Any]]) -> None:
+        """Store extracted chapters in both tiers."""
+        with self._lock:
+            self._remember(key, chapters)
+        self._write_disk(key, chapters)
+
+    def _remember(self, key: str, chapters: List[Dict[str, Any]]) -> None:
+        """Insert into the memory tier and evict the least recently used books (lock held)."""
+        if self.max_entries <= 0:
+            return
+        self._memory[key] = chapters
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json.gz")
+
+    def _read_disk(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        if not self.cache_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                chapters = json.load(f)
+            os.utime(path)  # mtime marks recent use for eviction
+            return chapters
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key: str, chapters: List[Dict[str, Any]]) -> None:
+        if not self.cache_dir:
+            return
+        temp_path = None
+        try:
+            # Write to a temp file and rename so other processes never read a partial entry
+            fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as raw, gzip.open(raw, 'wt', encoding='utf-8') as f:
+                json.dump(chapters, f)
+            os.replace(temp_path, self._disk_path(key))
+            temp_path = None
+            self._evict_disk()
+        except (OSError, TypeError, ValueError) as e:
+            # A cache that can't be written must never fail the extraction it caches
+            print(f"Warning: could not write extraction cache entry: {e}")
+        finally:
+            # Don't leave the temp file behind when writing failed
+            if temp_path is not None:
+                try:
+                    os.unlink(temp_path)
+                except OSError:
+                    pass
+
+    def _evict_disk(self) -> None:
+        """Delete least recently used entries until the disk tier fits its size limit."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.json.gz'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue  # Removed by another process
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+            total -= size
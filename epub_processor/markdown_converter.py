@@ -0,0 +1,120 @@
+"""
+Single-pass HTML to Markdown conversion for EPUB chapters
+
+Walks the html.parser event stream once and appends Markdown fragments to a
+list buffer, so conversion time grows linearly with the size of the chapter.
+The output follows the rules of the regex converter in epub_extractor:
+headers, bold, italic, paragraphs, line breaks and blockquotes are converted,
+every other tag is dropped and entities are decoded.
+"""
+
+from html.parser import HTMLParser
+from typing import List
+
+HEADING_LEVELS = {'h1': 1, 'h2': 2, 'h3': 3, 'h4': 4, 'h5': 5, 'h6': 6}
+BOLD_TAGS = {'strong', 'b'}
+ITALIC_TAGS = {'em', 'i'}
+
+# Elements whose text never reaches the output
+SKIPPED_TAGS = {'script', 'style', 'title'}
+
+# Block elements end the current line so words of adjacent blocks don't merge
+BLOCK_TAGS = {
+    'div', 'section', 'article', 'aside', 'nav', 'header', 'footer', 'body',
+    'ul', 'ol', 'li', 'dl', 'dt', 'dd', 'table', 'tr', 'figure', 'figcaption', 'pre', 'hr'
+}
+
+
+class StreamingMarkdownConverter(HTMLParser):
+    """Convert HTML to Markdown in a single pass over the parser events."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._out: List[str] = []
+        self._skip_depth = 0
+        self._quote_starts: List[int] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self._skip_depth += 1
+            return
+        if self._skip_depth:
+            return
+
+        if tag in HEADING_LEVELS:
+            self._end_line()
+            self._out.append('#' * HEADING_LEVELS[tag] + ' ')
+        elif tag in BOLD_TAGS:
+            self._out.append('**')
+        elif tag in ITALIC_TAGS:
+            self._out.append('*')
+        elif tag == 'br':
+            self._out.append('\n')
+        elif tag == 'p' or tag in BLOCK_TAGS:
+            self._end_line()
+        elif tag == 'blockquote':
+            self._end_line()
+            self._quote_starts.append(len(self._out))
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS:
+            self._skip_depth = max(self._skip_depth - 1, 0)
+            return
+        if self._skip_depth:
+            return
+
+        if tag in HEADING_LEVELS:
+            self._out.append('\n')
+        elif tag in BOLD_TAGS:
+            self._out.append('**')
+        elif tag in ITALIC_TAGS:
+            self._out.append('*')
+        elif tag == 'p':
+            self._out.append('\n\n')
+        elif tag in BLOCK_TAGS:
+            self._end_line()
+        elif tag == 'blockquote' and self._quote_starts:
+            # Prefix every non-empty line written since the blockquote opened
+            start = self._quote_starts.pop()
+            quoted = ''.join(self._out[start:]).split('\n')
+            del self._out[start:]
+            self._out.append('\n'.join(f'> {line.strip()}' for line in quoted if line.strip()) + '\n\n')
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self._out.append(data)
+
+    def _end_line(self):
+        """Start a new line unless the output already ends with one."""
+        if self._out and not self._out[-1].endswith('\n'):
+            self._out.append('\n')
+
+    def markdown(self) -> str:
+        """Return the converted text with lines stripped and blank runs collapsed."""
+        cleaned_lines = []
+        for line in ''.join(self._out).split('\n'):
+            line = line.strip()
+            if line:
+                cleaned_lines.append(line)
+            elif cleaned_lines and cleaned_lines[-1]:  # Add blank lines between content
+                cleaned_lines.append('')
+        if cleaned_lines and not cleaned_lines[-1]:
+            cleaned_lines.pop()
+
+        return '\n'.join(cleaned_lines)
+
+
+def html_to_markdown(html_content: str) -> str:
+    """
+    Convert HTML content to Markdown in one pass.
+
+    Args:
+        html_content: Decoded HTML/XHTML document or fragment
+
+    Returns:
+        Markdown text
+    """
+    converter = StreamingMarkdownConverter()
+    converter.feed(html_content)
+    converter.close()
+    return converter.markdown()
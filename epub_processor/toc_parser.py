@@ -0,0 +1,161 @@
+"""
+Streaming parsers for EPUB package documents
+
+Reads container.xml, the OPF package, the EPUB 2 NCX and the EPUB 3 navigation
+document with xml.etree.ElementTree.iterparse. Each file is read once, element
+by element, and finished subtrees are cleared as soon as their data has been
+collected, so memory stays small even for multi-megabyte NCX files. TOC entries
+are returned in document order together with their nesting depth.
+"""
+
+import xml.etree.ElementTree as ET
+from typing import Any, Dict, IO, List, Tuple
+
+DC_NAMESPACE = "http://purl.org/dc/elements/1.1/"
+OPS_NAMESPACE = "http://www.idpf.org/2007/ops"
+
+# Dublin Core fields copied into the book metadata (all creators are kept)
+DC_FIELDS = ("title", "language", "publisher", "date", "description", "identifier")
+
+
+def _local_name(tag: str) -> str:
+    """Strip the '{namespace}' prefix ElementTree puts on tag names."""
+    return tag.rsplit("}", 1)[-1]
+
+
+def find_opf_path(stream: IO[bytes]) -> str:
+    """
+    Return the archive path of the OPF package named in META-INF/container.xml.
+
+    Raises:
+        ValueError: If the container has no rootfile
+    """
+    for _, elem in ET.iterparse(stream, events=("start",)):
+        if _local_name(elem.tag) == "rootfile":
+            return elem.get("full-path", "")
+    raise ValueError("container.xml has no rootfile")
+
+
+def parse_opf(stream: IO[bytes]) -> Tuple[Dict[str, Any], Dict[str, str], List[str], str]:
+    """
+    Parse an OPF package document in one pass.
+
+    Args:
+        stream: Binary file object for the OPF
+
+    Returns:
+        Tuple of (metadata, manifest mapping id to href, spine idrefs,
+        href of the EPUB 3 navigation document or "")
+    """
+    metadata = {field: "" for field in DC_FIELDS}
+    metadata["authors"] = []
+    manifest = {}
+    spine = []
+    nav_href = ""
+
+    for _, elem in ET.iterparse(stream, events=("end",)):
+        tag = elem.tag
+        if tag.startswith("{" + DC_NAMESPACE + "}"):
+            field = _local_name(tag)
+            text = (elem.text or "").strip()
+            if field == "creator":
+                if text:
+                    metadata["authors"].append(text)
+            elif field in metadata and not metadata[field]:
+                metadata[field] = text
+            continue
+
+        name = _local_name(tag)
+        if name == "item":
+            manifest[elem.get("id", "")] = elem.get("href", "")
+            if not nav_href and "nav" in elem.get("properties", "").split():
+                nav_href = elem.get("href", "")
+        elif name == "itemref":
+            spine.append(elem.get("idref", ""))
+        elif name in ("metadata", "manifest", "spine"):
+            elem.clear()
+
+    # Keep the field order of the original metadata dictionary
+    ordered = {"title": metadata["title"], "authors": metadata["authors"]}
+    ordered.update((field, metadata[field]) for field in DC_FIELDS[1:])
+    return ordered, manifest, spine, nav_href
+
+
+def parse_ncx(stream: IO[bytes]) -> List[Dict[str, Any]]:
+    """
+    Parse the navMap of an EPUB 2 NCX file.
+
+    Nested navPoints are returned in document order (each parent before its
+    children) with a 'depth' starting at 0. Points without a content src are
+    left out.
+
+    Returns:
+        List of {'label', 'src', 'id', 'depth'} dictionaries
+    """
+    entries = []
+    open_points = []  # Entries of the navPoints enclosing the current element
+
+    for event, elem in ET.iterparse(stream, events=("start", "end")):
+        name = _local_name(elem.tag)
+        if event == "start":
+            if name == "navPoint":
+                entry = {"label": None, "src": None, "id": elem.get("id", ""), "depth": len(open_points)}
+                open_points.append(entry)
+                entries.append(entry)
+            elif name == "content" and open_points and open_points[-1]["src"] is None:
+                open_points[-1]["src"] = elem.get("src", "")
+            continue
+
+        if name == "text" and open_points and open_points[-1]["label"] is None:
+            open_points[-1]["label"] = (elem.text or "").strip()
+        elif name == "navPoint":
+            open_points.pop()
+            elem.clear()
+
+    return [
+        {**entry, "label": entry["label"] or ""}
+        for entry in entries
+        if entry["src"] is not None
+    ]
+
+
+def parse_nav(stream: IO[bytes]) -> List[Dict[str, Any]]:
+    """
+    Parse the toc <nav> of an EPUB 3 navigation document.
+
+    Returns:
+        List of {'label', 'src', 'id', 'depth'} dictionaries for every linked
+        list item, in document order; depth counts the enclosing <ol> lists
+    """
+    entries = []
+    nav_depth = 0      # Open <nav> elements inside the toc nav (including it)
+    list_depth = 0     # Open <ol> elements inside the toc nav
+
+    for event, elem in ET.iterparse(stream, events=("start", "end")):
+        name = _local_name(elem.tag)
+        if event == "start":
+            if name == "nav" and (nav_depth or "toc" in elem.get(f"{{{OPS_NAMESPACE}}}type", "").split()):
+                nav_depth += 1
+            elif nav_depth and name == "ol":
+                list_depth += 1
+            continue
+
+        if not nav_depth:
+            continue
+        if name == "a" and elem.get("href"):
+            entries.append({
+                "label": " ".join("".join(elem.itertext()).split()),
+                "src": elem.get("href"),
+                "id": elem.get("id", ""),
+                "depth": max(list_depth - 1, 0),
+            })
+        elif name == "ol":
+            list_depth -= 1
+        elif name == "li":
+            elem.clear()
+        elif name == "nav":
+            nav_depth -= 1
+            if not nav_depth:
+                break  # Landmarks and page lists follow the toc
+
+    return entries
@@ -9,6 +9,8 @@ __version__ = "1.0.0"
 __author__ = "Mind Map Creator Team"
 
 import logging
+from pathlib import Path
+from .batch import BatchAnalysisJob
 from .extractor import KnowledgeExtractor
 from .mindmap_generator import MindMapGenerator
 from .chunker import SmartTextChunker
@@ -41,10 +43,12 @@ class MindMapCreator:
             raise ValueError("OpenAI API key is required. Set OPENAI_API_KEY environment variable or pass api_key parameter.")
         
         self.extractor = KnowledgeExtractor(api_key=self.api_key, model=self.model)
-        self.mindmap_generator = MindMapGenerator(self.extractor.client, self.model)
-        self.notes_generator = MindMapNotesGenerator(self.extractor.client, self.model)
+        self.mindmap_generator = MindMapGenerator(self.extractor.client, self.model, self.extractor.prompt_budget)
+        self.notes_generator = MindMapNotesGenerator(self.extractor.client, self.model,
+                                                     self.extractor.prompt_budget)
         
-    def process_chapter(self, content: str = None, file_path: str = None, title: str = "") -> dict:
+    def process_chapter(self, content: str = None, file_path: str = None, title: str = "",
+                        batch: bool = False) -> dict:
         """
         Process a chapter from content or file
         
@@ -52,10 +56,20 @@ class MindMapCreator:
             content: Text content to process (alternative to file_path)
             file_path: Path to the chapter file (alternative to content)
             title: Title for the chapter
+            batch: Analyse the chunks through the batch API (slow but discounted;
+                waits for the batch and resumes it after a restart)
             
         Returns:
             Dictionary containing insights and analysis results
         """
+        if batch:
+            if content is None and file_path is not None:
+                content = Path(file_path).read_text(encoding='utf-8')
+                title = title or Path(file_path).stem
+            if content is None:
+                raise ValueError("Either content or file_path must be provided")
+            return self.process_book_batch({title: content}, mindmap_type=None)[title]
+        
         if content is not None:
             results = self.extractor.extract_insights(content, title)
         elif file_path is not None:
@@ -73,6 +87,45 @@ class MindMapCreator:
         
         return results
     
+    def process_book_batch(self, chapters: dict, mindmap_type: str = "comprehensive",
+                           job_dir: str = None) -> dict:
+        """
+        Process every chapter of a book with one batch API job
+        
+        The chunk analyses of all chapters are submitted as one batch; the
+        batch id is persisted, so calling this again after a restart waits
+        for the same batch. Once it is done, CAPTURE, synthesis, summary,
+        mind map and notes of each chapter run as a second wave.
+        
+        Args:
+            chapters: Chapter text by title
+            mindmap_type: Type of mind map to generate for each chapter (None for no mind map or notes)
+            job_dir: Directory of the batch job files (defaults to config.BATCH_JOB_DIR)
+            
+        Returns:
+            Results of each chapter by title, like process_chapter, plus
+            'mindmap' and 'notes' when a mindmap_type is given
+        """
+        job = BatchAnalysisJob(self.extractor, list(chapters.items()), job_dir=job_dir)
+        chapter_analyses = job.results()
+        
+        book_results = {}
+        for (title, content), chunks, chunk_analyses in zip(chapters.items(), job.chunks, chapter_analyses):
+            results = self.extractor.extract_insights_from_analyses(content, title, chunks, chunk_analyses)
+            try:
+                results['quick_summary'] = self.create_student_summary(results)
+            except Exception as e:
+                logger.error(f"Error generating student summary: {str(e)}")
+                results['quick_summary'] = ""
+            
+            if mindmap_type:
+                results['mindmap'] = self.create_mindmap(results, mindmap_type)
+                results['notes'] = self.create_notes(results, results['mindmap'])
+            book_results[title] = results
+        
+        job.finish()
+        return book_results
+    
     def create_mindmap(self, results: dict, mindmap_type: str = "comprehensive") -> str:
         """
         Generate mind map from analysis results
@@ -0,0 +1,148 @@
+"""
+Content-addressed cache of chunk analyses
+
+KnowledgeExtractor looks chunk analyses up by the SHA-256 of the chunk text
+and the model, so re-running a chapter (e.g. with another mindmap type) or
+processing a revised edition only analyses the chunks whose text changed.
+With content-defined chunking most chunks of a lightly edited chapter keep
+their exact text. A bounded in-memory LRU tier serves hits within one
+process; an optional on-disk tier is shared by every worker process and
+evicts least recently used entries once it grows past its size limit.
+"""
+
+import functools
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ChunkAnalysisCache:
+    """Two-tier (memory LRU + optional disk) cache of chunk analyses."""
+
+    def __init__(self, max_entries: int = 512, cache_dir: str = None, max_disk_bytes: int = 200 * 1024 * 1024):
+        """
+        Args:
+            max_entries: Analyses kept in the in-memory tier (0 disables it)
+            cache_dir: Directory for the on-disk tier (None disables it)
+            max_disk_bytes: Size limit of the on-disk tier
+        """
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(model: str, content_hash: str) -> str:
+        """Build the cache key from the model and the SHA-256 of the chunk text."""
+        return hashlib.sha256(f"{model}\0{content_hash}".encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached analysis for `key`, or None on a miss."""
+        with self._lock:
+            analysis = self._memory.get(key)
+            if analysis is not None:
+                self._memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return analysis
+
+        analysis = self._read_disk(key)
+        with self._lock:
+            if analysis is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['disk_hits'] += 1
+            self._remember(key, analysis)
+        return analysis
+
+    def put(self, key: str, analysis: Dict[str, Any]) -> None:
+        """Store an analysis in both tiers."""
+        with self._lock:
+            self._remember(key, analysis)
+        self._write_disk(key, analysis)
+
+    def _remember(self, key: str, analysis: Dict[str, Any]) -> None:
+        """Insert into the memory tier and evict the least recently used analyses (lock held)."""
+        if self.max_entries <= 0:
+            return
+        self._memory[key] = analysis
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _read_disk(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.cache_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                analysis = json.load(f)
+            os.utime(path)  # mtime marks recent use for eviction
+            return analysis
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key: str, analysis: Dict[str, Any]) -> None:
+        if not self.cache_dir:
+            return
+        temp_path = None
+        try:
+            # Write to a temp file and rename so other processes never read a partial entry
+            fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(analysis, f)
+            os.replace(temp_path, self._disk_path(key))
+            temp_path = None
+            self._evict_disk()
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Could not write chunk analysis cache entry: {e}")
+        finally:
+            # Don't leave the temp file behind when writing failed
+            if temp_path is not None:
+                try:
+                    os.unlink(temp_path)
+                except OSError:
+                    pass
+
+    def _evict_disk(self) -> None:
+        """Delete least recently used entries until the disk tier fits its size limit."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.json'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue  # Removed by another process
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+            total -= size
+
+
+@functools.lru_cache(maxsize=None)
+def get_analysis_cache(max_entries: int, cache_dir: str = None, max_disk_mb: int = 200) -> ChunkAnalysisCache:
+    """Process-wide cache shared by every KnowledgeExtractor with the same settings."""
+    return ChunkAnalysisCache(max_entries=max_entries, cache_dir=cache_dir or None,
+                              max_disk_bytes=max_disk_mb * 1024 * 1024)
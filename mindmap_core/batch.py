@@ -0,0 +1,232 @@
+"""
+Batch API processing of chunk analyses
+
+For whole-book runs that don't need interactive latency, BatchAnalysisJob
+writes the chunk analysis requests of every chapter of a book into one
+JSONL file and submits it through the provider's batch interface, which
+answers at a discount within the completion window. The batch id is kept
+in a job file named after the book's content, so a restarted run picks
+the same batch up again instead of submitting (and paying for) it twice.
+Requests the batch couldn't answer are asked interactively; CAPTURE,
+synthesis, mind maps and notes run afterwards as a second wave.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .analysis_cache import ChunkAnalysisCache
+from .chunker import Chunk
+
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+STRUCTURED_REQUEST = "structured"
+
+
+class BatchAnalysisJob:
+    """Chunk analyses of a book's chapters, answered through the batch API"""
+
+    def __init__(self, extractor, chapters: List[Tuple[str, str]], job_dir: str = None,
+                 poll_seconds: float = None):
+        """
+        Args:
+            extractor: KnowledgeExtractor whose client, chunker and prompts are used
+            chapters: (title, text) of every chapter
+            job_dir: Directory of the job files (defaults to config.BATCH_JOB_DIR)
+            poll_seconds: Interval between batch status checks (defaults to config.BATCH_POLL_SECONDS)
+        """
+        self.extractor = extractor
+        self.chapters = chapters
+        self.job_dir = job_dir or extractor.config.BATCH_JOB_DIR
+        self.poll_seconds = poll_seconds if poll_seconds is not None else extractor.config.BATCH_POLL_SECONDS
+        os.makedirs(self.job_dir, exist_ok=True)
+
+        # Chunking is deterministic, so a resumed job cuts the same chunks as the one that submitted
+        self.chunks: List[List[Chunk]] = [extractor.chunker.chunk_by_sections(text, title)
+                                          for title, text in chapters]
+        self.job_id = self._job_id()
+        self.state_path = os.path.join(self.job_dir, f"{self.job_id}.json")
+
+    def _job_id(self) -> str:
+        """Identify the job by the model, analysis mode, chunking settings and every chapter's title and text."""
+        chunker = self.extractor.chunker
+        counter = chunker.token_counter
+        chunking = (f"{chunker.max_tokens}\0{chunker.overlap_tokens}\0{chunker.packing}\0{type(counter).__name__}"
+                    f"\0{getattr(getattr(counter, 'encoding', None), 'name', '')}")
+        digest = hashlib.sha256(
+            f"{self.extractor.model}\0{self.extractor.analysis_mode}\0{chunking}".encode('utf-8'))
+        for title, text in self.chapters:
+            digest.update(f"\0{title}\0".encode('utf-8'))
+            digest.update(hashlib.sha256(text.encode('utf-8')).digest())
+        return digest.hexdigest()[:32]
+
+    def _cache_key(self, chunk: Chunk) -> str:
+        return ChunkAnalysisCache.make_key(self.extractor.model, chunk.content_hash)
+
+    def _chunk_hashes(self) -> Dict[str, str]:
+        """content_hash of every chunk, by the chapter-chunk prefix of its custom_ids"""
+        return {f"{chapter_number}-{chunk_number}": chunk.content_hash
+                for chapter_number, chunks in enumerate(self.chunks)
+                for chunk_number, chunk in enumerate(chunks)}
+
+    def _requests(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """(custom_id, request body) of every chunk analysis request not answered by the analysis cache"""
+        extractor = self.extractor
+        requests = []
+        for chapter_number, ((title, _), chunks) in enumerate(zip(self.chapters, self.chunks)):
+            for chunk_number, chunk in enumerate(chunks):
+                if extractor.analysis_cache.get(self._cache_key(chunk)) is not None:
+                    continue
+                if extractor.analysis_mode == "structured":
+                    requests.append((f"{chapter_number}-{chunk_number}-{STRUCTURED_REQUEST}",
+                                     extractor._structured_request(chunk, title)))
+                    continue
+                for question_set in extractor.QUESTION_SETS:
+                    requests.append((f"{chapter_number}-{chunk_number}-{question_set['name']}",
+                                     extractor._question_set_request(chunk, title, question_set)))
+        return requests
+
+    def load_state(self) -> Optional[Dict[str, Any]]:
+        """The persisted job state, or None before the job was submitted."""
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save_state(self, state: Dict[str, Any]) -> None:
+        # Write to a temp file and rename so a crash never leaves a partial job file
+        fd, temp_path = tempfile.mkstemp(dir=self.job_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(temp_path, self.state_path)
+
+    def submit(self) -> Optional[str]:
+        """
+        Submit the job's requests as one batch, unless an earlier run already did
+
+        Returns:
+            The batch id, or None when the analysis cache answers every request
+        """
+        state = self.load_state()
+        if state is not None:
+            logger.info(f"Resuming batch {state['batch_id']} of job {self.job_id}")
+            return state['batch_id']
+
+        requests = self._requests()
+        if not requests:
+            return None
+        lines = "".join(json.dumps({"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT,
+                                    "body": body}) + "\n"
+                        for custom_id, body in requests)
+
+        client = self.extractor.client
+        input_file = client.files.create(file=(f"{self.job_id}.jsonl", lines.encode('utf-8')), purpose="batch")
+        batch = client.batches.create(input_file_id=input_file.id, endpoint=BATCH_ENDPOINT,
+                                      completion_window=self.extractor.config.BATCH_COMPLETION_WINDOW,
+                                      metadata={"job": self.job_id})
+        self._save_state({'batch_id': batch.id, 'input_file_id': input_file.id, 'requests': len(requests),
+                          'chunk_hashes': self._chunk_hashes(), 'submitted_at': time.time()})
+        logger.info(f"Submitted batch {batch.id} with {len(requests)} chunk analysis requests")
+        return batch.id
+
+    def wait(self, batch_id: str):
+        """Poll the batch until it reaches a terminal status; return it."""
+        while True:
+            batch = self.extractor.client.batches.retrieve(batch_id)
+            if batch.status in TERMINAL_STATUSES:
+                logger.info(f"Batch {batch_id} {batch.status}")
+                return batch
+            counts = getattr(batch, 'request_counts', None)
+            if counts is not None:
+                logger.info(f"Batch {batch_id} {batch.status}: {counts.completed}/{counts.total} requests done")
+            time.sleep(self.poll_seconds)
+
+    def _answers(self, batch) -> Dict[str, str]:
+        """Response content of every request the batch answered successfully, by custom_id"""
+        if batch is None or not getattr(batch, 'output_file_id', None):
+            return {}
+        output = self.extractor.client.files.content(batch.output_file_id).text
+        answers = {}
+        for line in output.splitlines():
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            response = result.get('response') or {}
+            if result.get('error') or response.get('status_code') != 200:
+                logger.warning(f"Batch request {result.get('custom_id')} failed: "
+                               f"{result.get('error') or response.get('status_code')}")
+                continue
+            answers[result['custom_id']] = response['body']['choices'][0]['message']['content']
+        return answers
+
+    def results(self) -> List[List[Dict[str, Any]]]:
+        """
+        Submit or resume the batch, wait for it and build every chapter's chunk analyses
+
+        Returns:
+            The chunk_analyses entries of each chapter, in chapter order
+        """
+        batch_id = self.submit()
+        batch = self.wait(batch_id) if batch_id else None
+        answers = self._answers(batch)
+
+        # Only use answers to the chunks the batch was submitted for: an answer to a chunk cut
+        # differently would be cached under the wrong content_hash
+        submitted = (self.load_state() or {}).get('chunk_hashes', {})
+        current = self._chunk_hashes()
+        stale = {prefix for prefix, content_hash in current.items() if submitted.get(prefix) != content_hash}
+        if stale and answers:
+            logger.warning(f"{len(stale)} chunks of batch {batch_id} were cut differently, asking them interactively")
+            answers = {custom_id: content for custom_id, content in answers.items()
+                       if "-".join(custom_id.split('-', 2)[:2]) not in stale}
+
+        extractor = self.extractor
+        chapter_analyses = []
+        for chapter_number, ((title, _), chunks) in enumerate(zip(self.chapters, self.chunks)):
+            entries = []
+            for chunk_number, chunk in enumerate(chunks):
+                cache_key = self._cache_key(chunk)
+                analysis = extractor.analysis_cache.get(cache_key)
+                if analysis is None:
+                    analysis = self._analysis(f"{chapter_number}-{chunk_number}", chunk, title, answers)
+                    if not extractor._has_failed_sets(analysis):
+                        extractor.analysis_cache.put(cache_key, analysis)
+                entries.append(extractor._chunk_entry(chunk, analysis))
+            chapter_analyses.append(entries)
+        return chapter_analyses
+
+    def _analysis(self, prefix: str, chunk: Chunk, title: str, answers: Dict[str, str]) -> Dict[str, Any]:
+        """A chunk's analysis from the batch answers, asking missing or unreadable ones interactively"""
+        extractor = self.extractor
+        if extractor.analysis_mode == "structured":
+            try:
+                answer_sets = extractor._parse_structured_answers(answers[f"{prefix}-{STRUCTURED_REQUEST}"])
+            except (KeyError, ValueError) as e:
+                logger.warning(f"No usable batch answer for chunk {chunk.chunk_number}, asking interactively: {e}")
+                answer_sets = extractor._run_structured_analysis(chunk, title)
+            return extractor._combine_answers(answer_sets)
+
+        answer_sets = {}
+        for question_set in extractor.QUESTION_SETS:
+            try:
+                content = answers[f"{prefix}-{question_set['name']}"]
+                answer_sets[question_set['name']] = json.loads(extractor._clean_json_response(content))
+            except (KeyError, ValueError):
+                logger.warning(f"No usable batch answer for {question_set['name']} of chunk "
+                               f"{chunk.chunk_number}, asking interactively")
+                answer_sets[question_set['name']] = extractor._run_question_set(chunk, title, question_set)
+        return extractor._combine_answers(answer_sets)
+
+    def finish(self) -> None:
+        """Forget the job once its results are used, so the same book can be submitted again later."""
+        try:
+            os.remove(self.state_path)
+        except FileNotFoundError:
+            pass
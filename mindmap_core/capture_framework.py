@@ -7,6 +7,8 @@ import json
 import logging
 from typing import Dict, List, Any, Tuple
 from .web_config import Config
+from .prompt_budget import TEXT_SLOT, PromptBudget
+from .response_cache import forget_response
 
 logger = logging.getLogger(__name__)
 
@@ -24,17 +26,20 @@ class CAPTUREFramework:
     - E: Explanation strategies for improved understanding
     """
     
-    def __init__(self, openai_client, model: str):
+    def __init__(self, openai_client, model: str, prompt_budget: PromptBudget = None):
         """
         Initialize CAPTURE framework
         
         Args:
             openai_client: OpenAI client instance
             model: AI model to use
+            prompt_budget: Budget the chapter text is fitted into each prompt with
+                (defaults to the model's budget)
         """
         self.client = openai_client
         self.model = model
         self.config = Config()
+        self.prompt_budget = prompt_budget or PromptBudget(model, self.config.get_model_config(model), self.config)
         
     def apply_capture_analysis(self, content: str, title: str) -> Dict[str, Any]:
         """
@@ -110,7 +115,7 @@ class CAPTUREFramework:
         Analyze the text structure of "{title}" to improve comprehension.
         
         Text content:
-        {content[:3000]}...
+        {TEXT_SLOT}
         
         Identify the following text structures present:
         1. Problem-Solution structures
@@ -139,16 +144,11 @@ class CAPTUREFramework:
             "comprehension_aids": []
         }}
         """
+        prompt = self.prompt_budget.fill(prompt, content, "CAPTURE structure analysis",
+                                         limit=self.config.CAPTURE_TEXT_TOKENS)
         
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3
-            )
-            
-            content_response = response.choices[0].message.content.strip()
-            return json.loads(self._clean_json_response(content_response))
+            return self._request_json(prompt)
             
         except Exception as e:
             logger.error(f"Error in structure analysis: {str(e)}")
@@ -162,7 +162,7 @@ class CAPTUREFramework:
         Analyze the content patterns in "{title}" using proven comprehension frameworks.
         
         Text content:
-        {content[:3000]}...
+        {TEXT_SLOT}
         
         Apply the SWBST framework (Somebody Wanted But So Then) if applicable:
         - Somebody: Who are the main actors/subjects?
@@ -196,16 +196,11 @@ class CAPTUREFramework:
             "main_conflicts": []
         }}
         """
+        prompt = self.prompt_budget.fill(prompt, content, "CAPTURE pattern analysis",
+                                         limit=self.config.CAPTURE_TEXT_TOKENS)
         
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3
-            )
-            
-            content_response = response.choices[0].message.content.strip()
-            return json.loads(self._clean_json_response(content_response))
+            return self._request_json(prompt)
             
         except Exception as e:
             logger.error(f"Error in pattern analysis: {str(e)}")
@@ -219,7 +214,7 @@ class CAPTUREFramework:
         Analyze how "{title}" can be partitioned into logical segments for improved comprehension.
         
         Text content:
-        {content[:3000]}...
+        {TEXT_SLOT}
         
         Identify:
         1. Natural break points in the content
@@ -255,16 +250,11 @@ class CAPTUREFramework:
             "information_flow": "description of how information is organized"
         }}
         """
+        prompt = self.prompt_budget.fill(prompt, content, "CAPTURE partition analysis",
+                                         limit=self.config.CAPTURE_TEXT_TOKENS)
         
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3
-            )
-            
-            content_response = response.choices[0].message.content.strip()
-            return json.loads(self._clean_json_response(content_response))
+            return self._request_json(prompt)
             
         except Exception as e:
             logger.error(f"Error in partition analysis: {str(e)}")
@@ -278,7 +268,7 @@ class CAPTUREFramework:
         Extract themes from "{title}" using structured comprehension strategies.
         
         Text content:
-        {content[:3000]}...
+        {TEXT_SLOT}
         
         Identify:
         1. Central themes and their supporting evidence
@@ -314,16 +304,11 @@ class CAPTUREFramework:
             "unifying_concept": "overarching idea that ties themes together"
         }}
         """
+        prompt = self.prompt_budget.fill(prompt, content, "CAPTURE thematic analysis",
+                                         limit=self.config.CAPTURE_TEXT_TOKENS)
         
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3
-            )
-            
-            content_response = response.choices[0].message.content.strip()
-            return json.loads(self._clean_json_response(content_response))
+            return self._request_json(prompt)
             
         except Exception as e:
             logger.error(f"Error in thematic analysis: {str(e)}")
@@ -337,7 +322,7 @@ class CAPTUREFramework:
         Create a unified synthesis for "{title}" by integrating multiple analysis components.
         
         Analysis Components:
-        {json.dumps(analyses, indent=2)[:4000]}...
+        {TEXT_SLOT}
         
         Synthesize into a coherent understanding that includes:
         1. Main message and purpose
@@ -368,16 +353,11 @@ class CAPTUREFramework:
             "success_indicators": "how to know students understand"
         }}
         """
+        prompt = self.prompt_budget.fill(prompt, json.dumps(analyses, indent=2), "CAPTURE unified synthesis",
+                                         limit=self.config.CAPTURE_SYNTHESIS_TOKENS)
         
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3
-            )
-            
-            content_response = response.choices[0].message.content.strip()
-            return json.loads(self._clean_json_response(content_response))
+            return self._request_json(prompt)
             
         except Exception as e:
             logger.error(f"Error in unified synthesis: {str(e)}")
@@ -391,7 +371,7 @@ class CAPTUREFramework:
         Generate a comprehensive summary for "{title}" based on the unified synthesis.
         
         Synthesis Data:
-        {json.dumps(synthesis, indent=2)[:3000]}...
+        {TEXT_SLOT}
         
         Create a comprehensive summary that includes:
         
@@ -425,6 +405,8 @@ class CAPTUREFramework:
         Write in clear, accessible language that helps students understand complex ideas.
         Aim for 600-800 words total. Use engaging headings and clear transitions.
         """
+        prompt = self.prompt_budget.fill(prompt, json.dumps(synthesis, indent=2), "CAPTURE summary",
+                                         limit=self.config.CAPTURE_SYNTHESIS_TOKENS)
         
         try:
             response = self.client.chat.completions.create(
@@ -448,7 +430,7 @@ class CAPTUREFramework:
         Generate explanation strategies for "{title}" to improve student understanding.
         
         Synthesis Data:
-        {json.dumps(synthesis, indent=2)[:2000]}...
+        {TEXT_SLOT}
         
         Create strategies for:
         1. Pre-reading preparation (activating prior knowledge)
@@ -476,21 +458,28 @@ class CAPTUREFramework:
             "differentiation_options": []
         }}
         """
+        prompt = self.prompt_budget.fill(prompt, json.dumps(synthesis, indent=2), "CAPTURE explanation strategies",
+                                         limit=self.config.CAPTURE_SYNTHESIS_TOKENS)
         
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3
-            )
-            
-            content_response = response.choices[0].message.content.strip()
-            return json.loads(self._clean_json_response(content_response))
+            return self._request_json(prompt)
             
         except Exception as e:
             logger.error(f"Error generating explanation strategies: {str(e)}")
             return {"error": str(e)}
     
+    def _request_json(self, prompt: str) -> Dict[str, Any]:
+        """Ask for a JSON answer; an answer that can't be parsed is dropped from the response cache"""
+        request = {'model': self.model, 'messages': [{"role": "user", "content": prompt}], 'temperature': 0.3}
+        response = self.client.chat.completions.create(**request)
+        
+        content_response = response.choices[0].message.content.strip()
+        try:
+            return json.loads(self._clean_json_response(content_response))
+        except ValueError:
+            forget_response(self.client, request)
+            raise
+    
     def _clean_json_response(self, content: str) -> str:
         """Clean JSON response from AI"""
         import re
@@ -3,35 +3,194 @@ Smart text chunking module for handling large documents
 """
 
 import re
+import hashlib
 import logging
-from typing import List, Dict, Any
+import zlib
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Tuple
 from .web_config import Config
+from .token_counter import get_token_counter
 
 logger = logging.getLogger(__name__)
 
+# Whitespace after sentence-ending punctuation (group 1; faster to scan than a lookbehind)
+SENTENCE_BOUNDARY = re.compile(r'[.!?](\s+)')
+WORD_PATTERN = re.compile(r'\S+')
+# Markdown ATX heading on its own line: level marks and title
+HEADER_PATTERN = re.compile(r'^(#{1,6})[ \t]+(.+?)[ \t#]*$', re.MULTILINE)
+PARAGRAPH_BREAK = re.compile(r'\n[ \t]*\n\s*')
+
+# Rough section size when a text has no headings to split at
+PARAGRAPH_SECTION_CHARS = 2000
+
+# Section packing strategies of SmartTextChunker
+CHUNK_PACKINGS = ("balanced", "greedy", "content_defined")
+
+# Content-defined chunking: characters fingerprinted before each paragraph end,
+# the size (fraction of max_tokens) a chunk reaches before content cuts apply,
+# and the average size a chunk grows past that before one is found
+CDC_WINDOW_CHARS = 64
+CDC_MIN_FRACTION = 0.5
+CDC_TARGET_FRACTION = 0.25
+
+# Characters scanned per overlap token when looking for the overlap's sentences
+OVERLAP_SCAN_CHARS_PER_TOKEN = 8
+
+
+class BoundaryIndex:
+    """
+    Sentence and paragraph boundaries of one text, found in a single regex
+    scan each and stored as offset arrays. Splitting, overlap selection and
+    paragraph sectioning look boundaries up by binary search instead of
+    scanning the text again.
+    """
+    
+    __slots__ = ('text', 'sentence_ends', 'sentence_starts', 'paragraph_ends', 'paragraph_starts')
+    
+    def __init__(self, text: str):
+        self.text = text
+        # A boundary is the whitespace between two sentences (or paragraphs):
+        # the previous one ends where it starts, the next starts where it ends
+        self.sentence_ends, self.sentence_starts = self._scan(SENTENCE_BOUNDARY, text)
+        self.paragraph_ends, self.paragraph_starts = self._scan(PARAGRAPH_BREAK, text)
+    
+    @staticmethod
+    def _scan(pattern: re.Pattern, text: str) -> Tuple[array, array]:
+        ends, starts = array('I'), array('I')
+        group = pattern.groups  # The whitespace is the last group, or the whole match
+        for match in pattern.finditer(text):
+            ends.append(match.start(group))
+            starts.append(match.end())
+        return ends, starts
+    
+    def sentences(self, start: int, end: int) -> List[Tuple[int, int]]:
+        """
+        (start, end) offsets of the sentences of text[start:end]; the first
+        and last may be partial sentences cut by the range
+        """
+        first = bisect_left(self.sentence_ends, start)
+        last = bisect_left(self.sentence_ends, end)
+        starts = self.sentence_starts[first:last]
+        ends = self.sentence_ends[first:last]
+        if starts and starts[-1] > end:
+            starts[-1] = end  # Whitespace running past the range
+        starts.insert(0, start)
+        ends.append(end)
+        return list(zip(starts, ends))
+    
+    def paragraph_breaks(self) -> List[Tuple[int, int]]:
+        """(start, end) offsets of the whitespace between paragraphs"""
+        return list(zip(self.paragraph_ends, self.paragraph_starts))
+
+
+@dataclass(slots=True)
+class Chunk:
+    """
+    A chunk of a document stored as offsets into the document string, which
+    all chunks of one document share. Text is only sliced out when needed
+    (e.g. when a prompt is built).
+    
+    Reading chunk['content'] and the other old dictionary keys still works.
+    """
+    source: str = field(repr=False, compare=False)
+    chunk_number: int
+    overlap_start: int      # Start of the text repeated from the previous chunk
+    start: int              # Start of the chunk's own text (== overlap_start without overlap)
+    end: int                # One past the last character
+    token_estimate: int
+    section_info: str
+    word_count: int
+    
+    @property
+    def content(self) -> str:
+        """Full chunk text, including the overlap"""
+        return self.source[self.overlap_start:self.end]
+    
+    @property
+    def character_count(self) -> int:
+        return self.end - self.overlap_start
+    
+    @property
+    def content_hash(self) -> str:
+        """SHA-256 of the chunk text, identifying the chunk across runs and editions"""
+        return hashlib.sha256(self.content.encode('utf-8')).hexdigest()
+    
+    def text(self, limit: int = None) -> str:
+        """Slice the chunk text, optionally only its first `limit` characters"""
+        end = self.end if limit is None else min(self.end, self.overlap_start + limit)
+        return self.source[self.overlap_start:end]
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Offsets and metadata without the text, for storing with results"""
+        return {
+            'chunk_number': self.chunk_number,
+            'overlap_start': self.overlap_start,
+            'start': self.start,
+            'end': self.end,
+            'token_estimate': self.token_estimate,
+            'section_info': self.section_info,
+            'word_count': self.word_count,
+            'character_count': self.character_count,
+            'content_hash': self.content_hash
+        }
+    
+    def __getitem__(self, key: str):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+    
+    def get(self, key: str, default=None):
+        return getattr(self, key, default)
+
+
 class SmartTextChunker:
     """
     Intelligently chunks text while preserving context and meaning
     """
     
-    def __init__(self, config: Config = None, max_tokens: int = None, overlap_tokens: int = None):
+    def __init__(self, config: Config = None, max_tokens: int = None, overlap_tokens: int = None,
+                 model: str = None, token_counter=None, packing: str = None):
+        """
+        Args:
+            config: Configuration (defaults to Config())
+            max_tokens: Token limit per chunk
+            overlap_tokens: Tokens repeated from the end of one chunk at the start of the next
+            model: Model the chunks are sized for (selects the tiktoken encoding)
+            token_counter: Counter with count/count_batch/reset (defaults to
+                get_token_counter(model, config.TOKEN_COUNTER))
+            packing: "balanced" picks section boundaries that minimise the chunk
+                count and even out chunk sizes, "greedy" fills chunks in order,
+                "content_defined" cuts at paragraph ends chosen by a hash of the
+                text before them so chunks survive edits elsewhere in the text
+                (defaults to config.CHUNK_PACKING)
+        """
         self.config = config or Config()
         self.max_tokens = max_tokens or self.config.MAX_TOKENS_PER_CHUNK
         self.overlap_tokens = overlap_tokens or self.config.OVERLAP_TOKENS
+        self.token_counter = token_counter or get_token_counter(
+            model, getattr(self.config, 'TOKEN_COUNTER', 'tiktoken')
+        )
+        self.packing = packing or getattr(self.config, 'CHUNK_PACKING', 'balanced')
+        if self.packing not in CHUNK_PACKINGS:
+            raise ValueError(f"Unknown packing '{self.packing}', expected one of {CHUNK_PACKINGS}")
+        self._boundaries = None
         
     def estimate_tokens(self, text: str) -> int:
         """
-        Rough token estimation (1 token ≈ 4 characters)
+        Count tokens with the configured token counter
         
         Args:
             text: Text to estimate tokens for
             
         Returns:
-            Estimated token count
+            Token count (exact with tiktoken, 1 token ≈ 4 characters otherwise)
         """
-        return len(text) // 4
+        return int(self.token_counter.count(text))
     
-    def chunk_by_sections(self, text: str, title: str = "") -> List[Dict[str, Any]]:
+    def chunk_by_sections(self, text: str, title: str = "") -> List[Chunk]:
         """
         Chunk text by logical sections while respecting token limits
         
@@ -40,257 +199,477 @@ class SmartTextChunker:
             title: Document title for context
             
         Returns:
-            List of chunk dictionaries with metadata
+            List of Chunk offsets into one shared document string
+        """
+        return list(self.iter_chunks(text, title))
+    
+    def iter_chunks(self, text: str, title: str = "") -> Iterator[Chunk]:
+        """
+        Chunk text like chunk_by_sections, yielding each chunk as soon as it
+        is ready so callers can start analysing the first chunks while the
+        rest are still being cut
+        
+        Args:
+            text: Text to chunk
+            title: Document title for context
+            
+        Yields:
+            Chunk offsets into one shared document string, in text order
         """
         logger.info(f"Chunking text: {title}")
         
+        # Counts and boundaries are remembered for this run only, so no text is encoded or scanned twice
+        self.token_counter.reset()
+        try:
+            count = 0
+            for count, chunk in enumerate(self._chunk_sections(text), 1):
+                yield chunk
+            logger.info(f"Created {count} chunks")
+        finally:
+            self.token_counter.reset()
+            self._boundaries = None
+    
+    def _boundaries_for(self, document: str) -> BoundaryIndex:
+        """Boundary index of `document`, built on first use in a chunking run"""
+        if self._boundaries is None or self._boundaries.text is not document:
+            self._boundaries = BoundaryIndex(document)
+        return self._boundaries
+    
+    def _chunk_sections(self, text: str) -> Iterator[Chunk]:
+        """Pack the sections of `text` into chunks (body of iter_chunks)"""
         # First, try to identify natural sections
         sections = self._identify_sections(text)
         logger.info(f"Identified {len(sections)} natural sections")
         
-        chunks = []
-        current_chunk = ""
-        current_tokens = 0
-        chunk_number = 1
+        if self.packing == "content_defined":
+            yield from self._chunk_content_defined(text, sections)
+            return
+        
+        # Sections are consecutive spans of the text, so every chunk is a slice of it
+        document = text
+        section_starts = [section['start'] for section in sections]
+        section_ends = [section['end'] for section in sections]
+        
+        # Count all sections in one batch; a chunk adds up the counts of its sections
+        section_counts = self.token_counter.count_batch([section['content'] for section in sections])
+        
+        chunk_count = 0
+        run = []  # Indices of consecutive sections that fit in a chunk on their own
+        for index, section_tokens in enumerate(section_counts + [None]):
+            if section_tokens is not None and section_tokens <= self.max_tokens:
+                run.append(index)
+                continue
+            
+            # A run ends at an oversize section or at the end of the text
+            next_title = sections[index]['title'] if section_tokens is not None else None
+            packed = self._pack_run(document, run, sections, section_starts, section_ends,
+                                    section_counts, next_title, chunk_count + 1)
+            chunk_count += len(packed)
+            yield from packed
+            run = []
+            if section_tokens is None:
+                break
+            
+            # Split large section into smaller parts
+            section = sections[index]
+            sub_chunks = self._split_large_section(document, section_starts[index], section_ends[index],
+                                                   section['title'])
+            for sub_start, sub_end, sub_chunk_tokens in sub_chunks:
+                chunk_count += 1
+                yield self._create_chunk(
+                    document, chunk_count, sub_start, sub_start, sub_end, sub_chunk_tokens,
+                    f"{section['title']} - Part {chunk_count}"
+                )
+    
+    def _pack_run(self, document: str, run: List[int], sections: List[Dict[str, Any]], starts: List[int],
+                  ends: List[int], counts: List[float], next_title: str, first_number: int) -> List[Chunk]:
+        """
+        Pack consecutive sections into chunks, each starting with the overlap
+        taken from the last section of the chunk before it
         
-        for section in sections:
-            section_tokens = self.estimate_tokens(section['content'])
+        Args:
+            document: String holding the sections
+            run: Section indices to pack, in order
+            sections: All sections of the document
+            starts, ends, counts: Offsets and token counts of all sections
+            next_title: Title of the oversize section after the run (None at the end of the text)
+            first_number: Number of the first chunk
             
-            # If section alone exceeds limit, split it further
-            if section_tokens > self.max_tokens:
-                # Save current chunk if it has content
-                if current_chunk.strip():
-                    chunks.append(self._create_chunk_dict(
-                        chunk_number, current_chunk, current_tokens, 
-                        f"Sections ending with {section['title']}"
-                    ))
-                    chunk_number += 1
-                    current_chunk = ""
-                    current_tokens = 0
-                
-                # Split large section into smaller parts
-                sub_chunks = self._split_large_section(section['content'], section['title'])
-                for sub_chunk in sub_chunks:
-                    chunks.append(self._create_chunk_dict(
-                        chunk_number, sub_chunk, self.estimate_tokens(sub_chunk),
-                        f"{section['title']} - Part {chunk_number}"
-                    ))
-                    chunk_number += 1
-                    
+        Returns:
+            Chunks covering the run
+        """
+        if not run:
+            return []
+        
+        section_tokens = [counts[i] for i in run]
+        
+        # Overlap a chunk starting at run position k would begin with, taken
+        # from section k-1; dropped where it would push section k over the limit
+        overlaps = [(starts[run[0]], 0)]
+        for previous, index in zip(run, run[1:]):
+            overlap = self._get_overlap_start(document, starts[previous], ends[previous], counts[previous])
+            if overlap[1] == 0 or overlap[1] + counts[index] > self.max_tokens:
+                overlap = (starts[index], 0)
+            overlaps.append(overlap)
+        
+        if self.packing == "greedy":
+            groups = self._plan_greedy(section_tokens, overlaps)
+        else:
+            groups = self._plan_balanced(section_tokens, overlaps)
+        
+        chunks = []
+        for number, (k, j, tokens) in enumerate(groups, first_number):
+            if j < len(run):
+                info = f"Sections ending before {sections[run[j]]['title']}"
+            elif next_title is not None:
+                info = f"Sections ending with {next_title}"
             else:
-                # Check if adding this section would exceed limit
-                if current_tokens + section_tokens > self.max_tokens and current_chunk:
-                    # Save current chunk
-                    chunks.append(self._create_chunk_dict(
-                        chunk_number, current_chunk, current_tokens,
-                        f"Sections ending before {section['title']}"
-                    ))
-                    chunk_number += 1
-                    
-                    # Start new chunk with overlap
-                    overlap_text = self._get_overlap_text(current_chunk)
-                    current_chunk = overlap_text + "\n\n" + section['content']
-                    current_tokens = self.estimate_tokens(current_chunk)
-                else:
-                    # Add to current chunk
-                    if current_chunk:
-                        current_chunk += "\n\n" + section['content']
-                        current_tokens += section_tokens
-                    else:
-                        current_chunk = section['content']
-                        current_tokens = section_tokens
-        
-        # Add final chunk if it has content
-        if current_chunk.strip():
-            chunks.append(self._create_chunk_dict(
-                chunk_number, current_chunk, current_tokens, "Final section"
-            ))
-        
-        logger.info(f"Created {len(chunks)} chunks")
+                info = "Final section"
+            chunks.append(self._create_chunk(document, number, overlaps[k][0], starts[run[k]],
+                                             ends[run[j - 1]], tokens, info))
         return chunks
     
-    def _create_chunk_dict(self, number: int, content: str, tokens: int, info: str) -> Dict[str, Any]:
-        """Create standardized chunk dictionary"""
-        return {
-            'chunk_number': number,
-            'content': content.strip(),
-            'token_estimate': tokens,
-            'section_info': info,
-            'word_count': len(content.split()),
-            'character_count': len(content)
-        }
+    def _chunk_cost(self, section_tokens: List[float], overlaps: List[Tuple[int, float]], k: int):
+        """Yield (j, tokens) for chunks holding run positions k..j-1, growing j"""
+        tokens = overlaps[k][1] + section_tokens[k]
+        yield k + 1, tokens
+        for j in range(k + 2, len(section_tokens) + 1):
+            tokens += section_tokens[j - 1]
+            yield j, tokens
+    
+    def _plan_greedy(self, section_tokens: List[float],
+                     overlaps: List[Tuple[int, float]]) -> List[Tuple[int, int, float]]:
+        """Fill each chunk with as many sections as fit, in order"""
+        groups = []
+        k = 0
+        while k < len(section_tokens):
+            best = None
+            for j, tokens in self._chunk_cost(section_tokens, overlaps, k):
+                if best is not None and tokens > self.max_tokens:
+                    break
+                best = (k, j, tokens)
+            groups.append(best)
+            k = best[1]
+        return groups
     
-    def _identify_sections(self, text: str) -> List[Dict[str, str]]:
+    def _plan_balanced(self, section_tokens: List[float],
+                       overlaps: List[Tuple[int, float]]) -> List[Tuple[int, int, float]]:
         """
-        Identify logical sections in the text
+        Choose chunk boundaries that minimise the number of chunks and, among
+        those, the sum of squared chunk sizes (linear partition by dynamic
+        programming, with each chunk's overlap included in its size)
+        
+        Returns:
+            (first position, position after last, tokens) for each chunk
+        """
+        count = len(section_tokens)
+        best = [None] * (count + 1)   # (chunks, sum of squared sizes) for the first j sections
+        previous = [None] * (count + 1)
+        best[0] = (0, 0)
+        
+        for k in range(count):
+            if best[k] is None:
+                continue
+            chunk_count, squares = best[k]
+            for j, tokens in self._chunk_cost(section_tokens, overlaps, k):
+                if tokens > self.max_tokens:
+                    break
+                candidate = (chunk_count + 1, squares + tokens * tokens)
+                if best[j] is None or candidate < best[j]:
+                    best[j] = candidate
+                    previous[j] = (k, tokens)
+        
+        groups = []
+        j = count
+        while j > 0:
+            k, tokens = previous[j]
+            groups.append((k, j, tokens))
+            j = k
+        return groups[::-1]
+    
+    def _chunk_content_defined(self, text: str, sections: List[Dict[str, Any]]) -> Iterator[Chunk]:
+        """
+        Cut text into chunks at paragraph ends picked by their content
+        
+        Once a chunk holds CDC_MIN_FRACTION of max_tokens, a paragraph end
+        becomes a cut when the CRC-32 of the CDC_WINDOW_CHARS before it falls
+        below a threshold proportional to the paragraph's tokens, so chunks
+        grow on average CDC_TARGET_FRACTION of max_tokens past the minimum.
+        The CRC of that window is the value a rolling hash over the text would
+        have at that position, evaluated only where a cut is allowed. Cut
+        points depend on the text around them rather than on offsets from the
+        start, so after an edit the cuts fall back in step within a chunk or
+        two and the other chunks keep their exact text (and content_hash).
+        Cuts are also forced where a chunk would outgrow max_tokens with its
+        overlap.
+        
+        Args:
+            text: Text to chunk
+            sections: Sections of the text, used to label chunks
+            
+        Yields:
+            Chunk offsets into text
+        """
+        if not sections:
+            return
+        
+        section_starts = [section['start'] for section in sections]
+        previous = None
+        for number, (start, end, tokens) in enumerate(self._content_defined_spans(text), 1):
+            overlap_start, overlap_tokens = start, 0
+            if previous is not None:
+                overlap_start, overlap_tokens = self._get_overlap_start(text, *previous)
+                if overlap_tokens == 0 or tokens + overlap_tokens > self.max_tokens:
+                    overlap_start, overlap_tokens = start, 0
+            section = sections[max(bisect_left(section_starts, start + 1) - 1, 0)]
+            yield self._create_chunk(text, number, overlap_start, start, end, tokens + overlap_tokens,
+                                     f"Content from {section['path']}")
+            previous = (start, end, tokens)
+    
+    def _content_defined_spans(self, text: str) -> Iterator[Tuple[int, int, float]]:
+        """Yield (start, end, tokens) of the content-defined chunks of text, without overlap"""
+        boundaries = self._boundaries_for(text)
+        paragraph_starts = [0] + [end for _, end in boundaries.paragraph_breaks() if end < len(text)]
+        paragraphs = list(zip(paragraph_starts, paragraph_starts[1:] + [len(text)]))
+        counts = self.token_counter.count_batch([text[a:b] for a, b in paragraphs])
+        
+        budget = self.max_tokens - self.overlap_tokens  # Room left for the next chunk's overlap
+        minimum = self.max_tokens * CDC_MIN_FRACTION
+        target = max(self.max_tokens * CDC_TARGET_FRACTION, 1)
+        span_start, span_tokens = None, 0
+        for start, end, tokens, forced in self._content_defined_units(text, paragraphs, counts):
+            if span_start is not None and span_tokens + tokens > budget:
+                yield span_start, start, span_tokens
+                span_start, span_tokens = None, 0
+            if span_start is None:
+                span_start = start
+            span_tokens += tokens
+            
+            window = text[max(start, end - CDC_WINDOW_CHARS):end].encode('utf-8')
+            if forced or (span_tokens >= minimum and zlib.crc32(window) < (1 << 32) * min(tokens / target, 1)):
+                yield span_start, end, span_tokens
+                span_start, span_tokens = None, 0
+        if span_start is not None:
+            yield span_start, len(text), span_tokens
+    
+    def _content_defined_units(self, text: str, paragraphs: List[Tuple[int, int]],
+                               counts: List[float]) -> Iterator[Tuple[int, int, float, bool]]:
+        """Yield (start, end, tokens, forced cut after) of paragraphs, splitting oversize ones by sentences"""
+        for (start, end), tokens in zip(paragraphs, counts):
+            if tokens > self.max_tokens - self.overlap_tokens:
+                for part_start, part_end, part_tokens in self._split_large_section(text, start, end, "paragraph"):
+                    yield part_start, part_end, part_tokens, True
+            else:
+                yield start, end, tokens, False
+    
+    def _create_chunk(self, document: str, number: int, overlap_start: int, start: int, end: int,
+                      tokens: int, info: str) -> Chunk:
+        """Create a chunk for document[overlap_start:end] with surrounding whitespace trimmed"""
+        while overlap_start < end and document[overlap_start].isspace():
+            overlap_start += 1
+        while end > overlap_start and document[end - 1].isspace():
+            end -= 1
+        start = min(max(start, overlap_start), end)
+        return Chunk(
+            source=document,
+            chunk_number=number,
+            overlap_start=overlap_start,
+            start=start,
+            end=end,
+            token_estimate=int(tokens),
+            section_info=info,
+            word_count=len(document[overlap_start:end].split())
+        )
+    
+    def _identify_sections(self, text: str) -> List[Dict[str, Any]]:
+        """
+        Identify logical sections in the text. Sections are consecutive spans
+        of the text: every character belongs to exactly one section.
         
         Args:
             text: Text to analyze
             
         Returns:
-            List of section dictionaries
+            List of section dictionaries with title, content, start and end
+            offsets, heading level and heading path
         """
-        sections = []
+        if not text.strip():
+            return []
         
-        # Split by headers (markdown style)
-        header_pattern = r'\n(#{1,6}\s+.*?)\n'
-        parts = re.split(header_pattern, text)
-        
-        if len(parts) == 1:
+        headings = list(HEADER_PATTERN.finditer(text))
+        if not headings:
             # No clear headers, split by paragraphs
-            sections = self._split_by_paragraphs(text)
-        else:
-            # Process parts with headers
-            sections = self._process_header_sections(parts)
-        
-        # Filter out empty sections
-        sections = [s for s in sections if s['content'].strip()]
-        
-        return sections
+            return self._split_by_paragraphs(text)
+        return self._process_header_sections(text, headings)
     
-    def _split_by_paragraphs(self, text: str) -> List[Dict[str, str]]:
+    def _split_by_paragraphs(self, text: str) -> List[Dict[str, Any]]:
         """Split text by paragraphs when no headers are found"""
-        paragraphs = [p.strip() for p in text.split('\n\n') if p.strip()]
         sections = []
-        current_section = ""
-        section_count = 1
-        
-        for para in paragraphs:
-            if len(current_section) + len(para) > 2000:  # Rough section size
-                if current_section:
-                    sections.append({
-                        'title': f"Section {section_count}",
-                        'content': current_section.strip()
-                    })
-                    section_count += 1
-                current_section = para
-            else:
-                current_section = current_section + "\n\n" + para if current_section else para
-        
-        if current_section:
-            sections.append({
-                'title': f"Section {section_count}",
-                'content': current_section.strip()
-            })
-        
+        section_start = 0
+        breaks = self._boundaries_for(text).paragraph_breaks()
+        for index, (break_start, break_end) in enumerate(breaks):
+            # Start a new section at a paragraph that would take it past the rough section size
+            if break_end == len(text):
+                break
+            paragraph_end = breaks[index + 1][0] if index + 1 < len(breaks) else len(text)
+            if section_start < break_start and paragraph_end - section_start > PARAGRAPH_SECTION_CHARS:
+                sections.append(self._section(text, section_start, break_end, f"Section {len(sections) + 1}"))
+                section_start = break_end
+        
+        sections.append(self._section(text, section_start, len(text), f"Section {len(sections) + 1}"))
         return sections
     
-    def _process_header_sections(self, parts: List[str]) -> List[Dict[str, str]]:
-        """Process text parts that contain headers"""
+    def _process_header_sections(self, text: str, headings: List[re.Match]) -> List[Dict[str, Any]]:
+        """
+        Split text at its markdown headings. Each section runs from its heading
+        to the next heading and records the headings above it.
+        """
         sections = []
         
-        for i in range(0, len(parts)):
-            if i % 2 == 1:  # This is a header
-                header = parts[i].strip()
-                # Get content after this header
-                content_parts = []
-                
-                # Add content before header if it exists and is substantial
-                if i > 0 and parts[i-1].strip():
-                    content_parts.append(parts[i-1].strip())
-                
-                # Add content after header
-                if i + 1 < len(parts):
-                    content_parts.append(parts[i+1].strip())
-                
-                content = "\n\n".join(content_parts)
-                
-                if content.strip():
-                    sections.append({
-                        'title': header,
-                        'content': content
-                    })
-        
-        # Handle case where first part is content without header
-        if len(parts) > 0 and parts[0].strip() and not parts[0].startswith('#'):
-            sections.insert(0, {
-                'title': "Introduction",
-                'content': parts[0].strip()
-            })
+        # Text before the first heading is its own section, or joins the
+        # first one when it's only whitespace
+        first_start = headings[0].start()
+        if text[:first_start].strip():
+            sections.append(self._section(text, 0, first_start, "Introduction"))
+        else:
+            first_start = 0
+        
+        path = []  # (level, title) of the headings enclosing the current one
+        for index, heading in enumerate(headings):
+            level = len(heading.group(1))
+            title = heading.group(2).strip()
+            while path and path[-1][0] >= level:
+                path.pop()
+            path.append((level, title))
+            
+            start = first_start if index == 0 else heading.start()
+            end = headings[index + 1].start() if index + 1 < len(headings) else len(text)
+            sections.append(self._section(text, start, end, title, level,
+                                          " > ".join(t for _, t in path)))
         
         return sections
     
-    def _split_large_section(self, content: str, title: str) -> List[str]:
+    @staticmethod
+    def _section(text: str, start: int, end: int, title: str, level: int = 0,
+                 path: str = None) -> Dict[str, Any]:
+        return {
+            'title': title,
+            'content': text[start:end],
+            'start': start,
+            'end': end,
+            'level': level,
+            'path': path or title,
+        }
+    
+    def _split_large_section(self, document: str, start: int, end: int, title: str) -> List[Tuple[int, int, int]]:
         """
         Split a large section into smaller chunks
         
+        Sentences are packed with a running token count, so the section is
+        scanned once and no text is copied into the chunks.
+        
         Args:
-            content: Content to split
+            document: String holding the section
+            start: Offset of the section in document
+            end: Offset one past the end of the section
             title: Section title for logging
             
         Returns:
-            List of content chunks
+            List of (start, end, token count) tuples of document offsets
         """
         logger.info(f"Splitting large section: {title}")
         
         # Try to split by sentences first
-        sentences = re.split(r'(?<=[.!?])\s+', content)
-        chunks = []
-        current_chunk = ""
+        sentences = self._boundaries_for(document).sentences(start, end)
+        return self._pack_pieces(document, sentences, split_oversized=self._split_by_words)
+    
+    def _split_by_words(self, document: str, start: int, end: int) -> List[Tuple[int, int, int]]:
+        """Split document[start:end] by words when sentences are too long"""
+        words = [(match.start(), match.end()) for match in WORD_PATTERN.finditer(document, start, end)]
+        return self._pack_pieces(document, words)
+    
+    def _pack_pieces(self, document: str, pieces: List[Tuple[int, int]],
+                     split_oversized=None) -> List[Tuple[int, int, int]]:
+        """
+        Group consecutive pieces into spans of at most max_tokens
         
-        for sentence in sentences:
-            test_chunk = current_chunk + " " + sentence if current_chunk else sentence
+        Args:
+            document: String holding the pieces
+            pieces: (start, end) offsets of sentences or words in text order
+            split_oversized: Splitter for a piece that exceeds max_tokens on its
+                own (None keeps such a piece as its own span)
             
-            if self.estimate_tokens(test_chunk) > self.max_tokens:
-                if current_chunk:
-                    chunks.append(current_chunk.strip())
-                    current_chunk = sentence
-                else:
-                    # Single sentence is too long, split by words
-                    word_chunks = self._split_by_words(sentence)
-                    chunks.extend(word_chunks)
-            else:
-                current_chunk = test_chunk
-        
-        if current_chunk:
-            chunks.append(current_chunk.strip())
-        
-        return chunks
-    
-    def _split_by_words(self, text: str) -> List[str]:
-        """Split text by words when sentences are too long"""
-        words = text.split()
+        Returns:
+            List of (start, end, token count) tuples
+        """
+        counts = self.token_counter.count_batch([document[a:b] for a, b in pieces])
+        space_tokens = self.token_counter.count(" ")
         chunks = []
-        current_chunk = ""
+        current_start = current_end = None
+        current_tokens = 0
         
-        for word in words:
-            test_chunk = current_chunk + " " + word if current_chunk else word
+        for (piece_start, piece_end), piece_tokens in zip(pieces, counts):
+            if current_end is not None and current_tokens + space_tokens + piece_tokens <= self.max_tokens:
+                current_end = piece_end
+                current_tokens += space_tokens + piece_tokens
+                continue
+            
+            if current_end is not None:
+                chunks.append((current_start, current_end, current_tokens))
+                current_start = current_end = None
+                current_tokens = 0
             
-            if self.estimate_tokens(test_chunk) > self.max_tokens:
-                if current_chunk:
-                    chunks.append(current_chunk.strip())
-                current_chunk = word
+            if piece_tokens > self.max_tokens and split_oversized is not None:
+                # Single piece is too long, split it further
+                chunks.extend(split_oversized(document, piece_start, piece_end))
             else:
-                current_chunk = test_chunk
+                current_start, current_end = piece_start, piece_end
+                current_tokens = piece_tokens
         
-        if current_chunk:
-            chunks.append(current_chunk.strip())
+        if current_end is not None:
+            chunks.append((current_start, current_end, current_tokens))
         
         return chunks
     
-    def _get_overlap_text(self, text: str) -> str:
+    def _get_overlap_start(self, document: str, chunk_start: int, chunk_end: int,
+                           chunk_tokens: int) -> Tuple[int, int]:
         """
-        Get the last part of text for overlap between chunks
+        Find where the overlap with the next chunk starts: the last whole
+        sentences of document[chunk_start:chunk_end], up to overlap_tokens
         
         Args:
-            text: Source text
+            document: String holding the chunk
+            chunk_start: Offset of the chunk (including its own overlap)
+            chunk_end: Offset one past the end of the chunk
+            chunk_tokens: Token count of the chunk
             
         Returns:
-            Overlap text
+            Tuple of (overlap start offset, overlap token count)
         """
-        target_length = self.overlap_tokens * 4  # Rough character equivalent
-        
-        if len(text) <= target_length:
-            return text
-        
-        # Find a good breaking point (sentence boundary)
-        overlap_start = len(text) - target_length
-        overlap_text = text[overlap_start:]
-        
-        # Try to start at a sentence boundary
-        sentences = re.split(r'(?<=[.!?])\s+', overlap_text)
-        
-        if len(sentences) > 1:
-            return " ".join(sentences[1:])  # Skip partial first sentence
-        else:
-            return overlap_text
+        if self.overlap_tokens <= 0:
+            return chunk_end, 0
+        if chunk_tokens <= self.overlap_tokens:
+            return chunk_start, chunk_tokens
+        
+        # Only the end of the chunk can hold the overlap; skip the partial first sentence
+        scan_start = max(chunk_start, chunk_end - self.overlap_tokens * OVERLAP_SCAN_CHARS_PER_TOKEN)
+        sentences = self._boundaries_for(document).sentences(scan_start, chunk_end)[1:]
+        
+        sentence_counts = self.token_counter.count_batch([document[a:b] for a, b in sentences])
+        space_tokens = self.token_counter.count(" ")
+        
+        # Take whole sentences from the end while they fit
+        first = len(sentences)
+        overlap_tokens = 0
+        while first > 0:
+            added = sentence_counts[first - 1] + (space_tokens if first < len(sentences) else 0)
+            if overlap_tokens + added > self.overlap_tokens:
+                break
+            overlap_tokens += added
+            first -= 1
+        
+        if first == len(sentences):
+            # Not even the last sentence fits; fall back to the rough character tail
+            overlap_start = max(chunk_start, chunk_end - self.overlap_tokens * 4)
+            return overlap_start, self.token_counter.count(document[overlap_start:chunk_end])
+        return sentences[first][0], overlap_tokens
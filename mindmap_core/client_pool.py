@@ -0,0 +1,92 @@
+"""
+Process-wide pool of OpenAI clients
+
+Every MindMapCreator used to build its own openai.OpenAI client, so each
+job opened new connections and paid the TLS handshakes again. Clients are
+now shared by every job and pipeline stage using the same API key and base
+URL. Their connection pools keep connections alive between requests, with
+limits sized for the concurrent chunk analysis. A client that hasn't been
+handed out for LLM_CLIENT_IDLE_SECONDS is dropped from the registry; its
+connections close once the last job still holding it finishes.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from typing import Dict, Tuple
+
+import openai
+
+try:
+    import httpx
+except ImportError:  # openai builds that ship their HTTP client under another name
+    import httpx2 as httpx
+
+from .web_config import Config
+
+_clients: Dict[str, Tuple[openai.OpenAI, float]] = {}
+_clients_lock = threading.Lock()
+
+
+def _client_id(api_key: str, base_url: str) -> str:
+    """Identify a client without keeping the key itself in the registry."""
+    return hashlib.sha256(f"{api_key or ''}\0{base_url or ''}".encode("utf-8")).hexdigest()
+
+
+def _create_client(api_key: str, base_url: str, config: Config) -> openai.OpenAI:
+    http_client = openai.DefaultHttpxClient(
+        limits=httpx.Limits(max_connections=config.LLM_HTTP_MAX_CONNECTIONS,
+                            max_keepalive_connections=config.LLM_HTTP_MAX_KEEPALIVE,
+                            keepalive_expiry=config.LLM_HTTP_KEEPALIVE_SECONDS),
+        timeout=httpx.Timeout(config.LLM_HTTP_TIMEOUT_SECONDS, connect=10.0)
+    )
+    # Retries are left to the rate limiter (see rate_limiter.py)
+    return openai.OpenAI(api_key=api_key, base_url=base_url, max_retries=0, http_client=http_client)
+
+
+def get_openai_client(api_key: str, base_url: str = None, config: Config = None) -> openai.OpenAI:
+    """
+    Client shared by every caller using the same API key and base URL in this process
+
+    Args:
+        api_key: API key of the client
+        base_url: API base URL (defaults to OPENAI_BASE_URL, then the OpenAI API)
+        config: Configuration (defaults to Config())
+
+    Returns:
+        The pooled client
+    """
+    config = config or Config()
+    base_url = base_url or os.getenv("OPENAI_BASE_URL") or None
+    client_id = _client_id(api_key, base_url)
+    now = time.monotonic()
+    with _clients_lock:
+        _evict_idle(now, config.LLM_CLIENT_IDLE_SECONDS)
+        client = _clients[client_id][0] if client_id in _clients else _create_client(api_key, base_url, config)
+        _clients[client_id] = (client, now)
+        return client
+
+
+def evict_idle_clients(idle_seconds: float = None) -> int:
+    """
+    Drop clients that haven't been handed out for `idle_seconds`
+
+    Args:
+        idle_seconds: Idle time before a client is dropped (defaults to config.LLM_CLIENT_IDLE_SECONDS)
+
+    Returns:
+        Number of clients dropped
+    """
+    if idle_seconds is None:
+        idle_seconds = Config.LLM_CLIENT_IDLE_SECONDS
+    with _clients_lock:
+        return _evict_idle(time.monotonic(), idle_seconds)
+
+
+def _evict_idle(now: float, idle_seconds: float) -> int:
+    """Drop idle clients (lock held). Jobs still holding one keep using it until they finish."""
+    idle = [client_id for client_id, (_, last_used) in _clients.items() if now - last_used >= idle_seconds]
+    for client_id in idle:
+        del _clients[client_id]
+    return len(idle)
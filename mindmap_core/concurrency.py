@@ -0,0 +1,42 @@
+"""
+Per-API-key limits on concurrent LLM requests
+
+Chunk analysis fans its question sets out over a thread pool. Every
+request made with the same API key, from any extractor in the process,
+takes a slot from that key's semaphore while it is in flight (see
+rate_limiter.RateLimitedClient), so parallel chapters and jobs together
+stay within the key's concurrency limit.
+"""
+
+import hashlib
+import threading
+from typing import Dict
+
+_key_slots: Dict[str, threading.BoundedSemaphore] = {}
+_key_slots_lock = threading.Lock()
+
+
+def _key_id(api_key: str) -> str:
+    """Identify a key without keeping the key itself in the registry."""
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()
+
+
+def get_key_semaphore(api_key: str, limit: int) -> threading.BoundedSemaphore:
+    """
+    Semaphore shared by every request made with `api_key` in this process.
+
+    Args:
+        api_key: API key the requests are made with
+        limit: Concurrent requests allowed for the key (the first caller's
+            limit is kept)
+
+    Returns:
+        The key's semaphore
+    """
+    key_id = _key_id(api_key)
+    with _key_slots_lock:
+        semaphore = _key_slots.get(key_id)
+        if semaphore is None:
+            semaphore = _key_slots[key_id] = threading.BoundedSemaphore(max(limit, 1))
+        return semaphore
+
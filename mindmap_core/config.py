@@ -33,6 +33,37 @@ class Config:
     MAX_TOKENS_PER_CHUNK = int(os.getenv("MAX_TOKENS_PER_CHUNK", "8000"))
     OVERLAP_TOKENS = int(os.getenv("OVERLAP_TOKENS", "500"))
     CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "500"))  # Alias for consistency
+    TOKEN_COUNTER = os.getenv("TOKEN_COUNTER", "tiktoken")  # "tiktoken" or "characters"
+    CHUNK_PACKING = os.getenv("CHUNK_PACKING", "balanced")  # "balanced", "greedy" or "content_defined"
+    CHUNK_ANALYSIS_CACHE_ENTRIES = int(os.getenv("CHUNK_ANALYSIS_CACHE_ENTRIES", "512"))
+    CHUNK_ANALYSIS_CACHE_DIR = os.getenv("CHUNK_ANALYSIS_CACHE_DIR") or None
+    CHUNK_ANALYSIS_CACHE_MAX_MB = int(os.getenv("CHUNK_ANALYSIS_CACHE_MAX_MB", "200"))  # Disk tier size limit
+    CHUNK_QUEUE_SIZE = int(os.getenv("CHUNK_QUEUE_SIZE", "4"))
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))  # Per API key
+    CHUNK_ANALYSIS_MODE = os.getenv("CHUNK_ANALYSIS_MODE", "question_sets")  # "question_sets" or "structured"
+    CHUNK_ANALYSIS_MODES = os.getenv("CHUNK_ANALYSIS_MODES", "")  # Per model: "model=mode,..."
+    PROMPT_OUTPUT_TOKENS = int(os.getenv("PROMPT_OUTPUT_TOKENS", "4000"))  # Reserved for the response
+    DEFAULT_CONTEXT_TOKENS = int(os.getenv("DEFAULT_CONTEXT_TOKENS", "128000"))  # Models without "max_tokens"
+    CAPTURE_TEXT_TOKENS = int(os.getenv("CAPTURE_TEXT_TOKENS", "8000"))  # Chapter text per CAPTURE analysis
+    CAPTURE_SYNTHESIS_TOKENS = int(os.getenv("CAPTURE_SYNTHESIS_TOKENS", "4000"))  # Data per CAPTURE synthesis
+    MINDMAP_INPUT_TOKENS = int(os.getenv("MINDMAP_INPUT_TOKENS", "1500"))  # Synthesis data per mind map
+    NOTES_INPUT_TOKENS = int(os.getenv("NOTES_INPUT_TOKENS", "1000"))  # Synthesis data per notes prompt
+    LLM_RESPONSE_CACHE_PATH = os.getenv("LLM_RESPONSE_CACHE_PATH") or None  # SQLite file, unset disables
+    LLM_RESPONSE_CACHE_MAX_MB = int(os.getenv("LLM_RESPONSE_CACHE_MAX_MB", "200"))
+    LLM_RESPONSE_CACHE_TTL_HOURS = float(os.getenv("LLM_RESPONSE_CACHE_TTL_HOURS", "168"))
+    LLM_RATE_LIMIT_RPM = int(os.getenv("LLM_RATE_LIMIT_RPM", "500"))  # Until x-ratelimit-* headers arrive
+    LLM_RATE_LIMIT_TPM = int(os.getenv("LLM_RATE_LIMIT_TPM", "200000"))
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "6"))
+    LLM_BACKOFF_SECONDS = float(os.getenv("LLM_BACKOFF_SECONDS", "1"))
+    LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "60"))
+    LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "20"))  # Per pooled client
+    LLM_HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "10"))
+    LLM_HTTP_KEEPALIVE_SECONDS = float(os.getenv("LLM_HTTP_KEEPALIVE_SECONDS", "90"))
+    LLM_HTTP_TIMEOUT_SECONDS = float(os.getenv("LLM_HTTP_TIMEOUT_SECONDS", "600"))
+    LLM_CLIENT_IDLE_SECONDS = float(os.getenv("LLM_CLIENT_IDLE_SECONDS", "600"))
+    BATCH_JOB_DIR = os.getenv("BATCH_JOB_DIR", "batch_jobs")  # Batch ids of submitted batch API jobs
+    BATCH_POLL_SECONDS = float(os.getenv("BATCH_POLL_SECONDS", "60"))
+    BATCH_COMPLETION_WINDOW = os.getenv("BATCH_COMPLETION_WINDOW", "24h")
     
     # File Settings
     OUTPUT_DIRECTORY = Path(os.getenv("OUTPUT_DIRECTORY", "output"))
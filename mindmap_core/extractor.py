@@ -5,27 +5,106 @@ Knowledge extraction module for analyzing text chunks
 import json
 import re
 import logging
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Any
-import openai
+from typing import Any, Dict, Iterator, List
 from .web_config import Config
-from .chunker import SmartTextChunker
+from .analysis_cache import ChunkAnalysisCache, get_analysis_cache
+from .client_pool import get_openai_client
+from .chunker import Chunk, SmartTextChunker
+from .prompt_budget import TEXT_SLOT, PromptBudget
+from .rate_limiter import rate_limited_client
+from .response_cache import cached_client, forget_response
 from .capture_framework import CAPTUREFramework
 
 logger = logging.getLogger(__name__)
 
+# Marks the end of the chunk stream in the chunk queue
+_END_OF_CHUNKS = object()
+
+# "question_sets" sends one request per question set, "structured" one request per chunk
+ANALYSIS_MODES = ("question_sets", "structured")
+
+# PromptBudget scaffold name of the structured prompt (question set prompts use the set's name)
+STRUCTURED_SCAFFOLD = "structured_analysis"
+
+# Answers to one question set, as requested by the focused prompts
+_QUESTION_SET_SCHEMA = {
+    "type": "object",
+    "properties": {f"question_{number}": {"type": "array", "items": {"type": "string"}} for number in range(1, 5)},
+    "required": [f"question_{number}" for number in range(1, 5)],
+    "additionalProperties": False
+}
+
 class KnowledgeExtractor:
     """
     Extracts knowledge and insights from text using AI
     """
     
-    def __init__(self, api_key: str = None, model: str = None):
+    # Question sets (4 questions each for better model performance)
+    QUESTION_SETS = [
+        {
+            "name": "core_concepts",
+            "questions": [
+                "What are the main concepts or ideas presented?",
+                "What key terminology or definitions are introduced?", 
+                "What fundamental principles are explained?",
+                "What core themes emerge from this section?"
+            ]
+        },
+        {
+            "name": "evidence_insights",
+            "questions": [
+                "What evidence, examples, or data support the main ideas?",
+                "What historical cases or real-world examples are provided?",
+                "What deeper insights or implications can be drawn?",
+                "What patterns or trends are highlighted?"
+            ]
+        },
+        {
+            "name": "relationships_applications", 
+            "questions": [
+                "How do the concepts relate to each other?",
+                "What cause-and-effect relationships are described?",
+                "How can these ideas be applied practically?",
+                "What connections exist with broader themes?"
+            ]
+        },
+        {
+            "name": "critical_thinking",
+            "questions": [
+                "What questions is the author trying to answer?",
+                "What problems or challenges are being addressed?",
+                "What contradictions or tensions are present?",
+                "What actionable takeaways can be derived?"
+            ]
+        }
+    ]
+    
+    # Strict JSON schema of the structured mode's answer: one object per question set
+    ANALYSIS_SCHEMA = {
+        "type": "object",
+        "properties": {question_set["name"]: _QUESTION_SET_SCHEMA for question_set in QUESTION_SETS},
+        "required": [question_set["name"] for question_set in QUESTION_SETS],
+        "additionalProperties": False
+    }
+    
+    def __init__(self, api_key: str = None, model: str = None, max_concurrency: int = None,
+                 analysis_mode: str = None):
         """
         Initialize the knowledge extractor
         
         Args:
             api_key: OpenAI API key
             model: AI model to use
+            max_concurrency: Concurrent analysis requests per API key
+                (defaults to config.LLM_MAX_CONCURRENCY)
+            analysis_mode: "question_sets" asks each question set in its own
+                request, "structured" asks all of them in one request with a
+                JSON schema (defaults to the model's mode, see _analysis_mode_for)
         """
         self.config = Config()
         self.api_key = api_key or self.config.OPENAI_API_KEY
@@ -33,18 +112,36 @@ class KnowledgeExtractor:
             raise ValueError("OpenAI API key is required")
             
         self.model = model or self.config.DEFAULT_MODEL
-        self.client = openai.OpenAI(api_key=self.api_key)
+        self.max_concurrency = max(max_concurrency or self.config.LLM_MAX_CONCURRENCY, 1)
+        # Shared by every stage of the pipeline, so all of them use the pooled connections, the
+        # response cache and the key's rate limits and concurrency slots (retrying in place of the client)
+        self.client = cached_client(
+            rate_limited_client(get_openai_client(self.api_key, config=self.config), self.api_key, self.config,
+                                self.max_concurrency),
+            self.config
+        )
         
         # Get model-specific configuration
         model_config = self.config.get_model_config(self.model)
+        self.analysis_mode = analysis_mode or self._analysis_mode_for(self.model, model_config)
+        if self.analysis_mode not in ANALYSIS_MODES:
+            raise ValueError(f"Unknown analysis mode '{self.analysis_mode}', expected one of {ANALYSIS_MODES}")
+        # Chunks are sized so the prompt sends each of them whole
+        self.prompt_budget = PromptBudget(self.model, model_config, self.config)
         self.chunker = SmartTextChunker(
             config=self.config,
-            max_tokens=model_config['chunk_size'],
-            overlap_tokens=self.config.CHUNK_OVERLAP_TOKENS
+            max_tokens=self._chunk_tokens(model_config),
+            overlap_tokens=self.config.CHUNK_OVERLAP_TOKENS,
+            model=self.model
         )
         
+        # Analyses of chunks seen before (same text and model) are reused
+        self.analysis_cache = get_analysis_cache(self.config.CHUNK_ANALYSIS_CACHE_ENTRIES,
+                                                 self.config.CHUNK_ANALYSIS_CACHE_DIR,
+                                                 self.config.CHUNK_ANALYSIS_CACHE_MAX_MB)
+        
         # Initialize CAPTURE framework for enhanced analysis
-        self.capture_framework = CAPTUREFramework(self.client, self.model)
+        self.capture_framework = CAPTUREFramework(self.client, self.model, self.prompt_budget)
         
     def process_file(self, file_path: str) -> Dict[str, Any]:
         """
@@ -85,32 +182,73 @@ class KnowledgeExtractor:
         """
         logger.info(f"Starting insight extraction for: {title}")
         
-        # Step 1: Apply CAPTURE framework for comprehensive analysis
-        capture_analysis = self.capture_framework.apply_capture_analysis(text, title)
-        logger.info("Completed CAPTURE framework analysis")
-        
-        # Step 2: Chunk the text intelligently
-        chunks = self.chunker.chunk_by_sections(text, title)
-        logger.info(f"Created {len(chunks)} chunks for analysis")
+        # Step 1: Run the CAPTURE framework in the background; chunk analysis
+        # doesn't depend on it, so the first chunk goes out right away
+        capture_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="capture")
+        capture_future = capture_executor.submit(self.capture_framework.apply_capture_analysis, text, title)
         
-        # Step 3: Analyze each chunk
+        # Step 2: Chunk the text intelligently, fanning the question sets of
+        # every chunk out over one pool as soon as the chunk is cut
+        chunks = []
         chunk_analyses = []
-        for i, chunk in enumerate(chunks, 1):
-            logger.info(f"Analyzing chunk {i}/{len(chunks)} ({chunk['token_estimate']} tokens)")
+        pending = deque()  # (chunk, cache key, futures) of chunks still being analysed
+        reused = 0
+        analysis_pool = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="analysis")
+        try:
+            for chunk in self._stream_chunks(text, title):
+                if capture_future.done() and capture_future.exception() is not None:
+                    break  # Raised below, like a CAPTURE failure before chunking
+                chunks.append(chunk)
+                
+                cache_key = ChunkAnalysisCache.make_key(self.model, chunk.content_hash)
+                cached = self.analysis_cache.get(cache_key)
+                if cached is not None:
+                    logger.info(f"Reusing analysis of chunk {len(chunks)} (unchanged text)")
+                    reused += 1
+                    pending.append((chunk, cache_key, cached))
+                    continue
+                
+                logger.info(f"Analyzing chunk {len(chunks)} ({chunk.token_estimate} tokens)")
+                pending.append((chunk, cache_key, self._submit_question_sets(analysis_pool, chunk, title)))
+                
+                # Enough chunks in flight to fill every slot: finish the oldest before cutting more
+                while sum(not isinstance(item[2], dict) for item in pending) > self.max_concurrency:
+                    chunk_analyses.append(self._finish_chunk(*pending.popleft()))
             
-            try:
-                analysis = self._analyze_chunk(chunk, title)
-                chunk_analyses.append({
-                    'chunk_info': chunk,
-                    'analysis': analysis
-                })
-            except Exception as e:
-                logger.error(f"Error analyzing chunk {i}: {str(e)}")
-                chunk_analyses.append({
-                    'chunk_info': chunk,
-                    'analysis': {'error': str(e)}
-                })
+            while pending:
+                chunk_analyses.append(self._finish_chunk(*pending.popleft()))
+            
+            capture_analysis = capture_future.result()
+            logger.info("Completed CAPTURE framework analysis")
+        finally:
+            analysis_pool.shutdown(wait=True, cancel_futures=True)
+            capture_executor.shutdown(wait=True)
+        logger.info(f"Analyzed {len(chunks)} chunks")
+        
+        return self._assemble_insights(title, chunks, chunk_analyses, capture_analysis, reused)
+    
+    def extract_insights_from_analyses(self, text: str, title: str, chunks: List[Chunk],
+                                       chunk_analyses: List[Dict[str, Any]], reused: int = 0) -> Dict[str, Any]:
+        """
+        Complete extract_insights for chunks analysed elsewhere (e.g. through the batch API)
         
+        Args:
+            text: Text the chunks were cut from
+            title: Title for context
+            chunks: Chunks of the text
+            chunk_analyses: Entries of the chunks, as built by _chunk_entry
+            reused: Analyses taken from the analysis cache
+            
+        Returns:
+            Dictionary containing all extracted insights, like extract_insights
+        """
+        capture_analysis = self.capture_framework.apply_capture_analysis(text, title)
+        logger.info("Completed CAPTURE framework analysis")
+        return self._assemble_insights(title, chunks, chunk_analyses, capture_analysis, reused)
+    
+    def _assemble_insights(self, title: str, chunks: List[Chunk], chunk_analyses: List[Dict[str, Any]],
+                           capture_analysis: Dict[str, Any], reused: int) -> Dict[str, Any]:
+        """Synthesize the chunk analyses and build the result of extract_insights"""
         # Step 3: Synthesize insights (will be done by synthesizer module)
         from .synthesizer import InsightSynthesizer
         synthesizer = InsightSynthesizer(self.client, self.model)
@@ -121,7 +259,8 @@ class KnowledgeExtractor:
                 'title': title,
                 'model': self.model,
                 'total_chunks': len(chunks),
-                'total_tokens': sum(c['token_estimate'] for c in chunks),
+                'total_tokens': sum(c.token_estimate for c in chunks),
+                'reused_chunk_analyses': reused,
                 'processing_timestamp': self._get_timestamp(),
                 'capture_framework_applied': True
             },
@@ -130,91 +269,270 @@ class KnowledgeExtractor:
             'capture_analysis': capture_analysis
         }
     
-    def _analyze_chunk(self, chunk: Dict[str, Any], title: str) -> Dict[str, Any]:
+    def _finish_chunk(self, chunk: Chunk, cache_key: str, work) -> Dict[str, Any]:
+        """
+        Build a chunk's entry in chunk_analyses
+        
+        Args:
+            chunk: Analysed chunk
+            cache_key: Key of the chunk's analysis in the analysis cache
+            work: Cached analysis, or the futures of its question sets
+            
+        Returns:
+            Dictionary with the chunk info and its analysis
+        """
+        if isinstance(work, dict):
+            analysis = work
+        else:
+            try:
+                analysis = self._collect_question_sets(work)
+                if not self._has_failed_sets(analysis):
+                    self.analysis_cache.put(cache_key, analysis)
+            except Exception as e:
+                logger.error(f"Error analyzing chunk {chunk.chunk_number}: {str(e)}")
+                analysis = {'error': str(e)}
+        return self._chunk_entry(chunk, analysis)
+    
+    @staticmethod
+    def _chunk_entry(chunk: Chunk, analysis: Dict[str, Any]) -> Dict[str, Any]:
+        """A chunk's entry in chunk_analyses"""
+        return {
+            'chunk_info': chunk.to_dict(),  # Offsets only, not the text
+            'analysis': analysis
+        }
+    
+    def _stream_chunks(self, text: str, title: str) -> Iterator[Chunk]:
+        """
+        Yield the chunks of text while a background thread cuts them, at
+        most CHUNK_QUEUE_SIZE chunks ahead of the analysis
+        
+        Args:
+            text: Text to chunk
+            title: Title for context
+            
+        Yields:
+            Chunks in text order
+        """
+        chunk_queue = queue.Queue(maxsize=max(self.config.CHUNK_QUEUE_SIZE, 1))
+        stop = threading.Event()
+        
+        def send(item) -> bool:
+            """Queue an item unless the consumer has stopped; whether it was queued"""
+            while not stop.is_set():
+                try:
+                    chunk_queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        
+        def produce():
+            try:
+                for chunk in self.chunker.iter_chunks(text, title):
+                    if not send(chunk):
+                        return
+                send(_END_OF_CHUNKS)
+            except Exception as e:
+                send(e)
+        
+        producer = threading.Thread(target=produce, name="chunker", daemon=True)
+        producer.start()
+        try:
+            while True:
+                item = chunk_queue.get()
+                if item is _END_OF_CHUNKS:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # The consumer stopped early: let the producer exit instead of blocking on a full queue
+            stop.set()
+            producer.join()
+    
+    def _analyze_chunk(self, chunk: Chunk, title: str) -> Dict[str, Any]:
         """
         Analyze a single chunk of text using multiple focused question sets
         
         Args:
-            chunk: Chunk dictionary with content and metadata
+            chunk: Chunk with offsets into the chapter text and metadata
             title: Document title for context
             
         Returns:
             Dictionary containing comprehensive chunk analysis
         """
-        logger.info(f"Analyzing chunk with multi-set approach")
-        
-        # Define question sets (4 questions each for better model performance)
-        question_sets = [
-            {
-                "name": "core_concepts",
-                "questions": [
-                    "What are the main concepts or ideas presented?",
-                    "What key terminology or definitions are introduced?", 
-                    "What fundamental principles are explained?",
-                    "What core themes emerge from this section?"
-                ]
-            },
-            {
-                "name": "evidence_insights",
-                "questions": [
-                    "What evidence, examples, or data support the main ideas?",
-                    "What historical cases or real-world examples are provided?",
-                    "What deeper insights or implications can be drawn?",
-                    "What patterns or trends are highlighted?"
-                ]
-            },
-            {
-                "name": "relationships_applications", 
-                "questions": [
-                    "How do the concepts relate to each other?",
-                    "What cause-and-effect relationships are described?",
-                    "How can these ideas be applied practically?",
-                    "What connections exist with broader themes?"
-                ]
-            },
-            {
-                "name": "critical_thinking",
-                "questions": [
-                    "What questions is the author trying to answer?",
-                    "What problems or challenges are being addressed?",
-                    "What contradictions or tensions are present?",
-                    "What actionable takeaways can be derived?"
-                ]
-            }
-        ]
+        logger.info(f"Analyzing chunk with {self.analysis_mode} approach")
+        
+        # Requests run concurrently; results are combined in QUESTION_SETS order
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="analysis") as pool:
+            return self._collect_question_sets(self._submit_question_sets(pool, chunk, title))
+    
+    def _chunk_tokens(self, model_config: Dict[str, Any]) -> int:
+        """
+        Chunk size: the model's chunk_size, capped by what the analysis prompt can hold
+
+        Args:
+            model_config: The model's configuration
+
+        Returns:
+            Maximum tokens per chunk
+        """
+        # Every analysis prompt's scaffold is counted once here; building a prompt only looks it up
+        empty_chunk = Chunk(source="", chunk_number=0, overlap_start=0, start=0, end=0, token_estimate=0,
+                            section_info="", word_count=0)
+        self.prompt_budget.add_scaffold(STRUCTURED_SCAFFOLD, self._structured_prompt_template(empty_chunk, ""))
+        for question_set in self.QUESTION_SETS:
+            self.prompt_budget.add_scaffold(question_set['name'],
+                                            self._focused_prompt_template(empty_chunk, "", question_set))
+        
+        if self.analysis_mode == "structured":
+            scaffolds = [STRUCTURED_SCAFFOLD]
+        else:
+            scaffolds = [question_set['name'] for question_set in self.QUESTION_SETS]
+        prompt_tokens = min(self.prompt_budget.chunk_tokens(scaffold) for scaffold in scaffolds)
+        return min(model_config.get('chunk_size', self.config.MAX_TOKENS_PER_CHUNK), prompt_tokens)
+    
+    @staticmethod
+    def _analysis_mode_for(model: str, model_config: Dict[str, Any]) -> str:
+        """
+        Analysis mode of a model: its model config's "analysis_mode", then its
+        entry in CHUNK_ANALYSIS_MODES ("model=mode,..."), then CHUNK_ANALYSIS_MODE
+        """
+        if model_config.get('analysis_mode'):
+            return model_config['analysis_mode']
+        for entry in Config.CHUNK_ANALYSIS_MODES.split(','):
+            name, _, mode = entry.partition('=')
+            if name.strip() == model and mode.strip():
+                return mode.strip()
+        return Config.CHUNK_ANALYSIS_MODE
+    
+    def _submit_question_sets(self, executor: ThreadPoolExecutor, chunk: Chunk, title: str) -> List[Future]:
+        """Start the analysis requests of one chunk on `executor`"""
+        if self.analysis_mode == "structured":
+            return [executor.submit(self._run_structured_analysis, chunk, title)]
+        return [executor.submit(self._run_question_sets, chunk, title, [question_set])
+                for question_set in self.QUESTION_SETS]
+    
+    def _collect_question_sets(self, futures: List[Future]) -> Dict[str, Any]:
+        """Wait for a chunk's analysis requests and combine the sets in QUESTION_SETS order"""
+        answers = {}
+        for future in futures:
+            answers.update(future.result())
+        return self._combine_answers(answers)
+    
+    def _combine_answers(self, answers: Dict[str, Any]) -> Dict[str, Any]:
+        """Combine the answers of every question set (keyed by set name) into a chunk analysis"""
+        comprehensive_analysis = {question_set["name"]: answers[question_set["name"]]
+                                  for question_set in self.QUESTION_SETS}
+        
+        # Combine results into unified structure
+        combined = self._combine_analysis_sets(comprehensive_analysis)
+        if 'processing_approach' in answers:
+            combined['processing_approach'] = answers['processing_approach']
+        return combined
+    
+    def _run_question_sets(self, chunk: Chunk, title: str,
+                           question_sets: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Ask question sets about a chunk one request each; answers keyed by set name"""
+        return {question_set["name"]: self._run_question_set(chunk, title, question_set)
+                for question_set in question_sets}
+    
+    def _run_structured_analysis(self, chunk: Chunk, title: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Ask every question set about a chunk in one request whose answer
+        must follow ANALYSIS_SCHEMA
         
-        # Analyze with each question set
-        comprehensive_analysis = {}
+        Args:
+            chunk: Chunk to analyze
+            title: Document title for context
+            
+        Returns:
+            Answers keyed by question set name, shaped like the answers of
+            separate question set requests, plus the processing approach.
+            When the structured request fails
+            (e.g. the model doesn't support JSON schemas) the sets are asked
+            one by one instead.
+        """
+        request = self._structured_request(chunk, title)
+        try:
+            response = self.client.chat.completions.create(**request)
+            
+            try:
+                answers = self._parse_structured_answers(response.choices[0].message.content)
+            except ValueError:
+                forget_response(self.client, request)
+                raise
+            logger.info("[OK] Completed structured analysis")
+            return answers
+            
+        except Exception as e:
+            logger.warning(f"Structured analysis failed, asking question sets separately: {str(e)}")
+            return self._run_question_sets(chunk, title, self.QUESTION_SETS)
+    
+    def _structured_request(self, chunk: Chunk, title: str) -> Dict[str, Any]:
+        """Parameters of the structured analysis request of a chunk"""
+        return {
+            'model': self.model,
+            'messages': [{"role": "user", "content": self._build_structured_prompt(chunk, title)}],
+            'temperature': 0.3,
+            'response_format': {
+                "type": "json_schema",
+                "json_schema": {"name": "chunk_analysis", "strict": True, "schema": self.ANALYSIS_SCHEMA}
+            }
+        }
+    
+    def _parse_structured_answers(self, content: str) -> Dict[str, Any]:
+        """Answers of a structured analysis response, keyed by question set name"""
+        answers = json.loads(content)
+        missing = [qs["name"] for qs in self.QUESTION_SETS if not isinstance(answers.get(qs["name"]), dict)]
+        if missing:
+            raise ValueError(f"Structured analysis is missing {', '.join(missing)}")
+        answers['processing_approach'] = 'structured_single_call'
+        return answers
+    
+    def _run_question_set(self, chunk: Chunk, title: str, question_set: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Ask one question set about a chunk
         
-        for question_set in question_sets:
+        Args:
+            chunk: Chunk to analyze
+            title: Document title for context
+            question_set: Set of 4 related questions
+            
+        Returns:
+            Parsed answers, or an error entry when the request or parsing failed
+        """
+        request = self._question_set_request(chunk, title, question_set)
+        try:
+            response = self.client.chat.completions.create(**request)
+            
+            content = response.choices[0].message.content
+            content = self._clean_json_response(content)
+            
             try:
-                prompt = self._build_focused_prompt(chunk, title, question_set)
-                
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0.3
-                )
-                
-                content = response.choices[0].message.content
-                content = self._clean_json_response(content)
-                
                 set_analysis = json.loads(content)
-                comprehensive_analysis[question_set["name"]] = set_analysis
-                
-                logger.info(f"[OK] Completed {question_set['name']} analysis")
-                
-            except Exception as e:
-                logger.warning(f"Error in {question_set['name']} analysis: {str(e)}")
-                comprehensive_analysis[question_set["name"]] = {
-                    'error': str(e),
-                    'fallback': f"Analysis failed for {question_set['name']}"
-                }
-        
-        # Combine results into unified structure
-        return self._combine_analysis_sets(comprehensive_analysis)
+            except ValueError:
+                forget_response(self.client, request)
+                raise
+            logger.info(f"[OK] Completed {question_set['name']} analysis")
+            return set_analysis
+            
+        except Exception as e:
+            logger.warning(f"Error in {question_set['name']} analysis: {str(e)}")
+            return {
+                'error': str(e),
+                'fallback': f"Analysis failed for {question_set['name']}"
+            }
     
-    def _build_analysis_prompt(self, chunk: Dict[str, Any], title: str) -> str:
+    def _question_set_request(self, chunk: Chunk, title: str, question_set: Dict[str, Any]) -> Dict[str, Any]:
+        """Parameters of the request asking one question set about a chunk"""
+        return {
+            'model': self.model,
+            'messages': [{"role": "user", "content": self._build_focused_prompt(chunk, title, question_set)}],
+            'temperature': 0.3
+        }
+    
+    def _build_analysis_prompt(self, chunk: Chunk, title: str) -> str:
         """
         Build analysis prompt for a chunk
         
@@ -228,11 +546,11 @@ class KnowledgeExtractor:
         return f"""
         Analyze this section from "{title}".
         
-        Section Info: {chunk['section_info']}
-        Word Count: {chunk['word_count']} words
+        Section Info: {chunk.section_info}
+        Word Count: {chunk.word_count} words
         
         Content:
-        {chunk['content']}
+        {chunk.content}
         
         Extract the following information and format as JSON:
         
@@ -250,7 +568,7 @@ class KnowledgeExtractor:
         Focus on actionable and meaningful information. Be thorough but concise.
         """
     
-    def _build_focused_prompt(self, chunk: Dict[str, Any], title: str, question_set: Dict[str, Any]) -> str:
+    def _build_focused_prompt(self, chunk: Chunk, title: str, question_set: Dict[str, Any]) -> str:
         """
         Build focused prompt for a specific question set
         
@@ -262,8 +580,13 @@ class KnowledgeExtractor:
         Returns:
             Formatted prompt string
         """
-        text_content = chunk.get('content', '')
-        section_info = f"Section {chunk.get('section_number', '?')}"
+        return self.prompt_budget.fill(self._focused_prompt_template(chunk, title, question_set),
+                                       chunk.content, f"Chunk {chunk.chunk_number} {question_set['name']}",
+                                       scaffold=question_set['name'], label=f"{title} {chunk.chunk_number}")
+    
+    def _focused_prompt_template(self, chunk: Chunk, title: str, question_set: Dict[str, Any]) -> str:
+        """Focused prompt with TEXT_SLOT in place of the chunk text"""
+        section_info = f"Section {chunk.chunk_number}"
         
         return f"""
         Document: {title} - {section_info}
@@ -271,7 +594,7 @@ class KnowledgeExtractor:
         Focus Area: {question_set['name'].replace('_', ' ').title()}
         
         Text to analyze:
-        {text_content[:4000]}...
+        {TEXT_SLOT}
         
         Please answer these 4 questions with focused, specific responses:
         
@@ -295,6 +618,52 @@ class KnowledgeExtractor:
         }}
         """
     
+    def _build_structured_prompt(self, chunk: Chunk, title: str) -> str:
+        """
+        Build one prompt asking every question set about a chunk
+        
+        Args:
+            chunk: Text chunk to analyze
+            title: Document title
+            
+        Returns:
+            Formatted prompt string
+        """
+        return self.prompt_budget.fill(self._structured_prompt_template(chunk, title), chunk.content,
+                                       f"Chunk {chunk.chunk_number} analysis",
+                                       scaffold=STRUCTURED_SCAFFOLD, label=f"{title} {chunk.chunk_number}")
+    
+    def _structured_prompt_template(self, chunk: Chunk, title: str) -> str:
+        """Structured prompt with TEXT_SLOT in place of the chunk text"""
+        section_info = f"Section {chunk.chunk_number}"
+        focus_areas = "\n".join(
+            f"        {question_set['name']}:\n" + "\n".join(
+                f"          question_{number}: {question}"
+                for number, question in enumerate(question_set['questions'], 1)
+            )
+            for question_set in self.QUESTION_SETS
+        )
+        
+        return f"""
+        Document: {title} - {section_info}
+        
+        Text to analyze:
+        {TEXT_SLOT}
+        
+        Answer the questions of each focus area with focused, specific responses:
+        
+{focus_areas}
+        
+        Requirements:
+        - Provide 2-4 specific points per question
+        - Base answers directly on the text content
+        - Use clear, concise language
+        - Extract actionable insights where possible
+        
+        Return JSON with one object per focus area, holding "question_1" to
+        "question_4" as lists of points.
+        """
+    
     def _clean_json_response(self, content: str) -> str:
         """
         Clean JSON response from AI
@@ -376,6 +745,12 @@ class KnowledgeExtractor:
         
         return combined
     
+    @staticmethod
+    def _has_failed_sets(analysis: Dict[str, Any]) -> bool:
+        """Whether any question set of a chunk analysis failed (such analyses aren't reused)"""
+        return any(isinstance(result, dict) and 'error' in result
+                   for result in analysis.get('raw_analysis_sets', {}).values())
+    
     def _get_timestamp(self) -> str:
         """Get current timestamp"""
         from datetime import datetime
@@ -6,6 +6,7 @@ import json
 import logging
 from typing import Dict, Any
 from .web_config import Config
+from .prompt_budget import TEXT_SLOT, PromptBudget
 
 logger = logging.getLogger(__name__)
 
@@ -14,17 +15,20 @@ class MindMapGenerator:
     Generates Mermaid mind maps from extracted insights
     """
     
-    def __init__(self, openai_client, model: str):
+    def __init__(self, openai_client, model: str, prompt_budget: PromptBudget = None):
         """
         Initialize mind map generator
         
         Args:
             openai_client: OpenAI client instance
             model: AI model to use
+            prompt_budget: Budget the synthesis data is fitted into each prompt with
+                (defaults to the model's budget)
         """
         self.client = openai_client
         self.model = model
         self.config = Config()
+        self.prompt_budget = prompt_budget or PromptBudget(model, self.config.get_model_config(model), self.config)
         self.mindmap_config = self.config.MINDMAP_CONFIG
         
     def generate_mindmap_from_synthesis(self, insights: Dict[str, Any], mindmap_type: str = "comprehensive") -> str:
@@ -103,13 +107,13 @@ class MindMapGenerator:
             'actionable_takeaways': synthesis.get('actionable_takeaways', [])[:6]
         }
         
-        return f"""
+        prompt = f"""
         Create a rich, detailed Mermaid mindmap that captures the specific insights and key concepts from this document analysis.
         
         Document: {title}
         
         Synthesis Data:
-        {json.dumps(synthesis_summary, indent=2)[:3000]}
+        {TEXT_SLOT}
         
         CORRECT MERMAID MINDMAP SYNTAX:
         1. Output ONLY the raw mindmap content (no code fences)
@@ -170,6 +174,8 @@ class MindMapGenerator:
         CRITICAL: Output only the mindmap content without any markdown code fences, explanations, or extra text.
         Start directly with "mindmap" and focus on the specific richness of the actual content. For every node, add a short explanation after a colon.
         """
+        return self.prompt_budget.fill(prompt, json.dumps(synthesis_summary, indent=2), "Mind map",
+                                       limit=self.config.MINDMAP_INPUT_TOKENS)
     
     def _generate_capture_enhanced_mindmap(self, synthesis: Dict[str, Any], capture_analysis: Dict[str, Any], title: str, mindmap_type: str = "comprehensive") -> str:
         """
@@ -231,14 +237,14 @@ class MindMapGenerator:
             'core_concepts': unified_synthesis.get('core_concepts', [])[:8]
         }
         
-        return f"""
+        prompt = f"""
         Create an enhanced Mermaid mindmap using CAPTURE framework analysis for comprehensive understanding.
         
         Document: {title}
         Text Structure: {enhanced_data['text_structure']}
         
         Enhanced Analysis Data:
-        {json.dumps(enhanced_data, indent=2)[:4000]}
+        {TEXT_SLOT}
         
         CORRECT MERMAID MINDMAP SYNTAX:
         1. Output ONLY the raw mindmap content (no code fences)
@@ -308,6 +314,8 @@ class MindMapGenerator:
         Start directly with "mindmap" and use the text structure and CAPTURE analysis to create a comprehensive, well-explained mindmap.
         Every node should have meaningful explanations that help students understand the concepts and their relationships.
         """
+        return self.prompt_budget.fill(prompt, json.dumps(enhanced_data, indent=2), "Mind map (CAPTURE)",
+                                       limit=self.config.MINDMAP_INPUT_TOKENS)
     
     def _create_basic_mindmap(self, insights: Dict[str, Any], title: str) -> str:
         """
@@ -407,7 +415,7 @@ class MindMapGenerator:
             prompt = f"""
             Create a detailed Mermaid flowchart showing relationships between concepts from "{title}".
             
-            Data: {json.dumps(synthesis, indent=2)[:2500]}
+            Data: {TEXT_SLOT}
             
             Use flowchart syntax with:
             - Rectangular nodes [Concept]
@@ -423,6 +431,8 @@ class MindMapGenerator:
             
             Keep it readable with 15-20 nodes maximum.
             """
+            prompt = self.prompt_budget.fill(prompt, json.dumps(synthesis, indent=2), "Detailed mind map",
+                                             limit=self.config.MINDMAP_INPUT_TOKENS)
             
             response = self.client.chat.completions.create(
                 model=self.model,
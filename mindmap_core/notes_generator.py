@@ -6,6 +6,7 @@ import json
 import logging
 from typing import Dict, Any, List
 from .web_config import Config
+from .prompt_budget import TEXT_SLOT, PromptBudget
 
 logger = logging.getLogger(__name__)
 
@@ -15,17 +16,20 @@ class MindMapNotesGenerator:
     for readers who haven't read the source material
     """
     
-    def __init__(self, openai_client, model: str):
+    def __init__(self, openai_client, model: str, prompt_budget: PromptBudget = None):
         """
         Initialize notes generator
         
         Args:
             openai_client: OpenAI client instance
             model: AI model to use
+            prompt_budget: Budget the synthesis data is fitted into each prompt with
+                (defaults to the model's budget)
         """
         self.client = openai_client
         self.model = model
         self.config = Config()
+        self.prompt_budget = prompt_budget or PromptBudget(model, self.config.get_model_config(model), self.config)
     
     def generate_mindmap_notes(self, results: Dict[str, Any], mindmap_content: str) -> str:
         """
@@ -143,7 +147,7 @@ class MindMapNotesGenerator:
             'actionable_takeaways': synthesis.get('actionable_takeaways', [])[:6]
         }
         
-        return f"""
+        prompt = f"""
         Create clear, engaging explanatory notes to accompany this mind map.
         
         Document: {title}
@@ -152,7 +156,7 @@ class MindMapNotesGenerator:
         {mindmap_content}
         
         Synthesis Data:
-        {json.dumps(synthesis_summary, indent=2)[:3000]}
+        {TEXT_SLOT}
         
         TARGET AUDIENCE: Students who haven't read the original book/chapter
         
@@ -190,6 +194,8 @@ class MindMapNotesGenerator:
         
         TONE: Clear, engaging, educational - like a good teacher explaining complex ideas simply.
         """
+        return self.prompt_budget.fill(prompt, json.dumps(synthesis_summary, indent=2), "Notes",
+                                       limit=self.config.NOTES_INPUT_TOKENS)
 
     def _build_capture_enhanced_notes_prompt(self, synthesis: Dict[str, Any], metadata: Dict[str, Any], mindmap_content: str, capture_analysis: Dict[str, Any]) -> str:
         """
@@ -221,7 +227,7 @@ class MindMapNotesGenerator:
             'critical_insights': synthesis.get('critical_insights', [])[:6]
         }
         
-        return f"""
+        prompt = f"""
         Create comprehensive, educational notes using CAPTURE framework analysis to accompany this mind map.
         
         Document: {title}
@@ -236,7 +242,7 @@ class MindMapNotesGenerator:
         - Core Concepts: {unified_synthesis.get('core_concepts', [])[:5]}
         
         Traditional Synthesis:
-        {json.dumps(synthesis_summary, indent=2)[:2000]}
+        {TEXT_SLOT}
         
         TARGET AUDIENCE: Students who haven't read the original content but need deep understanding
         
@@ -281,6 +287,8 @@ class MindMapNotesGenerator:
         
         TONE: Educational, clear, strategy-focused - like an expert teacher explaining both content AND how to understand complex material.
         """
+        return self.prompt_budget.fill(prompt, json.dumps(synthesis_summary, indent=2), "Notes (CAPTURE)",
+                                       limit=self.config.NOTES_INPUT_TOKENS)
     
     def _format_notes(self, notes_content: str, metadata: Dict[str, Any]) -> str:
         """
@@ -0,0 +1,147 @@
+"""
+Prompt budget planning
+
+Every prompt that embeds chapter text (or data derived from it) is built
+around TEXT_SLOT and filled through PromptBudget.fill. The budget for the
+inserted text is what the model context leaves after the response
+reservation and the rest of the prompt, counted with the model's tokenizer,
+so text is only shortened when it cannot fit (and then with a warning)
+instead of being cut to a fixed number of characters. KnowledgeExtractor
+also sizes its chunks from the same budget, so each chunk is sent whole.
+The later stages (CAPTURE, mind maps, notes) don't need the whole context
+and pass their own input limit (CAPTURE_TEXT_TOKENS etc.), which caps the
+text they send, again with a warning.
+
+Prompts built for every chunk register their scaffold (the template for an
+empty chunk) once with add_scaffold; filling them then only looks the
+scaffold's tokens up and counts the chunk's label and text.
+"""
+
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+from .token_counter import TiktokenCounter, get_token_counter
+from .web_config import Config
+
+logger = logging.getLogger(__name__)
+
+# Placeholder for the inserted text in prompt templates
+TEXT_SLOT = "\x00TEXT\x00"
+
+# Tokens kept free for a title or section label that differs from the template used for sizing
+SIZING_MARGIN_TOKENS = 64
+
+
+class PromptBudget:
+    """Input token budget of one model's prompts"""
+
+    def __init__(self, model: str, model_config: Optional[Dict[str, Any]] = None, config: Config = None,
+                 token_counter=None):
+        """
+        Args:
+            model: Model the prompts are sent to
+            model_config: The model's configuration ("max_tokens" is its context size)
+            config: Configuration (defaults to Config())
+            token_counter: Counter for the model's tokens (defaults to
+                get_token_counter(model, config.TOKEN_COUNTER))
+        """
+        self.config = config or Config()
+        model_config = model_config or {}
+        self.context_tokens = model_config.get('max_tokens') or self.config.DEFAULT_CONTEXT_TOKENS
+        self.output_tokens = self.config.PROMPT_OUTPUT_TOKENS
+        self.token_counter = token_counter or get_token_counter(model, self.config.TOKEN_COUNTER)
+        self._scaffolds: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.stats = {'filled_prompts': 0, 'shortened_texts': 0}
+
+    def count(self, text: str) -> int:
+        """Tokens of `text`, without remembering it (prompts are counted once)"""
+        counter = self.token_counter
+        if isinstance(counter, TiktokenCounter):
+            # A counter per call: the memo of a shared one isn't safe across analysis threads
+            counter = TiktokenCounter(counter.encoding)
+        return int(counter.count(text))
+
+    def add_scaffold(self, name: str, template: str) -> int:
+        """
+        Count a prompt scaffold once, for fill(..., scaffold=name)
+
+        Args:
+            name: Name the scaffold is looked up by
+            template: The prompt with TEXT_SLOT, for an empty chunk and title
+
+        Returns:
+            The scaffold's tokens
+        """
+        tokens = self.count(template.replace(TEXT_SLOT, ""))
+        with self._lock:
+            self._scaffolds[name] = tokens
+        return tokens
+
+    def input_tokens(self, template: str) -> int:
+        """
+        Tokens left for the text inserted into a template
+
+        Args:
+            template: Prompt containing TEXT_SLOT
+
+        Returns:
+            Context size minus the response reservation and the template's own tokens
+        """
+        return self._remaining(self.count(template.replace(TEXT_SLOT, "")))
+
+    def _remaining(self, template_tokens: int) -> int:
+        return max(self.context_tokens - self.output_tokens - template_tokens, 0)
+
+    def chunk_tokens(self, scaffold: str) -> int:
+        """Largest chunk (in tokens) that fits whole into a registered scaffold, with room for a longer title"""
+        with self._lock:
+            scaffold_tokens = self._scaffolds[scaffold]
+        return max(self._remaining(scaffold_tokens) - SIZING_MARGIN_TOKENS, 1)
+
+    def fill(self, template: str, text: str, stage: str, scaffold: str = None, label: str = "",
+             limit: int = 0) -> str:
+        """
+        Insert text into a template, shortening it only when it exceeds the budget
+
+        Args:
+            template: Prompt containing TEXT_SLOT
+            text: Text to insert
+            stage: Name of the prompt, for the warning when text is shortened
+            scaffold: Name of the template's registered scaffold (None counts the template)
+            label: Text of the template that its scaffold leaves out (title, section number)
+            limit: The stage's own input budget in tokens (0: whatever fits in the context)
+
+        Returns:
+            The prompt
+        """
+        if scaffold is None:
+            budget = self.input_tokens(template)
+        else:
+            with self._lock:
+                scaffold_tokens = self._scaffolds[scaffold]
+            budget = self._remaining(scaffold_tokens + self.count(label))
+        if limit > 0:
+            budget = min(budget, limit)
+        tokens = self.count(text)
+        with self._lock:
+            self.stats['filled_prompts'] += 1
+            if tokens > budget:
+                self.stats['shortened_texts'] += 1
+        if tokens > budget:
+            logger.warning(f"{stage}: text of {tokens} tokens exceeds the prompt budget of {budget} tokens, "
+                           f"sending its first {budget} tokens")
+            text = self._shorten(text, tokens, budget)
+        return template.replace(TEXT_SLOT, text)
+
+    def _shorten(self, text: str, tokens: int, budget: int) -> str:
+        """Longest prefix of text (ending at a space) within `budget` tokens"""
+        end = len(text) * budget // max(tokens, 1)
+        while end > 0:
+            space = text.rfind(" ", 0, end)
+            end = space if space > 0 else end
+            if self.count(text[:end]) <= budget:
+                return text[:end]
+            end = end * 9 // 10
+        return ""
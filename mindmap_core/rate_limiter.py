@@ -0,0 +1,308 @@
+"""
+Per-API-key rate limit scheduling of LLM requests
+
+Every request made with an API key waits for room in the key's
+requests-per-minute and tokens-per-minute buckets instead of being sent
+into a 429. The buckets start from the configured limits and follow the
+x-ratelimit-* headers of the responses, so they track the account's real
+limits and the usage of other processes sharing the key. Requests that are
+still rate limited (or hit a transient server error) are retried with
+jittered exponential backoff rather than failing the stage that made them.
+A request takes one of the key's concurrency slots only once it has its
+budget, and gives it back before any backoff, so waiting requests never
+hold slots that other chapters could be sending with.
+"""
+
+import contextlib
+import hashlib
+import logging
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import openai
+
+from .concurrency import get_key_semaphore
+from .web_config import Config
+
+logger = logging.getLogger(__name__)
+
+DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+# Characters per token of the estimate a request is scheduled with (corrected by its usage)
+CHARACTERS_PER_TOKEN = 4
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Seconds of an x-ratelimit-reset-* value such as "1s", "6m0s" or "20ms" (None if unreadable)."""
+    if not value:
+        return None
+    parts = DURATION_PART.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(number) * DURATION_UNITS[unit] for number, unit in parts)
+
+
+def header_number(headers, name: str) -> Optional[float]:
+    """Numeric value of a response header (None if missing or empty)."""
+    value = headers.get(name)
+    return float(value) if value not in (None, '') else None
+
+
+def deficit_wait(headers, resource: str, needed: float) -> float:
+    """
+    Seconds until the API has room for `needed` requests or tokens again.
+
+    The x-ratelimit-reset-* headers give the time until the whole budget is
+    replenished, which overshoots when only a little is missing, so the wait
+    is the deficit refilled at the limit's per-minute rate (and never longer
+    than the reset time).
+
+    Args:
+        headers: Headers of the rate limited response
+        resource: "requests" or "tokens"
+        needed: Requests or tokens the retried request needs
+
+    Returns:
+        Seconds to wait (0 when the headers report enough room)
+    """
+    reset = parse_duration(headers.get(f'x-ratelimit-reset-{resource}'))
+    limit = header_number(headers, f'x-ratelimit-limit-{resource}')
+    remaining = header_number(headers, f'x-ratelimit-remaining-{resource}')
+    if not limit or remaining is None:
+        return reset or 0.0
+    wait = max(min(needed, limit) - remaining, 0) * 60 / limit
+    return min(wait, reset) if reset else wait
+
+
+class TokenBucket:
+    """Bucket refilling `capacity` units per minute."""
+
+    def __init__(self, capacity: float):
+        self.capacity = float(capacity)
+        self.level = float(capacity)
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available (assumes refill() was just called)."""
+        missing = min(amount, self.capacity) - self.level
+        return 0.0 if missing <= 0 else missing * 60 / self.capacity
+
+    def sync(self, limit: Optional[float], remaining: Optional[float], reset: Optional[float], now: float) -> None:
+        """Adopt the limit, remaining units and reset time reported by the API."""
+        self.refill(now)
+        if limit:
+            self.capacity = float(limit)
+        if remaining is not None:
+            self.level = min(self.level, float(remaining))
+            if reset:
+                # Refill no sooner than the API does
+                self.level = min(self.level, self.capacity - reset * self.capacity / 60)
+        self.level = min(self.level, self.capacity)
+
+
+class KeyRateLimiter:
+    """Requests-per-minute and tokens-per-minute budgets of one API key."""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self._lock = threading.Lock()
+        # Waiting requests take turns, so the request at the head of the queue isn't starved
+        self._queue = threading.Lock()
+        self.stats = {'requests': 0, 'waits': 0, 'wait_seconds': 0.0, 'retries': 0}
+
+    def acquire(self, tokens: int) -> None:
+        """Block until there is room for one request of `tokens` tokens, then take it."""
+        waited = 0.0
+        with self._queue:
+            while True:
+                with self._lock:
+                    now = time.monotonic()
+                    self.requests.refill(now)
+                    self.tokens.refill(now)
+                    delay = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                    if delay <= 0:
+                        self.requests.level -= 1
+                        self.tokens.level -= min(tokens, self.tokens.capacity)
+                        self.stats['requests'] += 1
+                        if waited:
+                            self.stats['waits'] += 1
+                            self.stats['wait_seconds'] += waited
+                        return
+                time.sleep(delay)
+                waited += delay
+
+    def settle(self, estimated: int, used: Optional[int]) -> None:
+        """Correct the token bucket once a request's actual usage is known."""
+        if used is None:
+            return
+        with self._lock:
+            self.tokens.level -= used - min(estimated, self.tokens.capacity)
+
+    def update_from_headers(self, headers) -> None:
+        """Follow the x-ratelimit-* headers of a response."""
+        if not headers or headers.get('x-ratelimit-limit-requests') is None:
+            return
+        number = lambda name: header_number(headers, name)
+        with self._lock:
+            now = time.monotonic()
+            self.requests.sync(number('x-ratelimit-limit-requests'), number('x-ratelimit-remaining-requests'),
+                               parse_duration(headers.get('x-ratelimit-reset-requests')), now)
+            self.tokens.sync(number('x-ratelimit-limit-tokens'), number('x-ratelimit-remaining-tokens'),
+                             parse_duration(headers.get('x-ratelimit-reset-tokens')), now)
+
+    def pause(self, seconds: float) -> None:
+        """Empty both buckets so that no request is sent for about `seconds`."""
+        with self._lock:
+            now = time.monotonic()
+            for bucket in (self.requests, self.tokens):
+                bucket.refill(now)
+                bucket.level = min(bucket.level, -seconds * bucket.capacity / 60)
+
+
+_limiters: Dict[str, KeyRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(api_key: str, requests_per_minute: int, tokens_per_minute: int) -> KeyRateLimiter:
+    """
+    Rate limiter shared by every request made with `api_key` in this process.
+
+    Args:
+        api_key: API key the requests are made with
+        requests_per_minute: Initial requests-per-minute budget (the first caller's is kept;
+            response headers replace it)
+        tokens_per_minute: Initial tokens-per-minute budget
+
+    Returns:
+        The key's rate limiter
+    """
+    key_id = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()
+    with _limiters_lock:
+        limiter = _limiters.get(key_id)
+        if limiter is None:
+            limiter = _limiters[key_id] = KeyRateLimiter(requests_per_minute, tokens_per_minute)
+        return limiter
+
+
+def estimate_tokens(request: Dict[str, Any], output_tokens: int) -> int:
+    """Tokens a request is scheduled with: its messages' characters plus the expected output."""
+    characters = sum(len(str(message.get('content') or '')) for message in request.get('messages', []))
+    expected_output = request.get('max_completion_tokens') or request.get('max_tokens') or output_tokens
+    return characters // CHARACTERS_PER_TOKEN + expected_output
+
+
+class _ScheduledCompletions:
+    """chat.completions of a RateLimitedClient: create() waits for budget and retries rate limits."""
+
+    def __init__(self, completions, limiter: KeyRateLimiter, config: Config,
+                 slots: Optional[threading.BoundedSemaphore] = None):
+        self._completions = completions
+        self.limiter = limiter
+        self.config = config
+        self.slots = slots
+
+    def create(self, **kwargs):
+        tokens = estimate_tokens(kwargs, self.config.PROMPT_OUTPUT_TOKENS)
+        attempt = 0
+        while True:
+            self.limiter.acquire(tokens)
+            try:
+                # The slot is held only while the request is in flight, never while waiting or backing off
+                with self.slots or contextlib.nullcontext():
+                    response = self._send(kwargs)
+            except openai.RateLimitError as e:
+                if getattr(e, 'code', None) == 'insufficient_quota' or attempt >= self.config.LLM_MAX_RETRIES:
+                    raise
+                delay = self._retry_delay(attempt, getattr(e, 'response', None), tokens)
+                self.limiter.pause(delay)
+                error = type(e).__name__
+            except (openai.APIConnectionError, openai.InternalServerError) as e:
+                if attempt >= self.config.LLM_MAX_RETRIES:
+                    raise
+                delay = self._retry_delay(attempt, getattr(e, 'response', None), tokens)
+                error = type(e).__name__
+            else:
+                usage = getattr(response, 'usage', None)
+                self.limiter.settle(tokens, getattr(usage, 'total_tokens', None))
+                return response
+
+            attempt += 1
+            with self.limiter._lock:
+                self.limiter.stats['retries'] += 1
+            logger.warning(f"LLM request failed ({error}), retry {attempt} in {delay:.1f}s")
+            time.sleep(delay)
+
+    def _send(self, request: Dict[str, Any]):
+        """Send a request, following the rate limit headers of the response when the client exposes them."""
+        raw_completions = getattr(self._completions, 'with_raw_response', None)
+        if raw_completions is None:
+            return self._completions.create(**request)
+        raw = raw_completions.create(**request)
+        self.limiter.update_from_headers(raw.headers)
+        return raw.parse()
+
+    def _retry_delay(self, attempt: int, response, tokens: int) -> float:
+        """Jittered exponential backoff, at least as long as the API asks for or the request's budget needs."""
+        backoff = min(self.config.LLM_BACKOFF_SECONDS * 2 ** attempt, self.config.LLM_BACKOFF_MAX_SECONDS)
+        delay = random.uniform(backoff / 2, backoff)
+        headers = getattr(response, 'headers', None)
+        if headers:
+            self.limiter.update_from_headers(headers)
+            asked = parse_duration(headers.get('retry-after')) or max(
+                deficit_wait(headers, 'requests', 1), deficit_wait(headers, 'tokens', tokens))
+            delay = max(delay, asked or 0)
+        return delay
+
+    def __getattr__(self, name):
+        return getattr(self._completions, name)
+
+
+class _ScheduledChat:
+    def __init__(self, chat, limiter: KeyRateLimiter, config: Config,
+                 slots: Optional[threading.BoundedSemaphore] = None):
+        self._chat = chat
+        self.completions = _ScheduledCompletions(chat.completions, limiter, config, slots)
+
+    def __getattr__(self, name):
+        return getattr(self._chat, name)
+
+
+class RateLimitedClient:
+    """OpenAI client wrapper scheduling chat completion requests within the key's rate limits."""
+
+    def __init__(self, client, limiter: KeyRateLimiter, config: Config = None,
+                 slots: Optional[threading.BoundedSemaphore] = None):
+        """
+        Args:
+            client: OpenAI client the requests are sent with (its own retries should be disabled)
+            limiter: Rate limiter of the client's API key
+            config: Configuration (defaults to Config())
+            slots: Concurrency semaphore of the client's API key (None for no concurrency limit)
+        """
+        self._client = client
+        self.limiter = limiter
+        self.chat = _ScheduledChat(client.chat, limiter, config or Config(), slots)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def rate_limited_client(client, api_key: str, config: Config = None,
+                        max_concurrency: int = None) -> RateLimitedClient:
+    """Wrap a client with the process-wide rate limiter (and, given `max_concurrency`, the slots) of `api_key`."""
+    config = config or Config()
+    limiter = get_rate_limiter(api_key, config.LLM_RATE_LIMIT_RPM, config.LLM_RATE_LIMIT_TPM)
+    slots = get_key_semaphore(api_key, max_concurrency) if max_concurrency else None
+    return RateLimitedClient(client, limiter, config, slots)
@@ -0,0 +1,238 @@
+"""
+Persistent cache of LLM responses
+
+CachedClient wraps the OpenAI client shared by every pipeline stage and
+answers chat completion requests it has seen before (same model, messages
+and sampling parameters) from a SQLite file, so retrying a failed chapter
+or re-running a book only pays for the requests that changed. SQLite in
+WAL mode lets every thread and every worker process read and write the
+same file; entries expire after a TTL and the least recently used ones are
+evicted when the file outgrows its size limit. Truncated responses are not
+stored, and callers drop a stored response they couldn't parse with
+forget_response, so a retry asks the model again instead of replaying it.
+"""
+
+import functools
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from openai.types.chat import ChatCompletion
+
+from .web_config import Config
+
+logger = logging.getLogger(__name__)
+
+# Request options that change how a request is sent, not what the model answers
+TRANSPORT_OPTIONS = ("timeout", "extra_headers")
+
+# Responses that ended any other way (e.g. cut off at max_tokens) are not stored
+CACHEABLE_FINISH_REASONS = ("stop", "tool_calls")
+
+
+class ResponseCache:
+    """SQLite-backed cache of chat completion responses with TTL and LRU size eviction."""
+
+    def __init__(self, path: str, max_bytes: int = 200 * 1024 * 1024, ttl_seconds: float = 7 * 24 * 3600):
+        """
+        Args:
+            path: SQLite file (shared by all processes using the same path)
+            max_bytes: Total size of the stored responses before the least
+                recently used ones are evicted
+            ttl_seconds: Age after which a response is no longer served (0 keeps responses forever)
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+        with self._connection() as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    accessed REAL NOT NULL
+                )
+            """)
+            db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    @staticmethod
+    def make_key(request: Dict[str, Any]) -> str:
+        """Hash the model, messages and sampling parameters of a request."""
+        params = {name: value for name, value in request.items() if name not in TRANSPORT_OPTIONS}
+        return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def _connection(self) -> sqlite3.Connection:
+        """This thread's connection (sqlite3 connections can't be shared between threads)."""
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def _count(self, stat: str, amount: int = 1) -> None:
+        with self._lock:
+            self.stats[stat] += amount
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the stored response JSON for `key`, or None on a miss or an expired entry."""
+        now = time.time()
+        try:
+            with self._connection() as db:
+                row = db.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None and not self._expired(row[1], now):
+                    db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                    self._count('hits')
+                    return row[0]
+        except sqlite3.Error as e:
+            logger.warning(f"Could not read LLM response cache: {e}")
+        self._count('misses')
+        return None
+
+    def put(self, key: str, response: str) -> None:
+        """Store a response JSON, then evict expired and least recently used responses."""
+        now = time.time()
+        size = len(response.encode('utf-8'))
+        try:
+            with self._connection() as db:
+                db.execute("INSERT OR REPLACE INTO responses (key, response, size, created, accessed) "
+                           "VALUES (?, ?, ?, ?, ?)", (key, response, size, now, now))
+                self._evict(db, now)
+            self._count('stores')
+        except sqlite3.Error as e:
+            logger.warning(f"Could not write LLM response cache: {e}")
+
+    def invalidate(self, key: str) -> None:
+        """Drop the stored response for `key`, e.g. after the caller couldn't use it."""
+        try:
+            with self._connection() as db:
+                db.execute("DELETE FROM responses WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            logger.warning(f"Could not write LLM response cache: {e}")
+
+    def _expired(self, created: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - created > self.ttl_seconds
+
+    def _evict(self, db: sqlite3.Connection, now: float) -> None:
+        """Delete expired responses and the least recently used ones beyond max_bytes (in a transaction)."""
+        evicted = 0
+        if self.ttl_seconds > 0:
+            evicted += db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,)).rowcount
+        excess = (db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]) - self.max_bytes
+        if excess > 0:
+            keys = []
+            for key, size in db.execute("SELECT key, size FROM responses ORDER BY accessed"):
+                keys.append((key,))
+                excess -= size
+                if excess <= 0:
+                    break
+            db.executemany("DELETE FROM responses WHERE key = ?", keys)
+            evicted += len(keys)
+        if evicted:
+            self._count('evictions', evicted)
+
+
+class _CachedCompletions:
+    """chat.completions of a CachedClient: create() is served from the cache when possible."""
+
+    def __init__(self, completions, cache: ResponseCache):
+        self._completions = completions
+        self.cache = cache
+
+    def create(self, **kwargs):
+        if kwargs.get('stream'):
+            return self._completions.create(**kwargs)
+
+        key = self.cache.make_key(kwargs)
+        cached = self.cache.get(key)
+        if cached is not None:
+            try:
+                return ChatCompletion.model_validate_json(cached)
+            except ValueError:
+                logger.warning("Ignoring an unreadable LLM response cache entry")
+
+        response = self._completions.create(**kwargs)
+        if isinstance(response, ChatCompletion) and response.choices and all(
+                choice.finish_reason in CACHEABLE_FINISH_REASONS for choice in response.choices):
+            self.cache.put(key, response.model_dump_json())
+        return response
+
+    def invalidate(self, **kwargs) -> None:
+        """Drop the stored response to the request made with these parameters."""
+        self.cache.invalidate(self.cache.make_key(kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._completions, name)
+
+
+class _CachedChat:
+    def __init__(self, chat, cache: ResponseCache):
+        self._chat = chat
+        self.completions = _CachedCompletions(chat.completions, cache)
+
+    def __getattr__(self, name):
+        return getattr(self._chat, name)
+
+
+class CachedClient:
+    """OpenAI client wrapper answering repeated chat completion requests from a ResponseCache."""
+
+    def __init__(self, client, cache: ResponseCache):
+        """
+        Args:
+            client: OpenAI client the requests that miss the cache are sent with
+            cache: Cache of responses
+        """
+        self._client = client
+        self.cache = cache
+        self.chat = _CachedChat(client.chat, cache)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def forget_response(client, request: Dict[str, Any]) -> None:
+    """
+    Drop the cached response to a request whose answer couldn't be used (e.g. unparseable JSON)
+
+    Args:
+        client: Client the request was made with (clients without a response cache are ignored)
+        request: Parameters the request was made with
+    """
+    if isinstance(client, CachedClient):
+        client.chat.completions.invalidate(**request)
+
+
+@functools.lru_cache(maxsize=None)
+def get_response_cache(path: str, max_mb: int, ttl_hours: float) -> ResponseCache:
+    """Process-wide cache shared by every client with the same settings."""
+    return ResponseCache(path, max_bytes=max_mb * 1024 * 1024, ttl_seconds=ttl_hours * 3600)
+
+
+def cached_client(client, config: Config = None):
+    """
+    Wrap a client with the configured response cache
+
+    Args:
+        client: OpenAI client
+        config: Configuration (defaults to Config())
+
+    Returns:
+        A CachedClient, or `client` itself when LLM_RESPONSE_CACHE_PATH isn't set
+    """
+    config = config or Config()
+    if not config.LLM_RESPONSE_CACHE_PATH:
+        return client
+    cache = get_response_cache(config.LLM_RESPONSE_CACHE_PATH, config.LLM_RESPONSE_CACHE_MAX_MB,
+                               config.LLM_RESPONSE_CACHE_TTL_HOURS)
+    return CachedClient(client, cache)
@@ -6,6 +6,7 @@ import json
 import logging
 from typing import Dict, List, Any
 from .web_config import Config
+from .response_cache import forget_response
 
 logger = logging.getLogger(__name__)
 
@@ -119,11 +120,8 @@ class InsightSynthesizer:
         
         try:
             logger.info(f"Attempting synthesis with model: {self.model}")
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3
-            )
+            request = {'model': self.model, 'messages': [{"role": "user", "content": prompt}], 'temperature': 0.3}
+            response = self.client.chat.completions.create(**request)
             
             content = response.choices[0].message.content
             logger.info(f"Received response from {self.model}, length: {len(content) if content else 0}")
@@ -135,6 +133,7 @@ class InsightSynthesizer:
             return parsed_result
             
         except json.JSONDecodeError as e:
+            forget_response(self.client, request)
             logger.error(f"JSON parsing error in synthesis with {self.model}: {str(e)}")
             logger.error(f"Raw response content: {content[:500] if 'content' in locals() else 'No content received'}")
             return self._create_fallback_synthesis(collected_data)
@@ -0,0 +1,118 @@
+"""
+Token counting for chunk sizing
+
+SmartTextChunker sizes chunks with a pluggable token counter. The tiktoken
+counter loads the encoding of the target model once per process and encodes
+pieces of text in batches, remembering every count for the rest of a chunking
+run so no text is encoded twice. When tiktoken or its encoding files are not
+available the character estimate (1 token ≈ 4 characters) is used instead.
+"""
+
+import functools
+import logging
+from typing import Dict, List, Optional
+
+try:
+    import tiktoken
+    HAS_TIKTOKEN = True
+except ImportError:
+    HAS_TIKTOKEN = False
+
+logger = logging.getLogger(__name__)
+
+# Encoding for models tiktoken doesn't know yet
+DEFAULT_ENCODING = "cl100k_base"
+
+
+class CharacterTokenCounter:
+    """
+    Rough token estimate (1 token ≈ 4 characters). Counts are fractional so
+    the counts of pieces add up exactly to the count of the joined text.
+    """
+
+    exact = False
+
+    def count(self, text: str) -> float:
+        return len(text) / 4
+
+    def count_batch(self, texts: List[str]) -> List[float]:
+        return [len(text) / 4 for text in texts]
+
+    def reset(self) -> None:
+        """Nothing is remembered between texts."""
+
+
+class TiktokenCounter:
+    """Exact token counts from a tiktoken encoding, memoized per chunking run"""
+
+    exact = True
+
+    def __init__(self, encoding):
+        """
+        Args:
+            encoding: tiktoken Encoding (or any object with encode_ordinary_batch)
+        """
+        self.encoding = encoding
+        self._counts: Dict[str, int] = {}
+        self.stats = {'encoded_texts': 0, 'memo_hits': 0}
+
+    def count(self, text: str) -> int:
+        return self.count_batch([text])[0]
+
+    def count_batch(self, texts: List[str]) -> List[int]:
+        """
+        Count tokens of several texts, encoding only the ones not counted yet
+        in one batch call.
+        """
+        counts = self._counts
+        missing = list(dict.fromkeys(text for text in texts if text not in counts))
+        self.stats['memo_hits'] += len(texts) - len(missing)
+        if missing:
+            self.stats['encoded_texts'] += len(missing)
+            for text, tokens in zip(missing, self.encoding.encode_ordinary_batch(missing)):
+                counts[text] = len(tokens)
+        return [counts[text] for text in texts]
+
+    def reset(self) -> None:
+        """Forget remembered counts (called at the start and end of each chunking run)."""
+        self._counts.clear()
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model: str):
+    """
+    Load the tiktoken encoding for a model once per process.
+
+    Returns:
+        The encoding, or None when tiktoken or its encoding files are unavailable
+    """
+    if not HAS_TIKTOKEN:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding(DEFAULT_ENCODING)
+    except Exception as e:
+        logger.warning(f"Could not load tiktoken encoding for {model or 'default model'}, "
+                       f"using character estimate: {e}")
+        return None
+
+
+def get_token_counter(model: Optional[str] = None, kind: str = "tiktoken"):
+    """
+    Create a token counter for a model.
+
+    Args:
+        model: Model the chunks are sized for
+        kind: "tiktoken" for exact counts (falls back to characters when
+            unavailable) or "characters" for the 4-characters-per-token estimate
+
+    Returns:
+        TiktokenCounter or CharacterTokenCounter
+    """
+    if kind == "tiktoken":
+        encoding = get_encoding(model or "")
+        if encoding is not None:
+            return TiktokenCounter(encoding)
+    return CharacterTokenCounter()
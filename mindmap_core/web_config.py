@@ -37,6 +37,53 @@ class Config:
     MAX_TOKENS_PER_CHUNK = int(os.getenv("MAX_TOKENS_PER_CHUNK", "8000"))
     OVERLAP_TOKENS = int(os.getenv("OVERLAP_TOKENS", "500"))
     CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "500"))
+    # "tiktoken" counts exact tokens (falls back to characters when unavailable), "characters" estimates len/4
+    TOKEN_COUNTER = os.getenv("TOKEN_COUNTER", "tiktoken")
+    # "balanced" minimises the number of chunks and evens out their sizes, "greedy" fills chunks in order,
+    # "content_defined" cuts at content-chosen paragraph ends so chunks survive edits elsewhere
+    CHUNK_PACKING = os.getenv("CHUNK_PACKING", "balanced")
+    # Chunk analyses reused by chunk text hash (memory entries per process, optional shared directory)
+    CHUNK_ANALYSIS_CACHE_ENTRIES = int(os.getenv("CHUNK_ANALYSIS_CACHE_ENTRIES", "512"))
+    CHUNK_ANALYSIS_CACHE_DIR = os.getenv("CHUNK_ANALYSIS_CACHE_DIR") or None
+    CHUNK_ANALYSIS_CACHE_MAX_MB = int(os.getenv("CHUNK_ANALYSIS_CACHE_MAX_MB", "200"))
+    # Chunks cut ahead of the analysis while CAPTURE runs in the background
+    CHUNK_QUEUE_SIZE = int(os.getenv("CHUNK_QUEUE_SIZE", "4"))
+    # Concurrent chunk analysis requests per API key, across all jobs in a process
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+    # "question_sets" asks four requests per chunk, "structured" one JSON-schema request;
+    # CHUNK_ANALYSIS_MODES overrides the mode per model ("gpt-5-mini=structured,o3-mini=question_sets")
+    CHUNK_ANALYSIS_MODE = os.getenv("CHUNK_ANALYSIS_MODE", "question_sets")
+    CHUNK_ANALYSIS_MODES = os.getenv("CHUNK_ANALYSIS_MODES", "")
+    # Prompt budget: tokens reserved for the response, and the context size of models without "max_tokens"
+    PROMPT_OUTPUT_TOKENS = int(os.getenv("PROMPT_OUTPUT_TOKENS", "4000"))
+    DEFAULT_CONTEXT_TOKENS = int(os.getenv("DEFAULT_CONTEXT_TOKENS", "128000"))
+    # Input budget of each stage's text (0 sends whatever fits in the context): chapter text per CAPTURE
+    # analysis, analysis data per CAPTURE synthesis/summary prompt, synthesis data per mind map and notes prompt
+    CAPTURE_TEXT_TOKENS = int(os.getenv("CAPTURE_TEXT_TOKENS", "8000"))
+    CAPTURE_SYNTHESIS_TOKENS = int(os.getenv("CAPTURE_SYNTHESIS_TOKENS", "4000"))
+    MINDMAP_INPUT_TOKENS = int(os.getenv("MINDMAP_INPUT_TOKENS", "1500"))
+    NOTES_INPUT_TOKENS = int(os.getenv("NOTES_INPUT_TOKENS", "1000"))
+    # Responses of repeated LLM requests served from a SQLite file shared by all workers (unset disables it)
+    LLM_RESPONSE_CACHE_PATH = os.getenv("LLM_RESPONSE_CACHE_PATH") or None
+    LLM_RESPONSE_CACHE_MAX_MB = int(os.getenv("LLM_RESPONSE_CACHE_MAX_MB", "200"))
+    LLM_RESPONSE_CACHE_TTL_HOURS = float(os.getenv("LLM_RESPONSE_CACHE_TTL_HOURS", "168"))
+    # Per-key request and token budgets until x-ratelimit-* headers report the account's limits,
+    # and retries of rate-limited requests (jittered exponential backoff)
+    LLM_RATE_LIMIT_RPM = int(os.getenv("LLM_RATE_LIMIT_RPM", "500"))
+    LLM_RATE_LIMIT_TPM = int(os.getenv("LLM_RATE_LIMIT_TPM", "200000"))
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "6"))
+    LLM_BACKOFF_SECONDS = float(os.getenv("LLM_BACKOFF_SECONDS", "1"))
+    LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "60"))
+    # Pooled OpenAI clients, one per API key and base URL per process, dropped after idling
+    LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "20"))
+    LLM_HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "10"))
+    LLM_HTTP_KEEPALIVE_SECONDS = float(os.getenv("LLM_HTTP_KEEPALIVE_SECONDS", "90"))
+    LLM_HTTP_TIMEOUT_SECONDS = float(os.getenv("LLM_HTTP_TIMEOUT_SECONDS", "600"))
+    LLM_CLIENT_IDLE_SECONDS = float(os.getenv("LLM_CLIENT_IDLE_SECONDS", "600"))
+    # Batch API mode (MindMapCreator.process_book_batch): job files with the batch ids, status polling
+    BATCH_JOB_DIR = os.getenv("BATCH_JOB_DIR", "batch_jobs")
+    BATCH_POLL_SECONDS = float(os.getenv("BATCH_POLL_SECONDS", "60"))
+    BATCH_COMPLETION_WINDOW = os.getenv("BATCH_COMPLETION_WINDOW", "24h")
     
     # File Settings
     OUTPUT_DIRECTORY = Path(os.getenv("OUTPUT_DIRECTORY", "output"))
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for SmartTextChunker
+
+Times the splitting of one oversize section (a chapter without headers or
+paragraph breaks) into chunks, against the previous splitter that re-measured
+the whole growing chunk for every sentence or word. Exits with status 1 when
+the current splitter is slower than the regression threshold.
+
+Also packs a seeded corpus of chapters made of paragraphs of varied length
+with greedy and balanced section packing and reports the chunk counts (one
+set of LLM calls per chunk) and the spread of chunk sizes.
+
+Finally sections chapters with markdown headings and compares the tokens
+sent for each chapter against the previous header sectioner, which copied
+the text before each heading into the section after it.
+
+Usage:
+    python benchmark_chunker.py
+    python benchmark_chunker.py --size-mb 2 --chunk-tokens 22000 --max-seconds 1.5
+    python benchmark_chunker.py --chapters 200 --seed 7
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mindmap_core.chunker import SmartTextChunker
+from mindmap_core.token_counter import CharacterTokenCounter
+
+
+def _best_time(func, repeat: int) -> float:
+    """Return the fastest of `repeat` runs, in seconds."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _quadratic_split(chunker: SmartTextChunker, pieces) -> list:
+    """The previous splitting loop: measures the whole growing chunk for every piece."""
+    chunks = []
+    current_chunk = ""
+    for piece in pieces:
+        test_chunk = current_chunk + " " + piece if current_chunk else piece
+        if len(test_chunk) // 4 > chunker.max_tokens:
+            if current_chunk:
+                chunks.append(current_chunk.strip())
+            current_chunk = piece
+        else:
+            current_chunk = test_chunk
+    if current_chunk:
+        chunks.append(current_chunk.strip())
+    return chunks
+
+
+def single_section(size_bytes: int, sentences: bool) -> str:
+    """One section of `size_bytes` characters, with or without sentence boundaries."""
+    sentence = ("A sentence of a chapter with no headers and no paragraph breaks. " if sentences
+                else "words of one endless sentence without any punctuation at all ")
+    return (sentence * (size_bytes // len(sentence) + 1))[:size_bytes]
+
+
+def benchmark_split(size_mb: float, chunk_tokens: int, repeat: int) -> float:
+    """Time both splitters on sentence and word splitting; return the slowest current time."""
+    chunker = SmartTextChunker(max_tokens=chunk_tokens, overlap_tokens=500,
+                               token_counter=CharacterTokenCounter())
+    size_bytes = int(size_mb * 1024 * 1024)
+
+    print(f"✂️  Splitting one {size_mb:g} MB section into {chunk_tokens}-token chunks")
+    print(f"{'split by':>10} {'chunks':>7} {'previous (s)':>13} {'current (s)':>12} {'speedup':>9}")
+    slowest = 0.0
+    for label, has_sentences in (("sentences", True), ("words", False)):
+        text = single_section(size_bytes, has_sentences)
+        if has_sentences:
+            split = lambda: chunker._split_large_section(text, 0, len(text), "benchmark")
+            previous = lambda: _quadratic_split(chunker, text.split(". "))
+        else:
+            split = lambda: chunker._split_by_words(text, 0, len(text))
+            previous = lambda: _quadratic_split(chunker, text.split())
+
+        def current(split=split):
+            chunker._boundaries = None  # Time building the boundary index too, as in a chunking run
+            return split()
+
+        chunk_count = len(current())
+        current_time = _best_time(current, repeat)
+        previous_time = _best_time(previous, repeat)
+        slowest = max(slowest, current_time)
+        print(f"{label:>10} {chunk_count:>7} {previous_time:>13.3f} {current_time:>12.3f} "
+              f"{previous_time / current_time:>8.1f}x")
+    return slowest
+
+
+def packing_corpus(chapters: int, seed: int) -> list:
+    """Chapters of 5-60 paragraphs, each paragraph 1-12 sentences long."""
+    rng = random.Random(seed)
+    sentence = "This sentence carries one more idea of the chapter forward. "
+    return ["\n\n".join(sentence * rng.randint(1, 12) for _ in range(rng.randint(5, 60)))
+            for _ in range(chapters)]
+
+
+def benchmark_packing(chapters: int, chunk_tokens: int, seed: int) -> None:
+    """Compare greedy and balanced section packing on the same corpus."""
+    corpus = packing_corpus(chapters, seed)
+    print(f"\n📦 Packing {chapters} chapters into {chunk_tokens}-token chunks (seed {seed})")
+    print(f"{'packing':>10} {'chunks':>7} {'mean spread':>12} {'time (s)':>9}")
+    for packing in ("greedy", "balanced"):
+        chunker = SmartTextChunker(max_tokens=chunk_tokens, overlap_tokens=chunk_tokens // 10,
+                                   token_counter=CharacterTokenCounter(), packing=packing)
+        start = time.perf_counter()
+        chapter_sizes = [[chunk.token_estimate for chunk in chunker.chunk_by_sections(text)] for text in corpus]
+        elapsed = time.perf_counter() - start
+        # Largest minus smallest chunk of each chapter split into several chunks
+        spreads = [max(sizes) - min(sizes) for sizes in chapter_sizes if len(sizes) > 1]
+        print(f"{packing:>10} {sum(map(len, chapter_sizes)):>7} "
+              f"{sum(spreads) / max(len(spreads), 1):>12.0f} {elapsed:>9.3f}")
+
+
+def _duplicating_sections(text: str) -> list:
+    """The previous header sectioner: each section also took the text before its heading."""
+    parts = re.split(r'\n(#{1,6}\s+.*?)\n', text)
+    sections = []
+    for i in range(1, len(parts), 2):
+        content = "\n\n".join(part.strip() for part in (parts[i - 1], parts[i + 1] if i + 1 < len(parts) else "")
+                              if part.strip())
+        if content.strip():
+            sections.append(content)
+    if parts[0].strip() and not parts[0].startswith('#'):
+        sections.insert(0, parts[0].strip())
+    return sections
+
+
+def heading_corpus(chapters: int, seed: int) -> list:
+    """Chapters of an introduction and 3-15 headed sections of 1-6 paragraphs."""
+    rng = random.Random(seed)
+    paragraph = lambda: "A paragraph under the heading explains one point. " * rng.randint(2, 10)
+    texts = []
+    for _ in range(chapters):
+        blocks = ["# Chapter", paragraph()]
+        for number in range(rng.randint(3, 15)):
+            blocks.append(f"{'#' * rng.randint(2, 3)} Heading {number}")
+            blocks.extend(paragraph() for _ in range(rng.randint(1, 6)))
+        texts.append("\n\n".join(blocks))
+    return texts
+
+
+def benchmark_sectioning(chapters: int, seed: int) -> None:
+    """Compare section tokens per chapter of the previous and current header sectioners."""
+    corpus = heading_corpus(chapters, seed)
+    chunker = SmartTextChunker(token_counter=CharacterTokenCounter())
+    count = chunker.token_counter.count
+    text_tokens = sum(count(text) for text in corpus)
+    previous = sum(count(section) for text in corpus for section in _duplicating_sections(text))
+    current = sum(count(section['content']) for text in corpus for section in chunker._identify_sections(text))
+
+    print(f"\n🧭 Sectioning {chapters} chapters with headings (seed {seed})")
+    print(f"{'sectioner':>10} {'tokens/chapter':>15} {'vs text':>8}")
+    print(f"{'text':>10} {text_tokens / chapters:>15.0f} {1:>7.2f}x")
+    print(f"{'previous':>10} {previous / chapters:>15.0f} {previous / text_tokens:>7.2f}x")
+    print(f"{'current':>10} {current / chapters:>15.0f} {current / text_tokens:>7.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark SmartTextChunker splitting')
+    parser.add_argument('--size-mb', type=float, default=2,
+                        help='Size of the single-section chapter in MB')
+    parser.add_argument('--chunk-tokens', type=int, default=22000,
+                        help='max_tokens of the chunker (model chunk_size)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Runs per measurement (best time is reported)')
+    parser.add_argument('--max-seconds', type=float, default=1.5,
+                        help='Regression threshold for the current splitter')
+    parser.add_argument('--chapters', type=int, default=200,
+                        help='Chapters in the packing corpus')
+    parser.add_argument('--packing-tokens', type=int, default=2000,
+                        help='max_tokens for the packing comparison')
+    parser.add_argument('--seed', type=int, default=7,
+                        help='Seed of the packing corpus')
+    args = parser.parse_args()
+
+    slowest = benchmark_split(args.size_mb, args.chunk_tokens, args.repeat)
+    benchmark_packing(args.chapters, args.packing_tokens, args.seed)
+    benchmark_sectioning(args.chapters, args.seed)
+    if slowest > args.max_seconds:
+        print(f"\n❌ Splitting took {slowest:.3f}s, above the {args.max_seconds}s threshold")
+        return 1
+    print(f"\n✅ Splitting within the {args.max_seconds}s threshold ({slowest:.3f}s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for EPUB chapter extraction
+
+Builds synthetic EPUB files and reports how extraction time scales with the
+size of the table of contents, and compares the HTML to Markdown converters
+on large chapters.
+
+Usage:
+    python benchmark_epub_extraction.py
+    python benchmark_epub_extraction.py --toc-sizes 50 300 1000 --repeat 5
+    python benchmark_epub_extraction.py --chapter-mb 1 10 --unclosed-kb 64 128 256
+    python benchmark_epub_extraction.py --workers 1 2 4 8
+    python benchmark_epub_extraction.py --ncx-entries 1000 20000
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+import tracemalloc
+from xml.dom import minidom
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from epub_processor import EpubChapterExtractor
+from epub_processor.toc_parser import parse_ncx
+from sample_epub import _nav_points, build_book, chapter_html
+
+
+def _best_time(func, repeat: int) -> float:
+    """Return the fastest of `repeat` runs, in seconds."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark_toc_scaling(toc_sizes, repeat: int) -> None:
+    """Time in-memory extraction for books with increasing TOC sizes."""
+    print("📈 Extraction time vs. TOC size")
+    print(f"{'TOC entries':>12} {'total (ms)':>12} {'per entry (ms)':>16}")
+    for size in toc_sizes:
+        epub_data = build_book(size, paragraphs=5)
+        extractor = EpubChapterExtractor(epub_data=epub_data, min_content_length=100)
+        elapsed = _best_time(extractor.extract_chapters_to_memory, repeat)
+        print(f"{size:>12} {elapsed * 1000:>12.1f} {elapsed * 1000 / size:>16.3f}")
+
+
+def _unclosed_paragraphs(size_bytes: int) -> str:
+    """HTML chapter whose <p> tags are never closed, as in many non-XHTML sources."""
+    paragraph = "<p>Paragraph with some words in an unclosed HTML paragraph element.\n"
+    return "<body>" + paragraph * max(1, size_bytes // len(paragraph)) + "</body>"
+
+
+def benchmark_html_converters(sizes_mb, sizes_kb, repeat: int) -> None:
+    """Time each HTML to Markdown converter on large and on badly formed chapters."""
+    paragraph_bytes = len(chapter_html("Chapter", 2)) - len(chapter_html("Chapter", 1))
+    cases = [
+        (f"xhtml {size} MB", chapter_html("Chapter", size * 1024 * 1024 // paragraph_bytes))
+        for size in sizes_mb
+    ] + [
+        (f"unclosed <p> {size} KB", _unclosed_paragraphs(size * 1024))
+        for size in sizes_kb
+    ]
+
+    print("\n⚡ HTML to Markdown converters")
+    print(f"{'chapter':>22} {'basic (s)':>11} {'streaming (s)':>14} {'speedup':>9}")
+    for label, html_content in cases:
+        timings = {}
+        for converter in ("basic", "streaming"):
+            extractor = EpubChapterExtractor(epub_data=b"", html_converter=converter)
+            timings[converter] = _best_time(lambda: extractor._html_to_markdown(html_content), repeat)
+        print(f"{label:>22} {timings['basic']:>11.3f} {timings['streaming']:>14.3f} "
+              f"{timings['basic'] / timings['streaming']:>8.1f}x")
+
+
+def benchmark_parallel_conversion(toc_size: int, worker_counts, repeat: int) -> None:
+    """Time chapter conversion of one large book with different worker counts."""
+    epub_data = build_book(toc_size, paragraphs=400)
+    toc = EpubChapterExtractor(epub_data=epub_data).extract_toc_structure()[0]
+
+    print(f"\n🧵 Parallel conversion ({toc_size} chapters, {len(epub_data) / 1024 / 1024:.1f} MB EPUB)")
+    print(f"{'workers':>8} {'time (s)':>10}")
+    for workers in worker_counts:
+        extractor = EpubChapterExtractor(epub_data=epub_data, workers=workers)
+        elapsed = _best_time(lambda: extractor.convert_toc_entries(toc), repeat)
+        print(f"{workers:>8} {elapsed:>10.3f}")
+
+
+def _minidom_ncx(ncx_data: bytes):
+    """The NCX parsing extract_toc_structure did before the iterparse parser, for comparison."""
+    entries = []
+    dom = minidom.parse(io.BytesIO(ncx_data))
+    for nav_point in dom.getElementsByTagName("navPoint"):
+        texts = nav_point.getElementsByTagName("text")
+        label = texts[0].firstChild.nodeValue.strip() if texts and texts[0].firstChild else ""
+        content_nodes = nav_point.getElementsByTagName("content")
+        if content_nodes:
+            entries.append((label, content_nodes[0].getAttribute("src"), nav_point.getAttribute("id")))
+    return entries
+
+
+def _peak_memory(func) -> int:
+    """Peak traced allocation of one call, in bytes."""
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def benchmark_ncx_parsing(entry_counts, repeat: int) -> None:
+    """Compare minidom and iterparse on NCX files with nested navPoints."""
+    print("\n🗂️  NCX parsing (minidom vs. iterparse)")
+    print(f"{'navPoints':>10} {'NCX (MB)':>9} {'minidom (s)':>12} {'iterparse (s)':>14} "
+          f"{'minidom peak (MB)':>18} {'iterparse peak (MB)':>20}")
+    for count in entry_counts:
+        # Chapters with three nested sections each
+        entries = [
+            {"title": f"Chapter {i}", "src": f"text/ch{i}.xhtml",
+             "children": [{"title": f"Section {i}.{j}", "src": f"text/ch{i}.xhtml#s{j}"} for j in range(3)]}
+            for i in range(max(1, count // 4))
+        ]
+        ncx_data = (
+            '<?xml version="1.0"?>\n<ncx xmlns="http://www.daisy.org/z3986/2005/ncx/" version="2005-1">'
+            f'<navMap>{_nav_points(entries, [0])}</navMap></ncx>'
+        ).encode("utf-8")
+
+        old_time = _best_time(lambda: _minidom_ncx(ncx_data), repeat)
+        new_time = _best_time(lambda: parse_ncx(io.BytesIO(ncx_data)), repeat)
+        old_peak = _peak_memory(lambda: _minidom_ncx(ncx_data))
+        new_peak = _peak_memory(lambda: parse_ncx(io.BytesIO(ncx_data)))
+        print(f"{count:>10} {len(ncx_data) / 1024 / 1024:>9.2f} {old_time:>12.3f} {new_time:>14.3f} "
+              f"{old_peak / 1024 / 1024:>18.1f} {new_peak / 1024 / 1024:>20.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark EPUB extraction')
+    parser.add_argument('--toc-sizes', type=int, nargs='+', default=[10, 50, 100, 300, 1000],
+                        help='Number of TOC entries in each synthetic book')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Runs per measurement (best time is reported)')
+    parser.add_argument('--chapter-mb', type=int, nargs='+', default=[1, 10],
+                        help='Well-formed chapter sizes in MB for the converter benchmark')
+    parser.add_argument('--unclosed-kb', type=int, nargs='+', default=[64, 128, 256],
+                        help='Unclosed-paragraph chapter sizes in KB for the converter benchmark')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4],
+                        help='Worker counts for the parallel conversion benchmark')
+    parser.add_argument('--ncx-entries', type=int, nargs='+', default=[1000, 10000, 40000],
+                        help='navPoint counts for the NCX parsing benchmark')
+    args = parser.parse_args()
+
+    benchmark_toc_scaling(args.toc_sizes, args.repeat)
+    benchmark_html_converters(args.chapter_mb, args.unclosed_kb, args.repeat)
+    benchmark_parallel_conversion(max(args.toc_sizes), args.workers, args.repeat)
+    benchmark_ncx_parsing(args.ncx_entries, args.repeat)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for KnowledgeExtractor chunk analysis
+
+Runs extract_insights on a chapter against a stub client that answers every
+request after a fixed latency, once with one request at a time (the previous
+sequential behaviour) and once with the question sets of all chunks fanned
+out concurrently, and reports the wall time of each. The CAPTURE pass and
+the synthesis are stubbed out, so only the chunk analysis is timed.
+
+Usage:
+    python benchmark_extractor.py
+    python benchmark_extractor.py --chunks 5 --latency 0.5 --concurrency 8
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mindmap_core import extractor as extractor_module
+from mindmap_core.analysis_cache import ChunkAnalysisCache
+from mindmap_core.chunker import SmartTextChunker
+from mindmap_core.extractor import KnowledgeExtractor
+from mindmap_core.synthesizer import InsightSynthesizer
+from mindmap_core.token_counter import CharacterTokenCounter
+
+ANSWER = '{"question_1": ["point"], "question_2": ["point"], "question_3": ["point"], "question_4": ["point"]}'
+
+
+class StubClient:
+    """Stand-in OpenAI client: every completion takes `latency` seconds."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, **kwargs):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        message = SimpleNamespace(content=ANSWER)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def chapter_text(chunks: int, chunk_tokens: int) -> str:
+    """A chapter with one heading per chunk, each section just under the chunk size."""
+    sentence = "A sentence of the chapter that carries its argument one step further. "
+    section = sentence * (chunk_tokens * 4 * 9 // 10 // len(sentence))
+    return "\n\n".join(f"## Part {i}\n\n{section}" for i in range(chunks))
+
+
+def run(concurrency: int, text: str, chunk_tokens: int, latency: float):
+    """Analyse `text` with a fresh extractor; return (seconds, calls, chunks)."""
+    extractor = KnowledgeExtractor(api_key=f"benchmark-key-{concurrency}", model="gpt-5-mini",
+                                   max_concurrency=concurrency)
+    extractor.chunker = SmartTextChunker(max_tokens=chunk_tokens, overlap_tokens=chunk_tokens // 20,
+                                         token_counter=CharacterTokenCounter())
+    extractor.client = StubClient(latency)
+    extractor.capture_framework.apply_capture_analysis = lambda text, title: {}
+
+    start = time.perf_counter()
+    result = extractor.extract_insights(text, "Benchmark chapter")
+    return time.perf_counter() - start, extractor.client.calls, result['metadata']['total_chunks']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark concurrent chunk analysis')
+    parser.add_argument('--chunks', type=int, default=5, help='Chunks in the chapter')
+    parser.add_argument('--chunk-tokens', type=int, default=2000, help='max_tokens of the chunker')
+    parser.add_argument('--latency', type=float, default=0.2, help='Seconds per stub completion')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent requests per API key')
+    args = parser.parse_args()
+
+    # Every run analyses from scratch, and the synthesis isn't part of the measurement
+    extractor_module.get_analysis_cache = lambda *a: ChunkAnalysisCache(max_entries=0)
+    InsightSynthesizer.synthesize_insights = lambda self, analyses, title: {}
+
+    text = chapter_text(args.chunks, args.chunk_tokens)
+    print(f"🧠 Analysing {args.chunks} chunks with a {args.latency}s stub latency")
+    print(f"{'concurrency':>12} {'chunks':>7} {'requests':>9} {'wall (s)':>9}")
+    times = {}
+    for concurrency in (1, args.concurrency):
+        seconds, calls, chunks = run(concurrency, text, args.chunk_tokens, args.latency)
+        times[concurrency] = seconds
+        print(f"{concurrency:>12} {chunks:>7} {calls:>9} {seconds:>9.2f}")
+    print(f"\n✅ {times[1] / times[args.concurrency]:.1f}x faster with {args.concurrency} concurrent requests")
+
+
+if __name__ == '__main__':
+    main()
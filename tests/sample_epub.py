@@ -0,0 +1,133 @@
+"""
+Helpers for building small synthetic EPUB files in tests and benchmarks.
+"""
+
+import io
+import zipfile
+from typing import Dict, List
+
+CONTAINER_XML = """<?xml version="1.0"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles>
+    <rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>
+  </rootfiles>
+</container>
+"""
+
+
+def chapter_html(title: str, paragraphs: int = 20) -> str:
+    """Build a simple XHTML chapter with a heading and some paragraphs."""
+    body = "\n".join(
+        f"<p>Paragraph {i} of {title}. This sentence has <b>bold</b> and <i>italic</i> words.</p>"
+        for i in range(paragraphs)
+    )
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<html xmlns="http://www.w3.org/1999/xhtml"><head><title>'
+        f"{title}</title></head><body><h1>{title}</h1>\n{body}\n</body></html>"
+    )
+
+
+def _nav_points(entries: List[Dict], counter: List[int]) -> str:
+    """NCX navPoints for TOC entries, nesting each entry's 'children'."""
+    points = []
+    for entry in entries:
+        counter[0] += 1
+        points.append(
+            f'<navPoint id="nav{counter[0] - 1}" playOrder="{counter[0]}">'
+            f'<navLabel><text>{entry["title"]}</text></navLabel><content src="{entry["src"]}"/>'
+            f'{_nav_points(entry.get("children", []), counter)}</navPoint>'
+        )
+    return "".join(points)
+
+
+def _nav_list(entries: List[Dict]) -> str:
+    """EPUB 3 navigation <ol> for TOC entries, nesting each entry's 'children'."""
+    items = []
+    for entry in entries:
+        children = entry.get("children")
+        items.append(f'<li><a href="{entry["src"]}">{entry["title"]}</a>'
+                     f'{_nav_list(children) if children else ""}</li>')
+    return f"<ol>{''.join(items)}</ol>"
+
+
+def build_epub(chapters: List[Dict[str, str]], title: str = "Sample Book",
+               files: Dict[str, str] = None, toc_format: str = "ncx") -> bytes:
+    """
+    Build an EPUB archive in memory.
+
+    Args:
+        chapters: List of {'title': ..., 'html': ...} dictionaries, one file each.
+            When `files` is given, entries are {'title': ..., 'src': ...} instead,
+            may point into a shared file with an #anchor and may nest further
+            entries under 'children'.
+        title: Book title written to the OPF metadata
+        files: Optional mapping of href (relative to OEBPS/) to XHTML content
+        toc_format: "ncx" for an EPUB 2 toc.ncx, "nav" for an EPUB 3 nav.xhtml only
+
+    Returns:
+        EPUB file content as bytes
+    """
+    if files is None:
+        files = {}
+        entries = []
+        for i, chapter in enumerate(chapters):
+            href = f"text/ch{i:04d}.xhtml"
+            files[href] = chapter["html"]
+            entries.append({"title": chapter["title"], "src": href})
+    else:
+        entries = chapters
+
+    toc_files = {}
+    if toc_format == "nav":
+        manifest = ['<item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>']
+        toc_files["OEBPS/nav.xhtml"] = (
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">'
+            '<head><title>Contents</title></head><body>'
+            f'<nav epub:type="toc"><h1>Contents</h1>{_nav_list(entries)}</nav>'
+            '<nav epub:type="landmarks"><ol><li><a href="nav.xhtml">Landmark</a></li></ol></nav>'
+            '</body></html>'
+        )
+    else:
+        manifest = ['<item id="ncx" href="toc.ncx" media-type="application/x-dtbncx+xml"/>']
+        toc_files["OEBPS/toc.ncx"] = (
+            '<?xml version="1.0"?>\n'
+            '<ncx xmlns="http://www.daisy.org/z3986/2005/ncx/" version="2005-1">'
+            f'<navMap>{_nav_points(entries, [0])}</navMap></ncx>'
+        )
+
+    spine = []
+    for i, href in enumerate(files):
+        manifest.append(f'<item id="ch{i}" href="{href}" media-type="application/xhtml+xml"/>')
+        spine.append(f'<itemref idref="ch{i}"/>')
+
+    spine_toc = "" if toc_format == "nav" else ' toc="ncx"'
+    opf = (
+        '<?xml version="1.0"?>\n'
+        f'<package xmlns="http://www.idpf.org/2007/opf" version="{"3.0" if toc_format == "nav" else "2.0"}">'
+        '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">'
+        f"<dc:title>{title}</dc:title><dc:creator>Test Author</dc:creator><dc:language>en</dc:language>"
+        f"</metadata><manifest>{''.join(manifest)}</manifest>"
+        f'<spine{spine_toc}>{"".join(spine)}</spine></package>'
+    )
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("mimetype", "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+        z.writestr("META-INF/container.xml", CONTAINER_XML)
+        z.writestr("OEBPS/content.opf", opf)
+        for path, content in toc_files.items():
+            z.writestr(path, content)
+        for href, content in files.items():
+            z.writestr(f"OEBPS/{href}", content)
+    return buffer.getvalue()
+
+
+def build_book(chapter_count: int, paragraphs: int = 20) -> bytes:
+    """Build an EPUB with numbered chapters of similar length."""
+    chapters = []
+    for i in range(chapter_count):
+        title = f"Chapter {i + 1}"
+        chapters.append({"title": title, "html": chapter_html(title, paragraphs)})
+    return build_epub(chapters)
@@ -0,0 +1,127 @@
+"""
+Tests for Flask app processing functions
+"""
+
+import hashlib
+import io
+import time
+import tracemalloc
+
+import pytest
+from werkzeug.exceptions import RequestEntityTooLarge
+
+import app as web_app
+from sample_epub import build_book
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    monkeypatch.setattr(web_app, "extraction_cache", web_app.ExtractionCache(max_entries=4))
+    return web_app.ProcessingManager()
+
+
+def _wait_for(manager, session_id, timeout=10):
+    deadline = time.time() + timeout
+    while not manager.get_status(session_id).get('completed'):
+        assert time.time() < deadline, "EPUB processing did not finish"
+        time.sleep(0.01)
+    return manager.get_status(session_id)
+
+
+def test_reupload_served_from_extraction_cache(manager):
+    book = build_book(3)
+
+    manager.start_epub_processing_memory("first", book, "book.epub", min_length=100)
+    first = _wait_for(manager, "first")
+    assert first['type'] == 'complete' and not first.get('from_cache')
+
+    manager.start_epub_processing_memory("second", book, "book.epub", min_length=100)
+    second = manager.get_status("second")
+
+    assert second['completed'] and second['from_cache']
+    assert manager.get_results("second")['chapter_contents'] == manager.get_results("first")['chapter_contents']
+    assert manager.get_results("second")['filename'] == "book.epub"
+
+
+def test_hash_upload_enforces_size_cap():
+    upload = io.BytesIO(b"x" * 1000)
+    assert web_app.hash_upload(upload, max_bytes=1000) == hashlib.sha256(b"x" * 1000).hexdigest()
+    assert upload.read() == b"x" * 1000
+
+    with pytest.raises(RequestEntityTooLarge):
+        web_app.hash_upload(io.BytesIO(b"x" * 1001), max_bytes=1000)
+
+
+def test_hash_upload_memory_stays_flat():
+    payload = io.BytesIO(b"\0" * (32 * 1024 * 1024))
+    tracemalloc.start()
+    web_app.hash_upload(payload, max_bytes=64 * 1024 * 1024)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert peak < 8 * 1024 * 1024
+
+
+def test_upload_route_processes_spooled_file(manager, monkeypatch):
+    monkeypatch.setattr(web_app, "process_manager", manager)
+    client = web_app.app.test_client()
+    with client.session_transaction() as flask_session:
+        flask_session['session_id'] = "upload-session"
+
+    response = client.post("/upload", data={
+        'file': (io.BytesIO(build_book(3)), "book.epub"),
+        'min_length': "100",
+    }, content_type="multipart/form-data")
+
+    assert response.status_code == 200
+    status = _wait_for(manager, "upload-session")
+    assert status['type'] == 'complete'
+    assert len(manager.get_results("upload-session")['chapters']) == 3
+
+
+def test_upload_route_applies_its_own_size_cap(manager, monkeypatch):
+    monkeypatch.setattr(web_app, "process_manager", manager)
+    monkeypatch.setattr(web_app, "max_upload_bytes", 1024)
+    client = web_app.app.test_client()
+    with client.session_transaction() as flask_session:
+        flask_session['session_id'] = "capped-session"
+
+    response = client.post("/upload", data={
+        'file': (io.BytesIO(build_book(3)), "book.epub"),
+    }, content_type="multipart/form-data")
+
+    assert response.status_code == 413
+    assert manager.get_status("capped-session") == {}
+
+
+def test_lazy_upload_lists_chapters_and_converts_on_demand(manager, monkeypatch):
+    monkeypatch.setattr(web_app, "lazy_chapter_extraction", True)
+
+    manager.start_epub_processing_memory("lazy", io.BytesIO(build_book(3)), "book.epub", min_length=100)
+
+    # Listing finishes synchronously without converting any chapter
+    status = manager.get_status("lazy")
+    results = manager.get_results("lazy")
+    assert status['completed'] and status['type'] == 'complete'
+    assert len(results['chapters']) == 3 and results['chapter_contents'] == {}
+
+    first = next(iter(results['chapters']))
+    content = manager.get_chapter_content("lazy", first)
+    assert content and content.startswith("# ")
+    assert results['chapter_contents'][first] == content
+    assert manager.get_chapter_content("lazy", "missing.md") is None
+
+
+def test_lazy_upload_is_closed_on_reupload_and_once_fully_converted(manager, monkeypatch):
+    monkeypatch.setattr(web_app, "lazy_chapter_extraction", True)
+    first_upload = io.BytesIO(build_book(3))
+    manager.start_epub_processing_memory("lazy", first_upload, "book.epub", min_length=100)
+
+    second_upload = io.BytesIO(build_book(2))
+    manager.start_epub_processing_memory("lazy", second_upload, "book.epub", min_length=100)
+    assert first_upload.closed and not second_upload.closed
+
+    results = manager.get_results("lazy")
+    for chapter_file in list(results['chapters']):
+        assert manager.get_chapter_content("lazy", chapter_file)
+    assert second_upload.closed and 'lazy_extractor' not in results
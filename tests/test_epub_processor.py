@@ -0,0 +1,451 @@
+"""
+Tests for the EPUB processing module
+"""
+
+import json
+import os
+import zipfile
+
+import pytest
+
+from epub_processor import EpubArchive, EpubChapterExtractor, ExtractionCache
+from epub_processor.markdown_converter import html_to_markdown
+from sample_epub import build_book, build_epub, chapter_html
+
+
+@pytest.fixture
+def sample_book():
+    return build_book(5)
+
+
+def test_toc_structure_and_metadata(sample_book):
+    extractor = EpubChapterExtractor(epub_data=sample_book)
+    chapters, metadata = extractor.extract_toc_structure()
+
+    assert [c['title'] for c in chapters] == [f"Chapter {i}" for i in range(1, 6)]
+    assert chapters[0]['path'] == "OEBPS/text/ch0000.xhtml"
+    assert metadata['title'] == "Sample Book"
+    assert metadata['authors'] == ["Test Author"]
+
+
+def _nested_toc(toc_format):
+    files = {f"text/ch{i}.xhtml": chapter_html(f"Chapter {i}") for i in range(1, 4)}
+    entries = [
+        {"title": "Part One", "src": "text/ch1.xhtml", "children": [
+            {"title": "Chapter 1", "src": "text/ch1.xhtml#start"},
+            {"title": "Chapter 2", "src": "text/ch2.xhtml", "children": [
+                {"title": "Section 2.1", "src": "text/ch2.xhtml#s1"},
+            ]},
+        ]},
+        {"title": "Chapter 3", "src": "text/ch3.xhtml"},
+    ]
+    return build_epub(entries, files=files, toc_format=toc_format)
+
+
+@pytest.mark.parametrize("toc_format", ["ncx", "nav"])
+def test_nested_toc_keeps_order_and_depth(toc_format):
+    extractor = EpubChapterExtractor(epub_data=_nested_toc(toc_format))
+    chapters, metadata = extractor.extract_toc_structure()
+
+    assert [(c['title'], c['depth']) for c in chapters] == [
+        ("Part One", 0), ("Chapter 1", 1), ("Chapter 2", 1), ("Section 2.1", 2), ("Chapter 3", 0)
+    ]
+    assert [c['path'] for c in chapters][-1] == "OEBPS/text/ch3.xhtml"
+    assert chapters[3]['fragment'] == "s1"
+    assert metadata['language'] == "en"
+
+
+def test_epub3_nav_used_instead_of_spine_fallback():
+    entries = [{"title": f"Chapter {i}", "src": f"text/ch{i}.xhtml"} for i in range(1, 3)]
+    files = {f"text/ch{i}.xhtml": chapter_html(f"Chapter {i}") for i in range(1, 3)}
+    extractor = EpubChapterExtractor(epub_data=build_epub(entries, files=files, toc_format="nav"),
+                                     min_content_length=100)
+
+    chapters = extractor.extract_chapters_to_memory()
+
+    # Landmarks after the toc nav are not chapters
+    assert [c['title'] for c in chapters] == ["Chapter 1", "Chapter 2"]
+
+
+def test_archive_opened_once_per_extraction(sample_book, monkeypatch):
+    opened = []
+    original_init = zipfile.ZipFile.__init__
+
+    def counting_init(self, *args, **kwargs):
+        opened.append(args[0] if args else None)
+        original_init(self, *args, **kwargs)
+
+    monkeypatch.setattr(zipfile.ZipFile, "__init__", counting_init)
+
+    extractor = EpubChapterExtractor(epub_data=sample_book, min_content_length=100)
+    chapters = extractor.extract_chapters_to_memory()
+
+    assert len(chapters) == 5
+    assert len(opened) == 1
+    assert extractor._archive is None
+
+
+def test_open_archive_is_reentrant(sample_book):
+    extractor = EpubChapterExtractor(epub_data=sample_book)
+    with extractor.open_archive() as outer:
+        with extractor.open_archive() as inner:
+            assert inner is outer
+        assert "OEBPS/content.opf" in outer
+    assert extractor._archive is None
+
+
+def test_convert_chapter_accepts_plain_zipfile(sample_book, tmp_path):
+    epub_path = tmp_path / "book.epub"
+    epub_path.write_bytes(sample_book)
+    extractor = EpubChapterExtractor(epub_path=str(epub_path))
+
+    with zipfile.ZipFile(epub_path) as z:
+        markdown = extractor.convert_chapter("OEBPS/text/ch0000.xhtml", z)
+    with EpubArchive(str(epub_path)) as archive:
+        assert extractor.convert_chapter("OEBPS/text/ch0000.xhtml", archive) == markdown
+
+    assert "# Chapter 1" in markdown
+    assert extractor.convert_chapter("OEBPS/text/missing.xhtml", EpubArchive(str(epub_path))) == ""
+
+
+def test_convert_epub_to_markdown_files(sample_book, tmp_path):
+    extractor = EpubChapterExtractor(epub_data=sample_book, min_content_length=100)
+    extractor.convert_epub_to_markdown_files(str(tmp_path / "out"))
+
+    written = sorted(p.name for p in (tmp_path / "out").iterdir())
+    assert written[0] == "00_processing_summary.md"
+    assert len(written) == 6
+
+
+def _fragment_book():
+    body = (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<html xmlns="http://www.w3.org/1999/xhtml"><head><title>Part</title></head><body>'
+        '<h1>Part One</h1><p>Opening words of the part.</p>'
+        '<h2 id="s1">First Section</h2><p>Alpha text only in section one.</p>'
+        '<h2 id="s2">Second Section</h2><p>Beta text only in section two.</p>'
+        '</body></html>'
+    )
+    entries = [
+        {"title": "Part One", "src": "text/part.xhtml"},
+        {"title": "Chapter 1: First", "src": "text/part.xhtml#s1"},
+        {"title": "Chapter 2: Second", "src": "text/part.xhtml#s2"},
+    ]
+    return build_epub(entries, files={"text/part.xhtml": body})
+
+
+def test_toc_keeps_fragment_separate_from_path():
+    extractor = EpubChapterExtractor(epub_data=_fragment_book())
+    chapters, _ = extractor.extract_toc_structure()
+
+    assert {c['path'] for c in chapters} == {"OEBPS/text/part.xhtml"}
+    assert [c['fragment'] for c in chapters] == ["", "s1", "s2"]
+
+
+def test_fragment_entries_are_sliced_from_one_conversion(monkeypatch):
+    extractor = EpubChapterExtractor(epub_data=_fragment_book())
+    calls = []
+    original = extractor._html_to_markdown
+    monkeypatch.setattr(extractor, "_html_to_markdown", lambda h: calls.append(h) or original(h))
+
+    chapters, _ = extractor.extract_toc_structure()
+    part, first, second = extractor.convert_toc_entries(chapters)
+
+    assert len(calls) == 1
+    assert "Opening words" in part and "Alpha" not in part
+    assert first.startswith("## First Section") and "Alpha" in first and "Beta" not in first
+    assert second.startswith("## Second Section") and "Beta" in second
+
+
+def test_duplicate_entries_do_not_repeat_text():
+    html = chapter_html("Chapter 1")
+    entries = [{"title": "Chapter 1", "src": "text/a.xhtml"}, {"title": "Chapter 1 again", "src": "text/a.xhtml"}]
+    extractor = EpubChapterExtractor(epub_data=build_epub(entries, files={"text/a.xhtml": html}))
+
+    contents = extractor.convert_toc_entries(extractor.extract_toc_structure()[0])
+
+    assert sum(1 for c in contents if "Paragraph 0" in c) == 1
+
+
+def test_extract_content_from_href_with_fragment():
+    extractor = EpubChapterExtractor(epub_data=_fragment_book())
+
+    content = extractor.extract_content_from_href("OEBPS/text/part.xhtml#s2")
+
+    assert content.startswith("## Second Section")
+    assert "Alpha" not in content
+
+
+# Documents the regex converter handles correctly, used to check the streaming converter against it
+CONVERTER_CORPUS = [
+    "<html><body>\n<h1>Title</h1>\n<p>Plain paragraph.</p>\n<p>Second paragraph.</p>\n</body></html>",
+    "<h2 class='x'>Section <em>two</em></h2>\n<p>Some <strong>strong</strong> and <em>emphasis</em> text.</p>",
+    "<p>Line one<br/>Line two<br>Line three</p>\n<h3>Next</h3>\n<p>After &amp; before &lt;tag&gt; &#8220;quoted&#8221;</p>",
+    "<div>\n<p>Intro.</p>\n<blockquote><p>Quoted line.</p></blockquote>\n<p>Outro.</p>\n</div>",
+    "<body>\n<script>var x = '<p>no</p>';</script>\n<style>p { color: red; }</style>\n<h4>Kept</h4>\n<p>Text</p>\n</body>",
+    "<h5>Deep</h5>\n<h6>Deeper</h6>\n<p>Multi\nline\nparagraph with <span class='c'>span</span>.</p>",
+]
+
+
+@pytest.mark.parametrize("document", CONVERTER_CORPUS)
+def test_streaming_converter_matches_regex_converter(document):
+    basic = EpubChapterExtractor(epub_data=b"", html_converter="basic")._html_to_markdown(document)
+    streaming = html_to_markdown(document)
+
+    assert streaming.split() == basic.split()
+
+
+def test_streaming_converter_structure():
+    markdown = html_to_markdown(
+        "<html><head><title>Head title</title></head><body><h2>Heading</h2><p>One <b>bold</b>.</p>"
+        "<blockquote><p>First</p><p>Second</p></blockquote><p>End</p></body></html>"
+    )
+
+    assert markdown == "## Heading\nOne **bold**.\n\n> First\n> Second\n\nEnd"
+
+
+def test_streaming_converter_ignores_tags_the_regexes_confused():
+    # The regex converter reads <body> and <br> as bold openers and <img> as italic
+    markdown = html_to_markdown("<body><p>Text<br/>more <img src='a.png'/> here</p><b>bold</b></body>")
+
+    assert markdown == "Text\nmore  here\n\n**bold**"
+
+
+def test_unknown_converter_rejected():
+    with pytest.raises(ValueError):
+        EpubChapterExtractor(epub_data=b"", html_converter="lxml")
+
+
+def test_parallel_conversion_matches_serial(monkeypatch):
+    book = build_book(6)
+    monkeypatch.setattr(EpubChapterExtractor, "PARALLEL_MIN_FILES", 2)
+    monkeypatch.setattr(EpubChapterExtractor, "PARALLEL_MIN_BYTES", 0)
+
+    serial = EpubChapterExtractor(epub_data=book)
+    parallel = EpubChapterExtractor(epub_data=book, workers=2)
+    toc = serial.extract_toc_structure()[0]
+
+    assert parallel.convert_toc_entries(toc) == serial.convert_toc_entries(toc)
+
+
+def test_small_books_stay_serial(monkeypatch):
+    extractor = EpubChapterExtractor(epub_data=build_book(3), workers=4)
+    monkeypatch.setattr("epub_processor.epub_extractor.ProcessPoolExecutor", None)
+
+    contents = extractor.convert_toc_entries(extractor.extract_toc_structure()[0])
+
+    assert all("Paragraph 0" in c for c in contents)
+
+
+def test_extraction_cache_memory_tier_is_lru():
+    cache = ExtractionCache(max_entries=2)
+    for key in ("a", "b"):
+        cache.put(key, [{"title": key}])
+    cache.get("a")
+    cache.put("c", [{"title": "c"}])
+
+    assert cache.get("b") is None
+    assert cache.get("a") == [{"title": "a"}]
+    assert cache.stats == {'memory_hits': 2, 'disk_hits': 0, 'misses': 1}
+
+
+def test_extraction_cache_disk_tier_shared_and_bounded(tmp_path):
+    writer = ExtractionCache(max_entries=0, cache_dir=str(tmp_path), max_disk_bytes=10 ** 9)
+    key = ExtractionCache.make_key(ExtractionCache.content_hash(b"epub bytes"), 500)
+    writer.put(key, [{"title": "Chapter 1", "content": "text"}])
+
+    reader = ExtractionCache(cache_dir=str(tmp_path))
+    assert reader.get(key) == [{"title": "Chapter 1", "content": "text"}]
+    assert reader.stats['disk_hits'] == 1
+    assert key != ExtractionCache.make_key(ExtractionCache.content_hash(b"epub bytes"), 1000)
+
+    small = ExtractionCache(max_entries=0, cache_dir=str(tmp_path), max_disk_bytes=1)
+    small.put("other", [{"title": "x" * 1000}])
+    assert len(list(tmp_path.glob("*.json.gz"))) <= 1
+
+
+def test_extraction_cache_failed_write_leaves_no_temp_file(tmp_path):
+    cache = ExtractionCache(max_entries=0, cache_dir=str(tmp_path))
+
+    # Serialization errors are reported, not raised to the upload that is being cached
+    cache.put("key", [{"title": "Chapter 1", "content": object()}])
+
+    assert list(tmp_path.iterdir()) == []
+    assert cache.get("key") is None
+
+
+def test_extract_from_seekable_file(sample_book, tmp_path):
+    with open(tmp_path / "book.epub", "wb") as f:
+        f.write(sample_book)
+    with open(tmp_path / "book.epub", "rb") as f:
+        chapters = EpubChapterExtractor(epub_file=f, min_content_length=100).extract_chapters_to_memory()
+        assert not f.closed
+
+    assert len(chapters) == 5
+
+
+def test_list_chapters_converts_nothing(sample_book, monkeypatch):
+    extractor = EpubChapterExtractor(epub_data=sample_book, min_content_length=100)
+    monkeypatch.setattr(extractor, "_convert_file_sections",
+                        lambda *args: pytest.fail("list_chapters converted HTML"))
+
+    listed = extractor.list_chapters()
+
+    assert listed and all(chapter['content'] is None for chapter in listed)
+    assert all(chapter['length'] > 0 for chapter in listed)
+
+
+def test_convert_chapters_matches_eager_extraction(sample_book):
+    eager = EpubChapterExtractor(epub_data=sample_book, min_content_length=100).extract_chapters_to_memory()
+    lazy = EpubChapterExtractor(epub_data=sample_book, min_content_length=100)
+    listed = lazy.list_chapters()
+
+    converted = lazy.convert_chapters([chapter['toc_index'] for chapter in listed])
+
+    assert [c['canonical_name'] for c in listed] == [c['canonical_name'] for c in eager]
+    assert [converted[c['toc_index']] for c in listed] == [c['content'] for c in eager]
+
+
+def test_list_chapters_keeps_long_sections_of_shared_files():
+    # One long section followed by short anchored siblings in the same file
+    main = "<p>" + " ".join(f"Main section sentence {i} goes on." for i in range(110)) + "</p>"
+    siblings = "".join(f'<h2 id="s{i}">Note {i}</h2><p>Short note {i}.</p>' for i in range(1, 12))
+    body = f'<html><body><h1>Main</h1>{main}{siblings}</body></html>'
+    entries = [{"title": "Chapter 1: Main", "src": "text/part.xhtml"}] + [
+        {"title": f"Chapter {i + 1}: Note {i}", "src": f"text/part.xhtml#s{i}"} for i in range(1, 12)
+    ]
+    book = build_epub(entries, files={"text/part.xhtml": body})
+
+    eager = EpubChapterExtractor(epub_data=book).extract_chapters_to_memory()
+    lazy = EpubChapterExtractor(epub_data=book)
+    listed = lazy.list_chapters()
+
+    assert [c['title'] for c in eager] == ['Chapter 1: Main']
+    assert [c['title'] for c in listed] == [c['title'] for c in eager]
+    assert listed[0]['length'] >= len(eager[0]['content'])
+    assert lazy.convert_chapters([listed[0]['toc_index']])[listed[0]['toc_index']] == eager[0]['content']
+
+
+def test_lazy_chapters_shorter_than_the_minimum_are_dropped_on_conversion():
+    long_text = "<p>" + " ".join(f"Sentence {i} of a long chapter." for i in range(60)) + "</p>"
+    padded = '<p class="' + "x" * 800 + '">Only a few words.</p>'
+    files = {f"text/ch{i}.xhtml": f"<html><body><h1>Chapter {i}</h1>{body}</body></html>"
+             for i, body in ((1, long_text), (2, padded), (3, long_text))}
+    book = build_epub([{"title": f"Chapter {i}", "src": f"text/ch{i}.xhtml"} for i in (1, 2, 3)], files=files)
+
+    eager = EpubChapterExtractor(epub_data=book, min_content_length=300).extract_chapters_to_memory()
+    lazy = EpubChapterExtractor(epub_data=book, min_content_length=300)
+    listed = lazy.list_chapters()
+    converted = lazy.convert_chapters([chapter['toc_index'] for chapter in listed])
+
+    # The padded chapter's size passes the listing bound, but its text doesn't pass the filter
+    assert [c['title'] for c in listed] == ["Chapter 1", "Chapter 2", "Chapter 3"]
+    kept = [c for c in listed if converted[c['toc_index']] is not None]
+    assert [c['canonical_name'] for c in kept] == [c['canonical_name'] for c in eager]
+    assert [converted[c['toc_index']] for c in kept] == [c['content'] for c in eager]
+
+
+def test_prefilter_skips_ineligible_files_before_conversion(monkeypatch):
+    padded = ('<html><body><p class="' + "x" * 800 + '">Only a few words.</p></body></html>')
+    files = {
+        "text/cover.xhtml": '<html><body><img src="cover.jpg"/></body></html>',
+        "text/copyright.xhtml": chapter_html("Copyright"),
+        "text/padded.xhtml": padded,
+        "text/short.xhtml": "<html><body><p>Tiny</p></body></html>",
+        "text/ch1.xhtml": chapter_html("Chapter 1"),
+        "text/ch2.xhtml": chapter_html("Chapter 2"),
+    }
+    entries = [
+        {"title": "Cover", "src": "text/cover.xhtml"},
+        {"title": "Copyright", "src": "text/copyright.xhtml"},
+        {"title": "Chapter 0: Note", "src": "text/padded.xhtml"},
+        {"title": "Chapter 0: Short", "src": "text/short.xhtml"},
+        {"title": "Chapter 1", "src": "text/ch1.xhtml"},
+        {"title": "Chapter 2", "src": "text/ch2.xhtml"},
+    ]
+    extractor = EpubChapterExtractor(epub_data=build_epub(entries, files=files), min_content_length=500)
+    converted = []
+    original = extractor._convert_file_sections
+    monkeypatch.setattr(extractor, "_convert_file_sections",
+                        lambda html, fragments: converted.append(html) or original(html, fragments))
+
+    chapters = extractor.extract_chapters_to_memory()
+
+    assert [c['title'] for c in chapters] == ["Chapter 1", "Chapter 2"]
+    assert len(converted) == 2
+    assert extractor.prefilter_stats == {'converted_files': 2, 'skipped_by_type': 2,
+                                         'skipped_by_size': 1, 'skipped_by_estimate': 1}
+    assert extractor.conversions_avoided == 4
+
+
+def test_batch_conversion_resumes_from_manifest(tmp_path, monkeypatch):
+    from epub_processor import batch_converter
+
+    library = tmp_path / "library"
+    library.mkdir()
+    (library / "first.epub").write_bytes(build_book(2))
+    (library / "second.epub").write_bytes(build_book(3))
+    (library / "broken.epub").write_bytes(b"not a zip file")
+    output = tmp_path / "out"
+
+    books = batch_converter.convert_library([str(library)], str(output), min_content_length=100)
+    first, second, broken = (os.path.realpath(library / name) for name in ("first.epub", "second.epub", "broken.epub"))
+
+    assert books[first]["status"] == "done" and books[first]["chapters"] == 2
+    assert books[second]["chapters"] == 3
+    assert books[broken]["status"] == "failed"
+    assert books[first]["sha256"] == batch_converter.file_sha256(str(library / "first.epub"))
+    assert (output / "second" / "00_processing_summary.md").exists()
+
+    # Simulate an interrupted run: one finished book is missing from the manifest
+    manifest = json.loads((output / "manifest.json").read_text())
+    del manifest["books"][second]
+    (output / "manifest.json").write_text(json.dumps(manifest))
+
+    converted = []
+    original = batch_converter.convert_book
+    monkeypatch.setattr(batch_converter, "convert_book", lambda job: converted.append(job[0]) or original(job))
+    batch_converter.convert_library([str(library)], str(output), min_content_length=100)
+    assert converted == [second]
+
+    # Changed settings or --retry-failed convert books again
+    converted.clear()
+    batch_converter.convert_library([str(library)], str(output), min_content_length=100, retry_failed=True)
+    assert converted == [broken]
+    converted.clear()
+    batch_converter.convert_library([str(library / "first.epub")], str(output), min_content_length=200)
+    assert converted == [first]
+
+
+def test_batch_conversion_keeps_books_with_the_same_file_name_apart(tmp_path):
+    from epub_processor import batch_converter
+
+    for directory, chapters in (("a", 2), ("b", 3)):
+        (tmp_path / directory).mkdir()
+        (tmp_path / directory / "book.epub").write_bytes(build_book(chapters))
+    inputs = [str(tmp_path / "a" / "book.epub"), str(tmp_path / "b" / "book.epub")]
+    output = tmp_path / "out"
+
+    books = batch_converter.convert_library(inputs, str(output), min_content_length=100)
+
+    first, second = (books[os.path.realpath(path)] for path in inputs)
+    assert (first["chapters"], second["chapters"]) == (2, 3)
+    assert first["output_dir"] != second["output_dir"]
+    # Each directory holds its own book's chapters and summary
+    assert (len(os.listdir(first["output_dir"])), len(os.listdir(second["output_dir"]))) == (3, 4)
+
+    # Both books are found in the manifest by the next run, in the same directories
+    assert batch_converter.convert_library(inputs, str(output), min_content_length=100) == books
+
+
+def test_batch_cli_exit_code_only_counts_this_runs_books(tmp_path):
+    from epub_processor import batch_converter
+
+    (tmp_path / "broken.epub").write_bytes(b"not a zip file")
+    (tmp_path / "good.epub").write_bytes(build_book(2))
+    output = str(tmp_path / "out")
+
+    assert batch_converter.main([str(tmp_path / "broken.epub"), "--output-dir", output, "--workers", "1"]) == 1
+    # The broken book of the earlier run stays in the manifest but isn't part of this run
+    assert batch_converter.main([str(tmp_path / "good.epub"), "--output-dir", output, "--workers", "1",
+                                 "--min-length", "100"]) == 0
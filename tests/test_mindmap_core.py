@@ -0,0 +1,800 @@
+"""
+Tests for the mindmap_core text processing modules
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import openai
+from openai.types.chat import ChatCompletion
+
+from mindmap_core import extractor as extractor_module
+from mindmap_core import prompt_budget as prompt_budget_module
+from mindmap_core import synthesizer as synthesizer_module
+from mindmap_core import token_counter
+from mindmap_core.analysis_cache import ChunkAnalysisCache
+from mindmap_core.batch import BatchAnalysisJob
+from mindmap_core.client_pool import evict_idle_clients, get_openai_client
+from mindmap_core.chunker import BoundaryIndex, Chunk, SmartTextChunker
+from mindmap_core.extractor import KnowledgeExtractor
+from mindmap_core.mindmap_generator import MindMapGenerator
+from mindmap_core.prompt_budget import TEXT_SLOT, PromptBudget
+from mindmap_core.rate_limiter import KeyRateLimiter, RateLimitedClient, parse_duration, rate_limited_client
+from mindmap_core.response_cache import CachedClient, ResponseCache
+from mindmap_core.token_counter import CharacterTokenCounter, TiktokenCounter, get_token_counter
+
+
+class WordEncoding:
+    """Stand-in tiktoken encoding: one token per whitespace-separated word"""
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode_ordinary_batch(self, texts):
+        self.encoded.extend(texts)
+        return [text.split() for text in texts]
+
+
+def test_truncated_and_unparseable_responses_are_asked_again(tmp_path):
+    request = {'model': "gpt-5-mini", 'messages': [{"role": "user", "content": "Summarise"}], 'temperature': 0.3}
+    truncated = CompletionFactory(finish_reason='length')
+    client = CachedClient(SimpleNamespace(chat=SimpleNamespace(completions=truncated)),
+                          ResponseCache(str(tmp_path / "truncated.sqlite")))
+    client.chat.completions.create(**request)
+    assert client.chat.completions.create(**request).choices[0].message.content == "answer 2"
+
+    # "answer N" isn't JSON: the failed analysis drops the response, so a retry asks the model again
+    completions = CompletionFactory()
+    extractor = KnowledgeExtractor(api_key="test-key", model="gpt-5-mini")
+    extractor.client = CachedClient(SimpleNamespace(chat=SimpleNamespace(completions=completions)),
+                                    ResponseCache(str(tmp_path / "unparseable.sqlite")))
+    chunk = extractor.chunker.chunk_by_sections(_book_text(parts=1, sentences=10), "Book")[0]
+    for _ in range(2):
+        assert 'error' in extractor._run_question_set(chunk, "Book", extractor.QUESTION_SETS[0])
+    assert completions.calls == 2
+    assert extractor.client.cache.stats['hits'] == 0
+
+
+def _book_text(parts=6, sentences=80):
+    return "\n\n".join(
+        f"## Part {i}\n\n" + " ".join(f"Sentence {j} of part {i} says something." for j in range(sentences))
+        for i in range(parts)
+    )
+
+
+def test_tiktoken_counter_encodes_each_text_once():
+    encoding = WordEncoding()
+    counter = TiktokenCounter(encoding)
+
+    assert counter.count_batch(["a b", "a b", "c"]) == [2, 2, 1]
+    assert counter.count("a b") == 2
+    assert encoding.encoded == ["a b", "c"]
+    assert counter.stats == {'encoded_texts': 2, 'memo_hits': 2}
+
+
+def test_chunks_respect_exact_token_limit():
+    encoding = WordEncoding()
+    chunker = SmartTextChunker(max_tokens=300, overlap_tokens=40, token_counter=TiktokenCounter(encoding))
+
+    chunks = chunker.chunk_by_sections(_book_text(), "Book")
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk['token_estimate'] == len(chunk['content'].split())
+        assert chunk['token_estimate'] <= 300
+    # Nothing was encoded twice during the run
+    assert len(encoding.encoded) == len(set(encoding.encoded))
+
+
+def test_character_counter_is_default_without_encoding(monkeypatch):
+    def unavailable(*args):
+        raise OSError("encoding files not reachable")
+
+    token_counter.get_encoding.cache_clear()
+    monkeypatch.setattr(token_counter.tiktoken, "encoding_for_model", unavailable)
+    monkeypatch.setattr(token_counter.tiktoken, "get_encoding", unavailable)
+    try:
+        assert isinstance(get_token_counter("gpt-5-mini"), CharacterTokenCounter)
+    finally:
+        token_counter.get_encoding.cache_clear()
+
+    assert isinstance(get_token_counter("gpt-5-mini", kind="characters"), CharacterTokenCounter)
+    assert CharacterTokenCounter().count("abcde") == 1.25
+
+
+def test_oversize_sentence_after_short_ones_is_split_by_words():
+    chunker = SmartTextChunker(max_tokens=50, overlap_tokens=10, token_counter=TiktokenCounter(WordEncoding()))
+    text = "Short one. Short two. " + " ".join(f"word{i}" for i in range(180))
+
+    chunks = chunker._split_large_section(text, 0, len(text), "Section")
+
+    assert [tokens for _, _, tokens in chunks] == [4, 50, 50, 50, 30]
+    assert " ".join(text[start:end] for start, end, _ in chunks) == text
+
+
+def test_chunks_are_offsets_into_one_shared_string():
+    chunker = SmartTextChunker(max_tokens=300, overlap_tokens=40, token_counter=TiktokenCounter(WordEncoding()))
+
+    chunks = chunker.chunk_by_sections(_book_text(parts=12, sentences=15), "Book")
+
+    source = chunks[0].source
+    assert all(isinstance(chunk, Chunk) and chunk.source is source for chunk in chunks)
+    for previous, chunk in zip(chunks, chunks[1:]):
+        # The overlap repeats the end of the previous chunk
+        assert chunk.overlap_start <= chunk.start
+        assert previous.content.endswith(source[chunk.overlap_start:previous.end])
+        assert chunk.content == chunk['content'] == source[chunk.overlap_start:chunk.end]
+    assert all(chunk.overlap_start < chunk.start for chunk in chunks[1:])
+    assert chunks[0].text(20) == chunks[0].content[:20]
+    assert 'content' not in chunks[0].to_dict()
+
+
+def test_balanced_packing_needs_no_more_chunks_than_greedy():
+    text = "\n\n".join(
+        f"## Part {i}\n\n" + " ".join(f"Sentence {j} of part {i} says something." for j in range(3 + (i * 7) % 11))
+        for i in range(40)
+    )
+    chunks = {}
+    for packing in ("greedy", "balanced"):
+        chunker = SmartTextChunker(max_tokens=300, overlap_tokens=40, packing=packing,
+                                   token_counter=TiktokenCounter(WordEncoding()))
+        chunks[packing] = chunker.chunk_by_sections(text, "Book")
+        for chunk in chunks[packing]:
+            assert chunk.token_estimate == len(chunk.content.split()) <= 300
+
+    greedy, balanced = chunks["greedy"], chunks["balanced"]
+    assert len(balanced) <= len(greedy)
+    # Balancing evens out the sizes instead of leaving a small last chunk
+    sizes = [chunk.token_estimate for chunk in balanced]
+    assert max(sizes) - min(sizes) <= max(c.token_estimate for c in greedy) - min(c.token_estimate for c in greedy)
+    # Every section still appears, in order
+    assert [c.start for c in balanced] == sorted(c.start for c in balanced)
+    assert balanced[-1].section_info == "Final section"
+
+
+def test_header_sections_cover_the_text_exactly_once():
+    text = ("Opening words before any heading.\n\n# Chapter\n\nChapter intro.\n\n## First\n\nFirst body.\n\n"
+            "### Detail\n\nDetail body.\n\n## Second\n\nSecond body.\n")
+    chunker = SmartTextChunker(max_tokens=300, overlap_tokens=0, token_counter=CharacterTokenCounter())
+
+    sections = chunker._identify_sections(text)
+
+    assert sum(len(section['content']) for section in sections) == len(text)
+    assert "".join(section['content'] for section in sections) == text
+    assert [section['title'] for section in sections] == ["Introduction", "Chapter", "First", "Detail", "Second"]
+    assert [section['path'] for section in sections][2:] == [
+        "Chapter > First", "Chapter > First > Detail", "Chapter > Second"]
+    assert text.count("First body.") == sum(s['content'].count("First body.") for s in sections) == 1
+
+
+def test_paragraph_sections_cover_the_text_exactly_once():
+    text = "\n\n".join(f"Paragraph {i} " + "words " * (i * 37 % 120) for i in range(60)) + "\n\n\n"
+    sections = SmartTextChunker(token_counter=CharacterTokenCounter())._identify_sections(text)
+
+    assert len(sections) > 1
+    assert sum(len(section['content']) for section in sections) == len(text)
+    assert all(section['content'] == text[section['start']:section['end']] for section in sections)
+
+
+def test_boundary_index_matches_a_regex_split_of_any_range():
+    text = _book_text(parts=3, sentences=20) + "  Trailing words! And more?\n\nLast paragraph."
+    index = BoundaryIndex(text)
+
+    for start, end in [(0, len(text)), (17, 400), (205, 206), (300, len(text) - 5)]:
+        spans = index.sentences(start, end)
+        pieces = re.split(r'(?<=[.!?])\s+', text[start:end])
+        assert [text[a:b] for a, b in spans] == pieces
+    assert [text[a:b] for a, b in index.paragraph_breaks()] == re.findall(r'\n[ \t]*\n\s*', text)
+
+
+def test_content_defined_chunks_survive_an_edit_near_the_start():
+    paragraphs = [" ".join(f"Idea {i}.{j} holds." for j in range(3 + i * 7 % 40)) for i in range(400)]
+    added = " ".join(f"Revised sentence {j}." for j in range(60))
+    edited = paragraphs[:1] + [added] * 3 + paragraphs[1:]
+
+    def hashes(packing, parts):
+        chunker = SmartTextChunker(max_tokens=800, overlap_tokens=40, packing=packing,
+                                   token_counter=TiktokenCounter(WordEncoding()))
+        chunks = chunker.chunk_by_sections("\n\n".join(parts), "Book")
+        assert all(chunk.token_estimate <= 800 for chunk in chunks)
+        return [chunk.content_hash for chunk in chunks]
+
+    before, after = hashes("content_defined", paragraphs), hashes("content_defined", edited)
+    assert len(set(before) & set(after)) >= len(before) - 2
+    greedy_before, greedy_after = hashes("greedy", paragraphs), hashes("greedy", edited)
+    assert len(set(greedy_before) & set(greedy_after)) < len(greedy_before) // 2
+
+
+class StubCompletions:
+    """Stand-in for client.chat.completions returning the same JSON answer"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+        self.active = self.peak = 0
+        self.lock = threading.Lock()
+
+    def create(self, **kwargs):
+        with self.lock:
+            self.calls += 1
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+        message = SimpleNamespace(content='{"question_1": ["point"], "question_2": [], "question_3": []}')
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def test_chunk_analyses_are_reused_by_content_hash(monkeypatch):
+    monkeypatch.setattr(extractor_module, "get_analysis_cache", lambda *args: ChunkAnalysisCache(max_entries=64))
+    extractor = KnowledgeExtractor(api_key="test-key", model="gpt-5-mini")
+    extractor.chunker = SmartTextChunker(max_tokens=300, overlap_tokens=40,
+                                         token_counter=TiktokenCounter(WordEncoding()))
+    completions = StubCompletions()
+    extractor.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+    chunks = extractor.chunker.chunk_by_sections(_book_text(parts=4, sentences=30), "Book")
+    for chunk in chunks:
+        extractor.analysis_cache.put(ChunkAnalysisCache.make_key(extractor.model, chunk.content_hash),
+                                     {'key_concepts': ['cached']})
+    first = extractor._analyze_chunk(chunks[0], "Book")
+    assert completions.calls == 4 and not extractor._has_failed_sets(first)
+
+    monkeypatch.setattr(extractor.capture_framework, "apply_capture_analysis", lambda text, title: {})
+    monkeypatch.setattr(synthesizer_module.InsightSynthesizer, "synthesize_insights", lambda self, a, t: {})
+    result = extractor.extract_insights(_book_text(parts=4, sentences=30), "Book")
+
+    assert completions.calls == 4  # Every chunk analysis came from the cache
+    assert result['metadata']['reused_chunk_analyses'] == len(chunks)
+    assert all(entry['analysis'] == {'key_concepts': ['cached']} for entry in result['chunk_analyses'])
+
+
+def test_analysis_disk_cache_is_bounded_and_survives_failed_writes(tmp_path):
+    cache = ChunkAnalysisCache(max_entries=0, cache_dir=str(tmp_path), max_disk_bytes=250)
+
+    cache.put("unserializable", {'point': object()})
+    assert list(tmp_path.iterdir()) == []
+
+    for key in ("a", "b", "c"):
+        cache.put(key, {'point': "x" * 100})
+        time.sleep(0.01)  # Distinct mtimes order the entries
+    assert cache.get("a") is None
+    assert cache.get("c") == {'point': "x" * 100}
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["b.json", "c.json"]
+
+def test_iter_chunks_yields_the_same_chunks_as_chunk_by_sections():
+    chunker = SmartTextChunker(max_tokens=300, overlap_tokens=40, token_counter=TiktokenCounter(WordEncoding()))
+    text = _book_text(parts=12, sentences=15)
+
+    stream = chunker.iter_chunks(text, "Book")
+    first = next(stream)
+
+    assert [first, *stream] == chunker.chunk_by_sections(text, "Book")
+
+
+def test_chunk_stream_closes_early_while_the_queue_is_full(monkeypatch):
+    extractor = KnowledgeExtractor(api_key="test-key", model="gpt-5-mini")
+    monkeypatch.setattr(extractor.config, "CHUNK_QUEUE_SIZE", 1)
+    chunks = SmartTextChunker(max_tokens=300, overlap_tokens=40, token_counter=TiktokenCounter(WordEncoding())
+                              ).chunk_by_sections(_book_text(parts=2, sentences=30), "Book")
+
+    def two_chunks(text, title):
+        yield from chunks[:2]
+
+    def failing_chunker(text, title):
+        yield from chunks[:2]
+        raise ValueError("chunking failed")
+
+    for iter_chunks in (two_chunks, failing_chunker):
+        monkeypatch.setattr(extractor.chunker, "iter_chunks", iter_chunks)
+        stream = extractor._stream_chunks("text", "Book")
+        assert next(stream) is chunks[0]
+        # Let the producer fill the queue and reach the end of the chunks (or the error)
+        time.sleep(0.3)
+        closer = threading.Thread(target=stream.close, daemon=True)
+        closer.start()
+        closer.join(timeout=5)
+        assert not closer.is_alive()
+
+
+def test_chunk_analysis_starts_while_capture_is_running(monkeypatch):
+    monkeypatch.setattr(extractor_module, "get_analysis_cache", lambda *args: ChunkAnalysisCache(max_entries=0))
+    extractor = KnowledgeExtractor(api_key="test-key", model="gpt-5-mini")
+    extractor.chunker = SmartTextChunker(max_tokens=300, overlap_tokens=40,
+                                         token_counter=TiktokenCounter(WordEncoding()))
+    completions = StubCompletions()
+    extractor.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    first_chunk_analysed = threading.Event()
+    original_run = extractor._run_question_set
+
+    def run_question_set(chunk, title, question_set):
+        first_chunk_analysed.set()
+        return original_run(chunk, title, question_set)
+
+    def capture(text, title):
+        # Only finishes once chunk analysis has started alongside it
+        assert first_chunk_analysed.wait(timeout=5)
+        return {'capture': 'done'}
+
+    monkeypatch.setattr(extractor, "_run_question_set", run_question_set)
+    monkeypatch.setattr(extractor.capture_framework, "apply_capture_analysis", capture)
+    monkeypatch.setattr(synthesizer_module.InsightSynthesizer, "synthesize_insights", lambda self, a, t: {})
+    result = extractor.extract_insights(_book_text(parts=4, sentences=30), "Book")
+
+    assert result['capture_analysis'] == {'capture': 'done'}
+    assert completions.calls == 4 * result['metadata']['total_chunks']
+    assert [entry['chunk_info']['chunk_number'] for entry in result['chunk_analyses']] == list(
+        range(1, result['metadata']['total_chunks'] + 1))
+
+
+def test_question_sets_of_all_chunks_run_concurrently_within_the_key_limit(monkeypatch):
+    monkeypatch.setattr(extractor_module, "get_analysis_cache", lambda *args: ChunkAnalysisCache(max_entries=0))
+    extractor = KnowledgeExtractor(api_key="concurrency-test-key", model="gpt-5-mini", max_concurrency=6)
+    extractor.chunker = SmartTextChunker(max_tokens=300, overlap_tokens=40,
+                                         token_counter=TiktokenCounter(WordEncoding()))
+    completions = StubCompletions(delay=0.05)
+    extractor.client = rate_limited_client(SimpleNamespace(chat=SimpleNamespace(completions=completions)),
+                                           "concurrency-test-key", extractor.config, extractor.max_concurrency)
+    monkeypatch.setattr(extractor.capture_framework, "apply_capture_analysis", lambda text, title: {})
+    monkeypatch.setattr(synthesizer_module.InsightSynthesizer, "synthesize_insights", lambda self, a, t: {})
+
+    result = extractor.extract_insights(_book_text(parts=6, sentences=30), "Book")
+
+    chunk_count = result['metadata']['total_chunks']
+    assert chunk_count > 2 and completions.calls == 4 * chunk_count
+    assert 4 < completions.peak <= 6  # Question sets of several chunks overlapped, never above the limit
+    assert [entry['chunk_info']['chunk_number'] for entry in result['chunk_analyses']] == list(
+        range(1, chunk_count + 1))
+    assert all(list(entry['analysis']['raw_analysis_sets']) == [qs['name'] for qs in KnowledgeExtractor.QUESTION_SETS]
+               for entry in result['chunk_analyses'])
+
+
+class StructuredCompletions:
+    """Stand-in for client.chat.completions answering both analysis modes"""
+
+    def __init__(self, support_schema=True):
+        self.support_schema = support_schema
+        self.requests = []
+
+    def create(self, **kwargs):
+        self.requests.append(kwargs)
+        answers = {f"question_{n}": [f"point {n}"] for n in range(1, 5)}
+        if 'response_format' in kwargs:
+            if not self.support_schema:
+                raise ValueError("response_format is not supported by this model")
+            answers = {qs['name']: answers for qs in KnowledgeExtractor.QUESTION_SETS}
+        message = SimpleNamespace(content=json.dumps(answers))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def test_structured_mode_asks_every_question_set_in_one_request():
+    chunker = SmartTextChunker(max_tokens=300, overlap_tokens=40, token_counter=TiktokenCounter(WordEncoding()))
+    chunk = chunker.chunk_by_sections(_book_text(parts=2, sentences=20), "Book")[0]
+    analyses = {}
+    for mode in ("question_sets", "structured"):
+        extractor = KnowledgeExtractor(api_key="test-key", model="gpt-5-mini", analysis_mode=mode)
+        completions = StructuredCompletions()
+        extractor.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        analyses[mode] = extractor._analyze_chunk(chunk, "Book")
+        assert len(completions.requests) == (1 if mode == "structured" else 4)
+
+    structured = analyses["structured"]
+    assert structured.pop('processing_approach') == 'structured_single_call'
+    analyses["question_sets"].pop('processing_approach')
+    assert structured == analyses["question_sets"]
+    assert completions.requests[0]['response_format']['json_schema']['schema'] == KnowledgeExtractor.ANALYSIS_SCHEMA
+    # The chunk text is sent once instead of once per question set
+    assert completions.requests[0]['messages'][0]['content'].count(chunk.text(200)) == 1
+
+
+def test_structured_mode_falls_back_to_question_sets(monkeypatch):
+    extractor = KnowledgeExtractor(api_key="test-key", model="gpt-5-mini", analysis_mode="structured")
+    completions = StructuredCompletions(support_schema=False)
+    extractor.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    chunker = SmartTextChunker(max_tokens=300, overlap_tokens=40, token_counter=TiktokenCounter(WordEncoding()))
+    chunk = chunker.chunk_by_sections(_book_text(parts=2, sentences=20), "Book")[0]
+
+    analysis = extractor._analyze_chunk(chunk, "Book")
+
+    assert len(completions.requests) == 5
+    assert analysis['processing_approach'] == 'focused_question_sets'
+    assert not extractor._has_failed_sets(analysis)
+
+    monkeypatch.setattr(extractor_module.Config, "CHUNK_ANALYSIS_MODES", "gpt-4.1=structured, o3-mini=question_sets")
+    assert KnowledgeExtractor._analysis_mode_for("gpt-4.1", {}) == "structured"
+    assert KnowledgeExtractor._analysis_mode_for("gpt-4.1", {'analysis_mode': 'question_sets'}) == "question_sets"
+    assert KnowledgeExtractor._analysis_mode_for("gpt-5o", {}) == extractor_module.Config.CHUNK_ANALYSIS_MODE
+
+
+def test_prompt_budget_shortens_text_only_beyond_the_context(caplog):
+    config = SimpleNamespace(PROMPT_OUTPUT_TOKENS=200, DEFAULT_CONTEXT_TOKENS=128000)
+    budget = PromptBudget("gpt-5-mini", {'max_tokens': 1000}, config, TiktokenCounter(WordEncoding()))
+    template = f"Text: {TEXT_SLOT} Answer."
+    assert budget.input_tokens(template) == 798
+
+    text = " ".join(f"word{i}" for i in range(700))
+    assert budget.fill(template, text, "Test") == f"Text: {text} Answer."
+    assert not caplog.records
+
+    text = " ".join(f"word{i}" for i in range(2000))
+    prompt = budget.fill(template, text, "Test")
+    assert len(prompt.split()) <= 800
+    assert text.startswith(prompt[len("Text: "):-len(" Answer.")])
+    assert budget.stats == {'filled_prompts': 2, 'shortened_texts': 1}
+    assert "exceeds the prompt budget" in caplog.records[0].getMessage()
+
+
+def test_later_stages_send_at_most_their_own_input_budget(monkeypatch, caplog):
+    monkeypatch.setattr(prompt_budget_module, "get_token_counter", lambda *args: TiktokenCounter(WordEncoding()))
+    monkeypatch.setattr(extractor_module.Config, "MINDMAP_INPUT_TOKENS", 300)
+    generator = MindMapGenerator(None, "gpt-5-mini")
+    synthesis = {'main_themes': [" ".join(f"theme{i}-{j}" for j in range(200)) for i in range(6)]}
+
+    prompt = generator._build_mindmap_prompt(synthesis, "Book")
+
+    scaffold = generator._build_mindmap_prompt({}, "Book")
+    assert len(prompt.split()) - len(scaffold.split()) <= 300
+    assert "Mind map: text of" in caplog.records[0].getMessage()
+    assert "main_themes" in prompt
+
+
+def test_chunks_are_sized_to_go_into_the_prompt_whole(monkeypatch):
+    monkeypatch.setattr(extractor_module.Config, "PROMPT_OUTPUT_TOKENS", 300)
+    monkeypatch.setattr(extractor_module.Config, "get_model_config",
+                        classmethod(lambda cls, model: {'max_tokens': 1500, 'chunk_size': 22000}))
+    extractor = KnowledgeExtractor(api_key="test-key", model="gpt-5-mini")
+    assert extractor.chunker.max_tokens < 1500 - 300
+
+    chunks = extractor.chunker.chunk_by_sections(_book_text(), "Book")
+    assert len(chunks) > 1
+    for chunk in chunks:
+        for question_set in extractor.QUESTION_SETS:
+            assert chunk.content in extractor._build_focused_prompt(chunk, "Book", question_set)
+        assert chunk.content in extractor._build_structured_prompt(chunk, "Book")
+    assert extractor.prompt_budget.stats['shortened_texts'] == 0
+
+
+def test_prompt_scaffolds_are_counted_once_per_question_set(monkeypatch):
+    encoding = WordEncoding()
+    monkeypatch.setattr(prompt_budget_module, "get_token_counter", lambda *args: TiktokenCounter(encoding))
+    extractor = KnowledgeExtractor(api_key="test-key", model="gpt-5-mini")
+    assert len(encoding.encoded) == len(extractor.QUESTION_SETS) + 1
+
+    encoding.encoded.clear()
+    chunks = extractor.chunker.chunk_by_sections(_book_text(parts=2, sentences=30), "Book")
+    for chunk in chunks:
+        for question_set in extractor.QUESTION_SETS:
+            extractor._build_focused_prompt(chunk, "Book", question_set)
+        extractor._build_structured_prompt(chunk, "Book")
+    # Building a prompt only counts the chunk's label and text
+    labels = {f"Book {chunk.chunk_number}" for chunk in chunks}
+    assert set(encoding.encoded) <= labels | {chunk.content for chunk in chunks}
+    assert extractor.prompt_budget.stats['shortened_texts'] == 0
+
+
+class CompletionFactory:
+    """Stand-in chat.completions answering with real ChatCompletion objects"""
+
+    def __init__(self, finish_reason='stop'):
+        self.calls = 0
+        self.finish_reason = finish_reason
+
+    def create(self, **kwargs):
+        self.calls += 1
+        return ChatCompletion.model_validate({
+            'id': f"response-{self.calls}", 'object': 'chat.completion', 'created': 0, 'model': kwargs['model'],
+            'choices': [{'index': 0, 'finish_reason': self.finish_reason,
+                         'message': {'role': 'assistant', 'content': f"answer {self.calls}"}}]
+        })
+
+
+def test_response_cache_serves_repeated_requests_across_clients(tmp_path):
+    path = str(tmp_path / "responses.sqlite")
+    completions = CompletionFactory()
+    client = CachedClient(SimpleNamespace(chat=SimpleNamespace(completions=completions)), ResponseCache(path))
+    request = {'model': "gpt-5-mini", 'messages': [{"role": "user", "content": "Summarise"}], 'temperature': 0.3}
+
+    first = client.chat.completions.create(**request)
+    again = client.chat.completions.create(**request, timeout=30)
+    other = client.chat.completions.create(**{**request, 'temperature': 0.7})
+    assert again.choices[0].message.content == first.choices[0].message.content == "answer 1"
+    assert other.choices[0].message.content == "answer 2"
+    assert client.cache.stats == {'hits': 1, 'misses': 2, 'stores': 2, 'evictions': 0}
+
+    # Another worker process opens the same file
+    worker = CachedClient(SimpleNamespace(chat=SimpleNamespace(completions=completions)), ResponseCache(path))
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(worker.chat.completions.create(**request)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert [r.choices[0].message.content for r in results] == ["answer 1"] * 4
+    assert completions.calls == 2
+
+
+def test_response_cache_evicts_expired_and_least_recently_used_responses(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"), max_bytes=250, ttl_seconds=3600)
+    for key in ("a", "b"):
+        cache.put(key, "x" * 100)
+    assert cache.get("a") is not None
+    cache.put("c", "x" * 100)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats['evictions'] == 1
+
+    cache.ttl_seconds = 0.01
+    time.sleep(0.02)
+    assert cache.get("a") is None
+
+
+class RateLimitedCompletions:
+    """Stand-in chat.completions with raw responses: fails with the given errors first, then answers"""
+
+    def __init__(self, errors=(), headers=None):
+        self.errors = list(errors)
+        self.headers = headers or {}
+        self.calls = 0
+        self.with_raw_response = self
+
+    def create(self, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        response = SimpleNamespace(usage=SimpleNamespace(total_tokens=50), content="answer")
+        return SimpleNamespace(headers=self.headers, parse=lambda: response)
+
+
+def _rate_limit_error(code="rate_limit_exceeded", headers=None):
+    response = SimpleNamespace(request=None, status_code=429, headers=headers or {})
+    return openai.RateLimitError("Rate limit reached", response=response, body={'code': code})
+
+
+def _scheduled(completions, limiter=None, slots=None):
+    config = SimpleNamespace(PROMPT_OUTPUT_TOKENS=100, LLM_MAX_RETRIES=3,
+                             LLM_BACKOFF_SECONDS=0.01, LLM_BACKOFF_MAX_SECONDS=0.05)
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return RateLimitedClient(client, limiter or KeyRateLimiter(1000, 100000), config, slots)
+
+
+def test_rate_limited_requests_are_retried_after_the_requested_delay():
+    completions = RateLimitedCompletions([_rate_limit_error(headers={'retry-after': '0.05'})] * 2)
+    client = _scheduled(completions)
+    request = {'model': "gpt-5-mini", 'messages': [{"role": "user", "content": "Summarise"}]}
+
+    start = time.perf_counter()
+    assert client.chat.completions.create(**request).content == "answer"
+    assert time.perf_counter() - start >= 0.1
+    assert completions.calls == 3
+    assert client.limiter.stats['retries'] == 2
+
+    # A quota error can't be waited out
+    completions.errors = [_rate_limit_error(code="insufficient_quota")]
+    try:
+        client.chat.completions.create(**request)
+        assert False, "insufficient_quota should not be retried"
+    except openai.RateLimitError:
+        pass
+
+
+def test_rate_limiter_follows_the_ratelimit_headers():
+    assert parse_duration("6m0s") == 360 and parse_duration("20ms") == 0.02 and parse_duration("1.5s") == 1.5
+    headers = {'x-ratelimit-limit-requests': '6000', 'x-ratelimit-remaining-requests': '0',
+               'x-ratelimit-reset-requests': '20ms', 'x-ratelimit-limit-tokens': '1000000',
+               'x-ratelimit-remaining-tokens': '999000', 'x-ratelimit-reset-tokens': '60ms'}
+    client = _scheduled(RateLimitedCompletions(headers=headers))
+    request = {'model': "gpt-5-mini", 'messages': [{"role": "user", "content": "Summarise"}]}
+
+    client.chat.completions.create(**request)
+    assert client.limiter.requests.capacity == 6000
+    assert client.limiter.tokens.capacity == 1000000
+    # The API reported no requests left, so the next one waits for the bucket to refill
+    client.chat.completions.create(**request)
+    assert client.limiter.stats['requests'] == 2
+    assert client.limiter.stats['waits'] == 1
+
+
+def test_backoff_frees_the_key_slot_and_waits_only_for_the_missing_tokens():
+    request = {'model': "gpt-5-mini", 'messages': [{"role": "user", "content": "Summarise"}]}
+
+    # Another chapter can send with the key's only slot while this request backs off
+    slots = threading.BoundedSemaphore(1)
+    completions = RateLimitedCompletions([_rate_limit_error(headers={'retry-after': '0.3'})])
+    client = _scheduled(completions, slots=slots)
+    worker = threading.Thread(target=client.chat.completions.create, kwargs=request)
+    worker.start()
+    while completions.calls == 0:
+        time.sleep(0.01)
+    time.sleep(0.05)
+    assert slots.acquire(timeout=0.1)
+    slots.release()
+    worker.join(timeout=5)
+    assert completions.calls == 2
+
+    # Without retry-after the wait covers the token deficit, not the minute until the bucket is full again
+    headers = {'x-ratelimit-limit-requests': '1000', 'x-ratelimit-remaining-requests': '999',
+               'x-ratelimit-reset-requests': '60ms', 'x-ratelimit-limit-tokens': '100000',
+               'x-ratelimit-remaining-tokens': '0', 'x-ratelimit-reset-tokens': '1m0s'}
+    completions = RateLimitedCompletions([_rate_limit_error(headers=headers)])
+    start = time.perf_counter()
+    _scheduled(completions).chat.completions.create(**request)
+    assert time.perf_counter() - start < 2
+    assert completions.calls == 2
+
+
+class BatchStandInServer:
+    """Local stand-in for the files, batches and chat completions endpoints of the OpenAI API"""
+
+    def __init__(self, failing_requests=()):
+        self.files = {}
+        self.batches = {}
+        self.failing_requests = set(failing_requests)
+        self.chat_requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, payload, raw=False):
+                body = payload if raw else json.dumps(payload).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/octet-stream' if raw else 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                if self.path == '/v1/files':
+                    self._reply(server.upload(self.headers['Content-Type'], body))
+                elif self.path == '/v1/batches':
+                    self._reply(server.create_batch(json.loads(body)))
+                elif self.path == '/v1/chat/completions':
+                    server.chat_requests += 1
+                    self._reply(server.completion(json.loads(body)))
+
+            def do_GET(self):
+                parts = self.path.strip('/').split('/')
+                if parts[1] == 'batches':
+                    self._reply(server.retrieve_batch(parts[2]))
+                elif parts[1] == 'files' and parts[-1] == 'content':
+                    self._reply(server.files[parts[2]], raw=True)
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def upload(self, content_type, body):
+        boundary = content_type.split('boundary=')[1].encode()
+        part = next(p for p in body.split(b'--' + boundary) if b'name="file"' in p)
+        file_id = f"file-{len(self.files) + 1}"
+        self.files[file_id] = part.split(b'\r\n\r\n', 1)[1].rsplit(b'\r\n', 1)[0]
+        return {'id': file_id, 'object': 'file', 'bytes': len(self.files[file_id]), 'created_at': 0,
+                'filename': 'input.jsonl', 'purpose': 'batch', 'status': 'processed'}
+
+    def completion(self, request):
+        if 'response_format' in request:
+            answer = {qs['name']: {f"question_{n}": [f"{qs['name']} point"] for n in range(1, 5)}
+                      for qs in KnowledgeExtractor.QUESTION_SETS}
+        else:
+            answer = {f"question_{n}": ["point"] for n in range(1, 5)}
+        return {'id': 'completion', 'object': 'chat.completion', 'created': 0, 'model': request['model'],
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': json.dumps(answer)}}]}
+
+    def create_batch(self, params):
+        lines = []
+        for line in self.files[params['input_file_id']].decode('utf-8').splitlines():
+            request = json.loads(line)
+            if request['custom_id'] in self.failing_requests:
+                lines.append({'custom_id': request['custom_id'], 'response': None,
+                              'error': {'code': 'server_error', 'message': 'failed'}})
+            else:
+                lines.append({'custom_id': request['custom_id'], 'error': None,
+                              'response': {'status_code': 200, 'body': self.completion(request['body'])}})
+        output_id = f"file-{len(self.files) + 1}"
+        self.files[output_id] = "".join(json.dumps(line) + "\n" for line in lines).encode('utf-8')
+        batch_id = f"batch-{len(self.batches) + 1}"
+        self.batches[batch_id] = {'id': batch_id, 'object': 'batch', 'endpoint': params['endpoint'],
+                                  'input_file_id': params['input_file_id'], 'completion_window': '24h',
+                                  'created_at': 0, 'status': 'validating', 'output_file_id': output_id,
+                                  'polls': 0, 'request_counts': {'total': len(lines), 'completed': 0, 'failed': 0}}
+        return self._batch(batch_id)
+
+    def retrieve_batch(self, batch_id):
+        batch = self.batches[batch_id]
+        batch['polls'] += 1
+        batch['status'] = 'completed' if batch['polls'] > 1 else 'in_progress'
+        return self._batch(batch_id)
+
+    def _batch(self, batch_id):
+        batch = {k: v for k, v in self.batches[batch_id].items() if k != 'polls'}
+        if batch['status'] != 'completed':
+            batch.pop('output_file_id')
+        return batch
+
+
+def test_batch_job_is_submitted_once_and_resumed_after_a_restart(monkeypatch, tmp_path):
+    server = BatchStandInServer(failing_requests={"0-0-critical_thinking"})
+    monkeypatch.setenv("OPENAI_BASE_URL", server.url)
+    monkeypatch.setattr(extractor_module, "get_analysis_cache", lambda *a: ChunkAnalysisCache(max_entries=0))
+    chapters = [("Chapter 1", _book_text(parts=3)), ("Chapter 2", _book_text(parts=2))]
+
+    def new_job():
+        extractor = KnowledgeExtractor(api_key="batch-test-key", model="gpt-5-mini")
+        extractor.chunker.max_tokens = 600
+        return BatchAnalysisJob(extractor, chapters, job_dir=str(tmp_path), poll_seconds=0.01)
+
+    job = new_job()
+    batch_id = job.submit()
+    assert job.load_state()['batch_id'] == batch_id
+    total_chunks = sum(len(chunks) for chunks in job.chunks)
+    assert job.load_state()['requests'] == total_chunks * len(KnowledgeExtractor.QUESTION_SETS)
+
+    # A restarted run waits for the same batch instead of submitting another one
+    resumed = new_job()
+    assert resumed.job_id == job.job_id
+    chapter_analyses = resumed.results()
+    assert len(server.batches) == 1
+    assert [len(entries) for entries in chapter_analyses] == [len(chunks) for chunks in job.chunks]
+    for entries in chapter_analyses:
+        for entry in entries:
+            assert entry['analysis']['processing_approach'] == 'focused_question_sets'
+            assert not KnowledgeExtractor._has_failed_sets(entry['analysis'])
+    # Only the request the batch failed was asked interactively
+    assert server.chat_requests == 1
+
+    resumed.finish()
+    assert not os.listdir(tmp_path)
+
+
+def test_batch_answers_are_not_used_for_chunks_cut_differently(monkeypatch, tmp_path):
+    server = BatchStandInServer()
+    monkeypatch.setenv("OPENAI_BASE_URL", server.url)
+    monkeypatch.setattr(extractor_module, "get_analysis_cache", lambda *a: ChunkAnalysisCache(max_entries=0))
+    chapters = [("Chapter 1", _book_text(parts=3))]
+
+    def new_job(max_tokens):
+        extractor = KnowledgeExtractor(api_key="batch-test-key", model="gpt-5-mini")
+        extractor.chunker.max_tokens = max_tokens
+        return BatchAnalysisJob(extractor, chapters, job_dir=str(tmp_path), poll_seconds=0.01)
+
+    job = new_job(600)
+    job.submit()
+
+    # Different chunking settings make a different job
+    resumed = new_job(400)
+    assert resumed.job_id != job.job_id
+    assert resumed.load_state() is None
+
+    # Even when resuming the same job file, answers to chunks cut differently are asked again
+    resumed.state_path = job.state_path
+    chapter_analyses = resumed.results()
+    assert len(server.batches) == 1
+    assert server.chat_requests == len(resumed.chunks[0]) * len(KnowledgeExtractor.QUESTION_SETS)
+    assert len(chapter_analyses[0]) == len(resumed.chunks[0])
+    assert [c.content_hash for c in resumed.chunks[0]] != [c.content_hash for c in job.chunks[0]]
+
+
+def test_openai_clients_are_pooled_per_key_and_base_url():
+    first = KnowledgeExtractor(api_key="pool-test-key", model="gpt-5-mini")
+    second = KnowledgeExtractor(api_key="pool-test-key", model="o3-mini")
+    other_key = KnowledgeExtractor(api_key="other-pool-test-key", model="gpt-5-mini")
+
+    client = get_openai_client("pool-test-key")
+    assert first.client._client is second.client._client is client
+    assert other_key.client._client is not client
+    assert get_openai_client("pool-test-key", base_url="http://127.0.0.1:9/v1") is not client
+    assert client.max_retries == 0
+
+    # Idle clients are dropped; the next job gets a fresh one
+    assert evict_idle_clients(idle_seconds=0) >= 3
+    assert get_openai_client("pool-test-key") is not client